@@ -1,9 +1,10 @@
 import json
 import logging
-import paramiko
 from PySide6.QtCore import QThread, Signal
 from openai import OpenAI
 
+from core.ssh_manager import SSHConnectionManager
+
 logger = logging.getLogger(__name__)
 
 class AIAnalyzer(QThread):
@@ -113,16 +114,13 @@ class AIAnalyzer(QThread):
                         
                         try:
                             if not ssh:
-                                ssh = paramiko.SSHClient()
-                                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                                ssh.connect(
-                                    hostname=self.cfg.get("ip"), port=self.cfg.get("port"), 
-                                    username=self.cfg.get("user"), key_filename=self.cfg.get("key_path"), 
-                                    timeout=15, banner_timeout=30
-                                )
-                            _, stdout, stderr = ssh.exec_command(cmd, timeout=15)
-                            result = stdout.read().decode() + stderr.read().decode()
-                            if not result.strip(): result = "[OK, Empty Output]"
+                                # Каналы общего transport (без нового handshake), лимит 1 команда
+                                ssh = SSHConnectionManager(self.cfg, priority="ai", max_concurrency=1)
+                            ok, result = ssh.exec_command(cmd, timeout=15)
+                            if not ok:
+                                result = f"Ошибка выполнения: {result}"
+                            elif not result.strip():
+                                result = "[OK, Empty Output]"
                         except Exception as e:
                             result = f"Ошибка выполнения: {e}"
                         
@@ -0,0 +1,119 @@
+"""
+Entropy - Remote Collector
+Один python3-скрипт на VPS собирает все метрики безопасности (и discovery)
+и возвращает их одним JSON-документом — один SSH-канал на sync tick.
+"""
+
+import json
+import shlex
+from typing import Tuple
+
+# Скрипт выполняется на VPS через `python3 -c`. Только stdlib (python3.5+),
+# чтобы не требовать установки зависимостей на сервере.
+COLLECTOR_SCRIPT = r'''
+import json, os, re, subprocess, sys
+
+def sh(cmd, timeout=10):
+    try:
+        return subprocess.run(cmd, shell=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, timeout=timeout).stdout.decode(errors="replace")
+    except Exception:
+        return ""
+
+def raw_packets():
+    try:
+        with open("/proc/net/dev") as f:
+            for line in f:
+                if ":" not in line or "lo:" in line:
+                    continue
+                return line.split(":", 1)[1].split()[1]
+    except Exception:
+        pass
+    return ""
+
+def latencies():
+    out = sh("ping -c 4 -i 0.2 8.8.8.8", timeout=15)
+    return [float(m) for m in re.findall(r"time=([0-9.]+)", out)]
+
+def ssh_probes():
+    out = sh("grep 'Failed password' /var/log/auth.log | tail -n 5")
+    probes = []
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) >= 4:
+            probes.append(parts[-4])
+    return probes
+
+def discovery():
+    data = {}
+    cpu = sh("lscpu | grep 'Model name' | cut -d ':' -f 2").strip()
+    if cpu:
+        data["cpu_model"] = cpu
+    ram = sh("free -h | grep Mem | awk '{print $2}'").strip()
+    if ram:
+        data["ram_total"] = ram
+    try:
+        with open("/etc/os-release") as f:
+            for line in f:
+                if line.startswith("PRETTY_NAME="):
+                    data["os_version"] = line.split("=", 1)[1].strip().strip('"')
+    except Exception:
+        pass
+    # Собственный процесс (и shell-обёртку) исключаем: в argv лежит текст скрипта
+    own = (str(os.getpid()), str(os.getppid()))
+    ps = "\n".join(l for l in sh("ps aux").lower().splitlines()
+                   if len(l.split()) < 2 or l.split()[1] not in own)
+    panels = []
+    if "marzban" in ps: panels.append("Marzban")
+    if "x-ui" in ps: panels.append("X-UI")
+    if "v2ray" in ps: panels.append("Xray/V2Ray")
+    if "sing-box" in ps: panels.append("Sing-box")
+    data["panels"] = panels
+    return data
+
+result = {"security": {"raw_packets": raw_packets(), "latencies": latencies(), "ssh_probes": ssh_probes()}}
+if "--discovery" in sys.argv:
+    result["discovery"] = discovery()
+print(json.dumps(result))
+'''
+
+
+def build_collector_command(discovery: bool = False) -> str:
+    """Команда для exec_command: весь скрипт передаётся inline, без загрузки по SFTP."""
+    cmd = f"python3 -c {shlex.quote(COLLECTOR_SCRIPT)}"
+    if discovery:
+        cmd += " --discovery"
+    return cmd
+
+
+def parse_collector_output(output: str) -> Tuple[dict, dict]:
+    """
+    Разбирает JSON-ответ коллектора в (discovery, security) —
+    в том же формате, что и покомандный сбор в DataLoader.
+    Бросает ValueError при невалидном ответе.
+    """
+    try:
+        payload = json.loads(output.strip().splitlines()[-1])
+    except (IndexError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid collector output: {e}") from e
+
+    if not isinstance(payload, dict) or "security" not in payload:
+        raise ValueError("Invalid collector output: no 'security' section")
+
+    raw_security = payload.get("security") or {}
+    security = {}
+    if raw_security.get("raw_packets"):
+        security['raw_packets'] = str(raw_security['raw_packets']).strip()
+    security['latencies'] = [float(l) for l in raw_security.get("latencies", [])]
+    security['ssh_probes'] = [p for p in raw_security.get("ssh_probes", []) if p]
+
+    discovery = {}
+    raw_discovery = payload.get("discovery")
+    if raw_discovery is not None:
+        for key in ("cpu_model", "ram_total", "os_version"):
+            if raw_discovery.get(key):
+                discovery[key] = raw_discovery[key]
+        panels = raw_discovery.get("panels") or []
+        discovery['detected_panels'] = ", ".join(panels) if panels else "Не определено"
+
+    return discovery, security
@@ -24,6 +24,20 @@ class ConfigManager:
             "remote_db": "/home/user/monitor.db",
             "local_db": "local_stats.db",
             "sync_interval_ms": 10000,
+            "sync_mode": "collector",
+            "db_sync_mode": "delta",
+            "telemetry_mode": "poll",
+            "stream_interval_ms": 1000,
+            "ssh_rate_per_sec": 20,
+            "ssh_burst": 10,
+            "ssh_max_in_flight": 8,
+            "dna_granularity": "hour",
+            "dna_decay": "window",
+            "dna_halflife": 250,
+            "dna_quantile_metrics": [],
+            "incident_max_rows": 5000,
+            "incident_max_age_days": 180,
+            "correlation_rules_path": "edp_rules.yaml",
             "ai_provider": "openai_compatible",
             "ai_model": "gpt-4o",
             "ai_base_url": "https://api.openai.com/v1",
@@ -4,9 +4,13 @@ Loads metrics from VPS using persistent SSH connection
 """
 
 import logging
+import sqlite3
 import time
 from PySide6.QtCore import QThread, Signal
 
+from core.collector import build_collector_command, parse_collector_output
+from core.db_sync import DeltaSyncError, sync_delta
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,11 +18,14 @@ class DataLoader(QThread):
     """Поток для загрузки данных с использованием persistent SSH соединения."""
     finished = Signal(bool, str, dict, dict)  # success, message, discovery, security
 
-    def __init__(self, ssh_manager, config_manager, skip_discovery: bool = False):
+    def __init__(self, ssh_manager, config_manager, skip_discovery: bool = False,
+                 skip_metrics: bool = False):
         super().__init__()
         self.ssh = ssh_manager
         self.cfg = config_manager
         self.skip_discovery = skip_discovery
+        # Метрики безопасности приходят из MetricsStream — грузим только БД/discovery
+        self.skip_metrics = skip_metrics
 
     def run(self):
         discovery_data = {}
@@ -30,67 +37,29 @@ class DataLoader(QThread):
                 self.finished.emit(False, "SSH connection failed", {}, {})
                 return
             
-            # --- AUTO DISCOVERY (только при первом запуске или смене сервера) ---
-            if not self.skip_discovery:
-                try:
-                    success, cpu_model = self.ssh.exec_command("lscpu | grep 'Model name' | cut -d ':' -f 2")
-                    if success:
-                        discovery_data['cpu_model'] = cpu_model.strip()
-                    
-                    success, ram_total = self.ssh.exec_command("free -h | grep Mem | awk '{print $2}'")
-                    if success:
-                        discovery_data['ram_total'] = ram_total.strip()
-                    
-                    success, os_version = self.ssh.exec_command("cat /etc/os-release | grep PRETTY_NAME | cut -d '\"' -f 2")
-                    if success:
-                        discovery_data['os_version'] = os_version.strip()
-                    
-                    panels = []
-                    success, ps_output = self.ssh.exec_command("ps aux")
-                    if success:
-                        ps_lower = ps_output.lower()
-                        if 'marzban' in ps_lower: panels.append("Marzban")
-                        if 'x-ui' in ps_lower: panels.append("X-UI")
-                        if 'v2ray' in ps_lower: panels.append("Xray/V2Ray")
-                        if 'sing-box' in ps_lower: panels.append("Sing-box")
-                    discovery_data['detected_panels'] = ", ".join(panels) if panels else "Не определено"
-                    
-                    logger.info(f"Auto-discovery complete: {discovery_data}")
-                except Exception as de:
-                    logger.warning(f"Discovery fail: {de}")
+            # Collector mode: всё одним round-trip, при ошибке — покомандный fallback
+            collected = None
+            if self.cfg.get("sync_mode") == "collector" and not self.skip_metrics:
+                collected = self._collect_with_script()
+            
+            if collected is not None:
+                discovery_data, security_data = collected
             else:
-                logger.debug("Skipping auto-discovery (cached)")
-
-            # --- SECURITY METRICS ---
-            try:
-                # 1. Packet Counters for PPS
-                cmd_pps = "cat /proc/net/dev | grep -v 'lo:' | grep ':' | head -n 1 | sed 's/.*://' | awk '{print $2}' | tr -cd '0-9'"
-                success, raw_packets = self.ssh.exec_command(cmd_pps)
-                if success:
-                    security_data['raw_packets'] = raw_packets.strip()
-                
-                # 2. Jitter (Ping to 8.8.8.8)
-                cmd_jit = "ping -c 4 -i 0.2 8.8.8.8 | grep 'time=' | awk -F'time=' '{print $2}' | awk '{print $1}'"
-                success, latencies_raw = self.ssh.exec_command(cmd_jit, timeout=15)
-                if success:
-                    latencies = latencies_raw.strip().split('\n')
-                    security_data['latencies'] = [float(l) for l in latencies if l]
-                
-                # 3. Probing (Failed SSH logins)
-                cmd_ssh = "grep 'Failed password' /var/log/auth.log | tail -n 5 | awk '{print $(NF-3)}'"
-                success, probes_raw = self.ssh.exec_command(cmd_ssh)
-                if success:
-                    probes = probes_raw.strip().split('\n')
-                    security_data['ssh_probes'] = [p for p in probes if p]
-                
-                logger.info(f"Security metrics collected: Probes={len(security_data.get('ssh_probes', []))}")
-            except Exception as se:
-                logger.warning(f"Security data collection failed: {se}")
+                if not self.skip_discovery:
+                    discovery_data = self._collect_discovery()
+                else:
+                    logger.debug("Skipping auto-discovery (cached)")
+                if not self.skip_metrics:
+                    security_data = self._collect_security()
 
             # --- DOWNLOAD DB ---
             remote_db = self.cfg.get("remote_db")
             local_db = self.cfg.get("local_db")
             
+            if self.cfg.get("db_sync_mode") == "delta" and self._sync_db_delta(remote_db, local_db):
+                self.finished.emit(True, "Данные обновлены", discovery_data, security_data)
+                return
+            
             logger.info(f"Загрузка БД: {remote_db} -> {local_db}")
             if self.ssh.download_file(remote_db, local_db):
                 self.finished.emit(True, "Данные обновлены", discovery_data, security_data)
@@ -101,3 +70,91 @@ class DataLoader(QThread):
             error_msg = f"DataLoader error: {e}"
             logger.error(error_msg)
             self.finished.emit(False, error_msg, {}, {})
+
+    def _sync_db_delta(self, remote_db: str, local_db: str) -> bool:
+        """Докачивает только новые строки. False — нужен полный download."""
+        try:
+            added = sync_delta(self.ssh, remote_db, local_db)
+            logger.info(f"БД синхронизирована дельтой: +{added} строк")
+            return True
+        except (DeltaSyncError, sqlite3.Error) as e:
+            logger.info(f"Delta sync unavailable ({e}), full download")
+            return False
+
+    def _collect_with_script(self):
+        """Собирает discovery + security одним вызовом remote collector. None — если не удалось."""
+        cmd = build_collector_command(discovery=not self.skip_discovery)
+        success, output = self.ssh.exec_command(cmd, timeout=20)
+        if not success:
+            logger.warning(f"Collector failed, falling back to commands: {output[:200]}")
+            return None
+        try:
+            discovery_data, security_data = parse_collector_output(output)
+        except ValueError as e:
+            logger.warning(f"{e}, falling back to commands")
+            return None
+        
+        if discovery_data:
+            logger.info(f"Auto-discovery complete: {discovery_data}")
+        logger.info(f"Security metrics collected (collector): Probes={len(security_data.get('ssh_probes', []))}")
+        return discovery_data, security_data
+
+    def _collect_discovery(self) -> dict:
+        """AUTO DISCOVERY (только при первом запуске или смене сервера)."""
+        discovery_data = {}
+        try:
+            success, cpu_model = self.ssh.exec_command("lscpu | grep 'Model name' | cut -d ':' -f 2")
+            if success:
+                discovery_data['cpu_model'] = cpu_model.strip()
+            
+            success, ram_total = self.ssh.exec_command("free -h | grep Mem | awk '{print $2}'")
+            if success:
+                discovery_data['ram_total'] = ram_total.strip()
+            
+            success, os_version = self.ssh.exec_command("cat /etc/os-release | grep PRETTY_NAME | cut -d '\"' -f 2")
+            if success:
+                discovery_data['os_version'] = os_version.strip()
+            
+            panels = []
+            success, ps_output = self.ssh.exec_command("ps aux")
+            if success:
+                ps_lower = ps_output.lower()
+                if 'marzban' in ps_lower: panels.append("Marzban")
+                if 'x-ui' in ps_lower: panels.append("X-UI")
+                if 'v2ray' in ps_lower: panels.append("Xray/V2Ray")
+                if 'sing-box' in ps_lower: panels.append("Sing-box")
+            discovery_data['detected_panels'] = ", ".join(panels) if panels else "Не определено"
+            
+            logger.info(f"Auto-discovery complete: {discovery_data}")
+        except Exception as de:
+            logger.warning(f"Discovery fail: {de}")
+        return discovery_data
+
+    def _collect_security(self) -> dict:
+        """SECURITY METRICS — по одной SSH-команде на метрику."""
+        security_data = {}
+        try:
+            # 1. Packet Counters for PPS
+            cmd_pps = "cat /proc/net/dev | grep -v 'lo:' | grep ':' | head -n 1 | sed 's/.*://' | awk '{print $2}' | tr -cd '0-9'"
+            success, raw_packets = self.ssh.exec_command(cmd_pps)
+            if success:
+                security_data['raw_packets'] = raw_packets.strip()
+            
+            # 2. Jitter (Ping to 8.8.8.8)
+            cmd_jit = "ping -c 4 -i 0.2 8.8.8.8 | grep 'time=' | awk -F'time=' '{print $2}' | awk '{print $1}'"
+            success, latencies_raw = self.ssh.exec_command(cmd_jit, timeout=15)
+            if success:
+                latencies = latencies_raw.strip().split('\n')
+                security_data['latencies'] = [float(l) for l in latencies if l]
+            
+            # 3. Probing (Failed SSH logins)
+            cmd_ssh = "grep 'Failed password' /var/log/auth.log | tail -n 5 | awk '{print $(NF-3)}'"
+            success, probes_raw = self.ssh.exec_command(cmd_ssh)
+            if success:
+                probes = probes_raw.strip().split('\n')
+                security_data['ssh_probes'] = [p for p in probes if p]
+            
+            logger.info(f"Security metrics collected: Probes={len(security_data.get('ssh_probes', []))}")
+        except Exception as se:
+            logger.warning(f"Security data collection failed: {se}")
+        return security_data
@@ -0,0 +1,155 @@
+"""
+Entropy - Incremental DB Sync
+Докачивает в локальную БД только новые строки monitor_stats.db (по rowid)
+вместо полного SFTP-скачивания файла на каждом sync tick. Маленькие
+таблицы с upsert (user_totals) копируются целиком.
+"""
+
+import json
+import logging
+import os
+import shlex
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Таблицы remote БД, которые синхронизируются дельтами
+# Rollup-таблицы тоже идут по rowid: открытый бакет переписывается
+# INSERT OR REPLACE и каждый раз получает новый rowid
+SYNC_TABLES = (
+    "system_stats", "user_deltas",
+    "system_rollup_1m", "system_rollup_1h", "system_rollup_1d",
+)
+
+# Таблицы, которые обновляются на месте (upsert) — копируются целиком, O(users)
+SNAPSHOT_TABLES = ("user_totals",)
+
+# Максимум строк на таблицу за один tick — первый догон после простоя идёт порциями
+DELTA_BATCH_LIMIT = 20000
+
+# Выполняется на VPS через `python3 -c <script> <db> <cursors_json> <limit> <snapshots_json>`.
+# Отдаёт колонки, границы rowid и строки с rowid > cursor; snapshot-таблицы — целиком.
+DELTA_SCRIPT = r'''
+import json, sqlite3, sys
+db, cursors, limit = sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3])
+snapshots = json.loads(sys.argv[4]) if len(sys.argv) > 4 else []
+conn = sqlite3.connect("file:" + db + "?mode=ro", uri=True)
+out = {}
+for table in snapshots:
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+        continue
+    cur = conn.execute("SELECT * FROM " + table)
+    out[table] = {"columns": [d[0] for d in cur.description], "rows": cur.fetchall()}
+for table, after in cursors.items():
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone():
+        continue
+    lo, hi = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM " + table).fetchone()
+    cur = conn.execute("SELECT rowid, * FROM " + table + " WHERE rowid > ? ORDER BY rowid LIMIT ?", (after, limit))
+    out[table] = {"columns": [d[0] for d in cur.description][1:],
+                  "min": lo or 0, "max": hi or 0, "rows": cur.fetchall()}
+conn.close()
+print(json.dumps(out))
+'''
+
+
+class DeltaSyncError(Exception):
+    """Дельта-синхронизация невозможна — нужен полный download."""
+
+
+def build_delta_command(remote_db: str, cursors: dict,
+                        limit: int = DELTA_BATCH_LIMIT,
+                        snapshots: tuple = SNAPSHOT_TABLES) -> str:
+    """Команда для exec_command: строки с rowid больше курсоров + snapshot-таблицы."""
+    return (
+        f"python3 -c {shlex.quote(DELTA_SCRIPT)} "
+        f"{shlex.quote(remote_db)} {shlex.quote(json.dumps(cursors))} {int(limit)} "
+        f"{shlex.quote(json.dumps(list(snapshots)))}"
+    )
+
+
+def get_local_cursors(local_db: str) -> dict:
+    """
+    Последний синхронизированный rowid по каждой таблице.
+    Строки вставляются с rowid remote БД, поэтому MAX(rowid) и есть курсор.
+    """
+    if not os.path.exists(local_db):
+        raise DeltaSyncError("local DB does not exist")
+
+    conn = sqlite3.connect(local_db)
+    try:
+        cursors = {}
+        for table in SYNC_TABLES + SNAPSHOT_TABLES:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+            ).fetchone()
+            if not exists:
+                raise DeltaSyncError(f"local table {table} is missing")
+        for table in SYNC_TABLES:
+            cursors[table] = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+        return cursors
+    finally:
+        conn.close()
+
+
+def apply_delta(local_db: str, cursors: dict, payload: dict) -> int:
+    """
+    Дописывает строки дельты в локальную БД одной транзакцией.
+    Зеркалит retention remote БД (удаляет строки старше remote MIN(rowid)),
+    snapshot-таблицы заменяет целиком.
+    Возвращает количество добавленных строк (без snapshot-таблиц).
+    """
+    for table in SNAPSHOT_TABLES:
+        if table not in payload:
+            raise DeltaSyncError(f"remote table {table} is missing")
+    for table, after in cursors.items():
+        info = payload.get(table)
+        if info is None:
+            raise DeltaSyncError(f"remote table {table} is missing")
+        # Remote БД пересоздана (rowid начался заново) — дельта невалидна
+        if info["max"] < after:
+            raise DeltaSyncError(f"remote {table} rowid went backwards ({info['max']} < {after})")
+
+    conn = sqlite3.connect(local_db)
+    try:
+        added = 0
+        with conn:
+            for table in cursors:
+                info = payload[table]
+                columns = ", ".join(["rowid"] + info["columns"])
+                placeholders = ", ".join("?" * (len(info["columns"]) + 1))
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})",
+                    info["rows"],
+                )
+                conn.execute(f"DELETE FROM {table} WHERE rowid < ?", (info["min"],))
+                added += len(info["rows"])
+            for table in SNAPSHOT_TABLES:
+                info = payload[table]
+                columns = ", ".join(info["columns"])
+                placeholders = ", ".join("?" * len(info["columns"]))
+                conn.execute(f"DELETE FROM {table}")
+                conn.executemany(
+                    f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", info["rows"],
+                )
+        return added
+    finally:
+        conn.close()
+
+
+def sync_delta(ssh, remote_db: str, local_db: str) -> int:
+    """
+    Полный цикл дельта-синхронизации через один SSH-вызов.
+    Бросает DeltaSyncError, если нужен полный download.
+    """
+    cursors = get_local_cursors(local_db)
+    success, output = ssh.exec_command(build_delta_command(remote_db, cursors), timeout=30)
+    if not success:
+        raise DeltaSyncError(f"remote delta query failed: {output[:200]}")
+    try:
+        payload = json.loads(output.strip().splitlines()[-1])
+    except (IndexError, json.JSONDecodeError) as e:
+        raise DeltaSyncError(f"invalid delta output: {e}") from e
+
+    added = apply_delta(local_db, cursors, payload)
+    logger.debug(f"Delta sync: +{added} rows")
+    return added
@@ -1,45 +1,232 @@
 """
 EDP Bus — реактивная шина доставки данных.
 Компоненты подписываются на типы данных, Bus доставляет обновления.
+Подписчик выбирает режим: "sync" — вызов прямо в publish (как раньше),
+"async" — своя ограниченная очередь и доставка пулом потоков, так что
+медленный подписчик не тормозит пайплайн. При переполнении очереди
+работает политика подписчика: drop_oldest / drop_newest / coalesce.
+Внутри bus.batch() (один тик пайплайна) подписчики с per_tick="batch"
+получают один список за тик, с per_tick="latest" — только последнее значение.
 """
 
 import logging
-from collections import defaultdict
-from typing import Any, Callable
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
 
 logger = logging.getLogger(__name__)
 
+DELIVERY_MODES = ("sync", "async")
+# drop_oldest — вытеснить самое старое, drop_newest — отбросить новое,
+# coalesce — хранить только последнее значение (очередь из одного элемента)
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "coalesce")
+# each — каждое событие отдельно, batch — список за тик, latest — последнее за тик
+TICK_MODES = ("each", "batch", "latest")
+
+
+class SubscriberQueue:
+    """Ограниченная потокобезопасная очередь с политикой переполнения."""
+
+    def __init__(self, maxsize: int = 100, policy: str = "drop_oldest"):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.maxsize = 1 if policy == "coalesce" else max(1, maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self._items: deque = deque()
+        self._lock = threading.Lock()
+
+    def put(self, item: Any) -> bool:
+        """Кладёт элемент; False — если что-то пришлось отбросить."""
+        with self._lock:
+            if len(self._items) < self.maxsize:
+                self._items.append(item)
+                return True
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                return False
+            self._items.popleft()
+            self._items.append(item)
+            return False
+
+    def take_all(self) -> list:
+        """Забирает всё накопленное одним списком."""
+        with self._lock:
+            items = list(self._items)
+            self._items.clear()
+            return items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class Subscription:
+    """Подписка: callback + режим доставки (+ очередь для async)."""
+
+    def __init__(self, type_names: tuple, callback: Callable, mode: str = "sync",
+                 max_queue: int = 100, policy: str = "drop_oldest", per_tick: str = "each"):
+        if mode not in DELIVERY_MODES:
+            raise ValueError(f"Unknown delivery mode: {mode}")
+        if per_tick not in TICK_MODES:
+            raise ValueError(f"Unknown per-tick mode: {per_tick}")
+        self.type_names = type_names
+        self.type_name = "|".join(type_names)
+        self.callback = callback
+        self.mode = mode
+        self.per_tick = per_tick
+        # События текущего тика для per_tick="batch" / "latest"
+        self.tick_buffer: list = []
+        self.queue = SubscriberQueue(max_queue, policy) if mode == "async" else None
+        self.delivered = 0
+        # Подписчика разбирает не больше одного воркера — порядок сохраняется
+        self._scheduled = False
+
+    @property
+    def dropped(self) -> int:
+        return self.queue.dropped if self.queue is not None else 0
+
+    def deliver(self, event: Any):
+        try:
+            self.callback(event)
+            self.delivered += 1
+        except Exception as e:
+            logger.error(f"EDP Bus delivery error ({self.type_name}): {e}")
+
 
 class EDPBus:
     """Реактивная шина: subscribe/publish по типам данных."""
 
-    def __init__(self):
-        # {type_name: [callback, ...]}
-        self._subscribers: dict[str, list[Callable]] = defaultdict(list)
+    def __init__(self, max_workers: int = 2):
+        # {type_name: [Subscription, ...]}
+        self._subscribers: dict[str, list[Subscription]] = defaultdict(list)
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0         # Подписчиков, запланированных на доставку
+        self._batch_depth = 0
+        self._tick_pending: list[Subscription] = []
+
+    def subscribe(self, event_type, callback: Callable, mode: str = "sync",
+                  max_queue: int = 100, policy: str = "drop_oldest",
+                  per_tick: str = "each") -> Subscription:
+        """
+        Подписаться на тип данных (или кортеж типов).
+        mode="async": доставка из пула потоков через очередь на max_queue
+        элементов; policy — что делать при переполнении.
+        per_tick="batch": callback(list) раз за тик со всеми событиями
+        подписанных типов в порядке публикации; "latest" — callback(event)
+        с последним из них. Вне bus.batch() каждый publish — отдельный тик.
+        """
+        types = event_type if isinstance(event_type, tuple) else (event_type,)
+        type_names = tuple(t.__name__ for t in types)
+        subscription = Subscription(type_names, callback, mode, max_queue, policy, per_tick)
+        for type_name in type_names:
+            self._subscribers[type_name].append(subscription)
+        logger.debug(f"EDP Bus: subscribed to {subscription.type_name} ({mode}, {per_tick})")
+        return subscription
 
-    def subscribe(self, event_type: type, callback: Callable):
-        """Подписаться на тип данных."""
-        type_name = event_type.__name__
-        self._subscribers[type_name].append(callback)
-        logger.debug(f"EDP Bus: subscribed to {type_name}")
+    def unsubscribe(self, subscription: Subscription):
+        """Отписка; уже поставленные в очередь события ещё могут прийти."""
+        for type_name in subscription.type_names:
+            subs = self._subscribers.get(type_name, [])
+            if subscription in subs:
+                subs.remove(subscription)
+        subscription.tick_buffer.clear()
+
+    @contextmanager
+    def batch(self):
+        """
+        Один тик: per_tick-подписчики получают накопленное при выходе из
+        внешнего batch(). Рассчитан на один публикующий поток (пайплайн).
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._flush_tick()
 
     def publish(self, event: Any):
         """Отправить событие всем подписчикам соответствующего типа."""
         type_name = type(event).__name__
-        subscribers = self._subscribers.get(type_name, [])
+        subscribers = self._subscribers.get(type_name, ())
 
-        for callback in subscribers:
-            try:
-                callback(event)
-            except Exception as e:
-                logger.error(f"EDP Bus delivery error ({type_name}): {e}")
+        for subscription in tuple(subscribers):
+            if subscription.per_tick == "each":
+                self._dispatch(subscription, event)
+            else:
+                if not subscription.tick_buffer:
+                    self._tick_pending.append(subscription)
+                subscription.tick_buffer.append(event)
+        if not self._batch_depth and self._tick_pending:
+            self._flush_tick()
 
     def publish_many(self, events: list):
-        """Отправить список событий."""
-        for event in events:
-            self.publish(event)
+        """Отправить список событий (одним тиком)."""
+        with self.batch():
+            for event in events:
+                self.publish(event)
+
+    def _flush_tick(self):
+        pending, self._tick_pending = self._tick_pending, []
+        for subscription in pending:
+            events, subscription.tick_buffer = subscription.tick_buffer, []
+            if not events:
+                continue        # Отписались посреди тика
+            self._dispatch(subscription, events if subscription.per_tick == "batch" else events[-1])
+
+    def _dispatch(self, subscription: Subscription, payload: Any):
+        if subscription.mode == "sync":
+            subscription.deliver(payload)
+        else:
+            subscription.queue.put(payload)
+            self._schedule(subscription)
+
+    def _schedule(self, subscription: Subscription):
+        with self._lock:
+            if subscription._scheduled:
+                return
+            subscription._scheduled = True
+            self._in_flight += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="edp-bus"
+                )
+            executor = self._executor
+        executor.submit(self._drain, subscription)
+
+    def _drain(self, subscription: Subscription):
+        """Воркер: доставляет очередь подписчика, пока она не опустеет."""
+        while True:
+            for event in subscription.queue.take_all():
+                subscription.deliver(event)
+            with self._lock:
+                # Проверка под общим lock: publish не потеряет событие между
+                # последним take_all и сбросом флага
+                if not len(subscription.queue):
+                    subscription._scheduled = False
+                    self._in_flight -= 1
+                    self._idle.notify_all()
+                    return
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт, пока async-очереди опустеют. False — не успели за timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Дожидается доставки и останавливает пул (при выходе из приложения)."""
+        self.join(timeout)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
 
     @property
     def subscriber_count(self) -> int:
         """Общее количество подписок."""
-        return sum(len(subs) for subs in self._subscribers.values())
+        return len({id(sub) for subs in self._subscribers.values() for sub in subs})
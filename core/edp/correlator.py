@@ -4,6 +4,8 @@ EDP Correlator — корреляционный движок.
 """
 
 import logging
+from abc import ABC, abstractmethod
+from collections import deque
 from datetime import datetime
 
 from core.edp.types import MetricSnapshot, ThreatEvent
@@ -78,6 +80,107 @@ def _pps_stable(snap, prev):
     return abs(snap.pps.pct_change) < 15
 
 
+# === Оконные операторы ===
+# Условия с состоянием поверх обычных условий: конечные автоматы,
+# обновляемые раз в тик по битам входных условий. Стоимость тика — O(1)
+# на оператор, историю TemporalMemory они не перечитывают.
+
+class WindowOperator(ABC):
+    """
+    Базовый оконный оператор. inputs — обычные условия (или другие
+    операторы); Correlator вычисляет их раньше и передаёт результаты в update().
+    Вне Correlator оператор можно вызвать как обычное условие.
+    """
+
+    inputs: tuple = ()
+
+    @abstractmethod
+    def update(self, hits: tuple, when: datetime) -> bool:
+        """Один тик: hits — результаты inputs по порядку; True — оператор сработал."""
+
+    def __call__(self, snap: MetricSnapshot, prev: MetricSnapshot = None) -> bool:
+        return self.update(tuple(bool(cond(snap, prev)) for cond in self.inputs), snap.timestamp)
+
+
+class Sustained(WindowOperator):
+    """Условие выполняется подряд не меньше ticks тиков и/или seconds секунд."""
+
+    def __init__(self, condition, ticks: int = 0, seconds: float = 0.0):
+        if ticks <= 0 and seconds <= 0:
+            raise ValueError("Sustained needs ticks or seconds")
+        self.inputs = (condition,)
+        self.ticks = ticks
+        self.seconds = seconds
+        self._run = 0
+        self._run_start: datetime | None = None
+        self.__name__ = f"sustained({getattr(condition, '__name__', condition)})"
+
+    def update(self, hits: tuple, when: datetime) -> bool:
+        if not hits[0]:
+            self._run = 0
+            self._run_start = None
+            return False
+        self._run += 1
+        if self._run_start is None:
+            self._run_start = when
+        if self.ticks and self._run < self.ticks:
+            return False
+        return not self.seconds or (when - self._run_start).total_seconds() >= self.seconds
+
+
+class CountInWindow(WindowOperator):
+    """Условие выполнялось не меньше count раз за последние ticks тиков или seconds секунд."""
+
+    def __init__(self, condition, count: int, ticks: int = 0, seconds: float = 0.0):
+        if (ticks > 0) == (seconds > 0):
+            raise ValueError("CountInWindow needs exactly one of ticks / seconds")
+        self.inputs = (condition,)
+        self.count = count
+        self.ticks = ticks
+        self.seconds = seconds
+        # По тикам — окно из флагов + running sum; по времени — моменты срабатываний
+        self._window: deque = deque()
+        self._hits = 0
+        self.__name__ = f"count({getattr(condition, '__name__', condition)})"
+
+    def update(self, hits: tuple, when: datetime) -> bool:
+        hit = hits[0]
+        if self.ticks:
+            self._window.append(hit)
+            self._hits += hit
+            if len(self._window) > self.ticks:
+                self._hits -= self._window.popleft()
+        else:
+            if hit:
+                self._window.append(when)
+            while self._window and (when - self._window[0]).total_seconds() > self.seconds:
+                self._window.popleft()
+            self._hits = len(self._window)
+        return self._hits >= self.count
+
+
+class FollowedBy(WindowOperator):
+    """then выполняется, а first выполнялось на одном из прошлых тиков не раньше seconds секунд назад."""
+
+    def __init__(self, first, then, seconds: float):
+        self.inputs = (first, then)
+        self.seconds = seconds
+        self._first_seen: datetime | None = None
+        self.__name__ = (f"{getattr(first, '__name__', first)} → "
+                         f"{getattr(then, '__name__', then)}")
+
+    def update(self, hits: tuple, when: datetime) -> bool:
+        fired = (
+            hits[1]
+            and self._first_seen is not None
+            and (when - self._first_seen).total_seconds() <= self.seconds
+        )
+        # Текущий тик для first учитывается только со следующего тика
+        if hits[0]:
+            self._first_seen = when
+        return bool(fired)
+
+
 # === Встроенные правила ===
 
 BUILTIN_RULES = [
@@ -113,31 +216,110 @@ BUILTIN_RULES = [
 
 
 class Correlator:
-    """Движок корреляции — проверяет правила на каждом цикле."""
+    """
+    Движок корреляции — проверяет правила на каждом цикле.
+    Правила компилируются: одинаковые условия всех правил дедуплицируются,
+    за тик каждое условие вычисляется один раз в битовую маску, а правило
+    срабатывает, если в маске есть все его биты. Стоимость тика растёт с
+    числом уникальных условий, а не с суммой условий по правилам.
+    Оконные операторы получают биты своих входов и обновляют автомат —
+    поэтому каждое условие вычисляется ровно раз за тик.
+    """
 
     def __init__(self, rules: list[CorrelationRule] = None):
         self._rules = rules if rules is not None else list(BUILTIN_RULES)
+        # Правила из файла (core.edp.rules): перекрывают правила с тем же id
+        self._file_rules: list[CorrelationRule] = []
+        self._conditions: list = []          # Уникальные условия, бит i — условие i
+        self._input_bits: list = []          # Для оконных операторов — биты входов, иначе None
+        self._condition_bits: dict = {}      # условие → номер бита
+        self._rule_masks: list[tuple[int, CorrelationRule]] = []
+        self._compile()
+
+    def _compile(self):
+        """Пересобирает таблицу условий и маски правил."""
+        self._conditions = []
+        self._input_bits = []
+        self._condition_bits = {}
+        self._rule_masks = [(self._mask(rule), rule) for rule in self.rules]
+
+    def _mask(self, rule: CorrelationRule) -> int:
+        mask = 0
+        for cond in rule.conditions:
+            mask |= 1 << self._bit(cond)
+        return mask
+
+    def _bit(self, cond) -> int:
+        """Бит условия; входы оконного оператора регистрируются раньше него."""
+        bit = self._condition_bits.get(cond)
+        if bit is None:
+            inputs = None
+            if isinstance(cond, WindowOperator):
+                inputs = tuple(self._bit(inp) for inp in cond.inputs)
+            bit = self._condition_bits[cond] = len(self._conditions)
+            self._conditions.append(cond)
+            self._input_bits.append(inputs)
+        return bit
+
+    def _evaluate_conditions(self, current: MetricSnapshot,
+                             previous: MetricSnapshot = None) -> int:
+        """Битовая маска выполненных условий; упавшее условие считается ложным."""
+        bits = 0
+        for bit, (cond, inputs) in enumerate(zip(self._conditions, self._input_bits)):
+            try:
+                if inputs is not None:
+                    hit = cond.update(tuple(bool(bits >> i & 1) for i in inputs), current.timestamp)
+                else:
+                    hit = cond(current, previous)
+                if hit:
+                    bits |= 1 << bit
+            except Exception as e:
+                logger.debug(f"Condition {getattr(cond, '__name__', cond)} eval error: {e}")
+        return bits
 
     def evaluate(self, current: MetricSnapshot,
                  previous: MetricSnapshot = None) -> list[ThreatEvent]:
         """Проверяет все правила, возвращает список сработавших событий."""
+        bits = self._evaluate_conditions(current, previous)
         events = []
-        for rule in self._rules:
-            if rule.evaluate(current, previous):
-                event = ThreatEvent(
-                    timestamp=current.timestamp,
-                    event_type="correlation_fired",
-                    severity=rule.severity,
-                    rule_id=rule.rule_id,
-                    description=f"{rule.name}: {rule.description}",
-                    related_metrics=current.to_raw_dict(),
-                )
-                events.append(event)
-                logger.warning(
-                    f"🔴 Correlation [{rule.severity.upper()}]: {rule.name}"
-                )
+        raw = None
+        for mask, rule in self._rule_masks:
+            if bits & mask != mask:
+                continue
+            if raw is None:
+                raw = current.to_raw_dict()
+            event = ThreatEvent(
+                timestamp=current.timestamp,
+                event_type="correlation_fired",
+                severity=rule.severity,
+                rule_id=rule.rule_id,
+                description=f"{rule.name}: {rule.description}",
+                related_metrics=raw,
+            )
+            events.append(event)
+            logger.warning(
+                f"🔴 Correlation [{rule.severity.upper()}]: {rule.name}"
+            )
         return events
 
     def add_rule(self, rule: CorrelationRule):
-        """Добавляет пользовательское правило."""
+        """Добавляет пользовательское правило (новые условия получают свои биты)."""
         self._rules.append(rule)
+        if all(r.rule_id != rule.rule_id for r in self._file_rules):
+            self._rule_masks.append((self._mask(rule), rule))
+
+    def set_file_rules(self, rules: list[CorrelationRule]):
+        """Заменяет правила из файла целиком и перекомпилирует движок."""
+        self._file_rules = list(rules)
+        self._compile()
+
+    @property
+    def rules(self) -> list[CorrelationRule]:
+        """Активные правила: встроенные/добавленные, кроме перекрытых файлом, + из файла."""
+        overridden = {rule.rule_id for rule in self._file_rules}
+        return [r for r in self._rules if r.rule_id not in overridden] + self._file_rules
+
+    @property
+    def condition_count(self) -> int:
+        """Число уникальных условий — столько вызовов стоит один тик."""
+        return len(self._conditions)
@@ -0,0 +1,176 @@
+"""
+EDP DNA Store — компактный бинарный формат Server DNA.
+Фиксированная раскладка: заголовок, таблица метрик (имя, тип слота, размер
+записи) и по одной записи на (метрика, слот) с сырым состоянием во float64
+(ring buffer окна, моменты EWMA или маркеры квантилей). Фиксированные
+смещения позволяют перезаписывать только изменившиеся слоты; новая
+раскладка пишется через temp-файл + os.replace (атомарно).
+CRC на запись: оборванная запись теряет один слот, а не весь профиль.
+"""
+
+import logging
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Callable
+
+from core.edp.stats import EwmaStats, QuantileSketch, RollingWindow
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"EDNA"
+_VERSION = 3
+# magic, version, metric_count, slots_per_metric
+_HEADER = struct.Struct("<4sHHH")
+# имя метрики, kind, payload (float64 на запись)
+_METRIC_ENTRY = struct.Struct("<16sHI")
+# count, head, crc32, padding (выравнивание float64 на 8 байт)
+_RECORD_HEAD = struct.Struct("<IIII")
+_MAX_COUNT = 0xFFFFFFFF
+
+# Тип слота в таблице метрик
+KIND_WINDOW = 0
+KIND_EWMA = 1
+KIND_QUANTILE = 2
+_KINDS = {RollingWindow: KIND_WINDOW, EwmaStats: KIND_EWMA, QuantileSketch: KIND_QUANTILE}
+
+
+class DNAFormatError(Exception):
+    """Файл не в формате DNA Store (или несовместимая раскладка)."""
+
+
+def slot_spec(slot) -> tuple[int, int]:
+    """(kind, payload) слота — то, что пишется в таблицу метрик."""
+    return _KINDS[type(slot)], len(slot.raw_state()[2])
+
+
+def _record_size(payload: int) -> int:
+    return _RECORD_HEAD.size + 8 * payload
+
+
+def _float_bytes(buf: array) -> bytes:
+    """float64 в little-endian независимо от платформы."""
+    if sys.byteorder != "little":
+        buf = array("d", buf)
+        buf.byteswap()
+    return buf.tobytes()
+
+
+def _pack_record(slot) -> bytes:
+    count, head, buf = slot.raw_state()
+    count = min(count, _MAX_COUNT)
+    payload = _float_bytes(buf)
+    crc = zlib.crc32(struct.pack("<II", count, head) + payload)
+    return _RECORD_HEAD.pack(count, head, crc, 0) + payload
+
+
+def _offsets(slots: int, entries: list) -> dict:
+    """Смещение первой записи и размер записи для каждой метрики."""
+    offset = _HEADER.size + _METRIC_ENTRY.size * len(entries)
+    result = {}
+    for metric, _, payload in entries:
+        rec_size = _record_size(payload)
+        result[metric] = (offset, rec_size)
+        offset += slots * rec_size
+    return result
+
+
+def is_dna_file(path: str) -> bool:
+    """True если файл начинается с magic DNA Store."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_MAGIC)) == _MAGIC
+    except OSError:
+        return False
+
+
+def read_layout(path: str) -> tuple[int, list[tuple[str, int, int]]]:
+    """(слотов на метрику, [(метрика, kind, payload), ...]) из заголовка файла."""
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise DNAFormatError("truncated header")
+        magic, version, metric_count, slots = _HEADER.unpack(header)
+        if magic != _MAGIC or version != _VERSION:
+            raise DNAFormatError(f"unsupported file (magic={magic!r}, version={version})")
+        entries = []
+        for _ in range(metric_count):
+            raw = f.read(_METRIC_ENTRY.size)
+            if len(raw) < _METRIC_ENTRY.size:
+                raise DNAFormatError("truncated metric table")
+            name, kind, payload = _METRIC_ENTRY.unpack(raw)
+            entries.append((name.rstrip(b"\0").decode("ascii"), kind, payload))
+    return slots, entries
+
+
+def load(path: str, new_slot: Callable) -> tuple[dict, list[str]]:
+    """
+    Читает весь профиль; new_slot(metric) создаёт пустой слот нужного типа.
+    Метрики, записанные слотом другого типа, начинаются заново; слоты с
+    битым CRC восстанавливаются пустыми.
+    Возвращает (данные, список метрик, чей формат не совпал).
+    """
+    slots, entries = read_layout(path)
+    offsets = _offsets(slots, entries)
+    data, mismatched = {}, []
+    with open(path, "rb") as f:
+        for metric, kind, payload in entries:
+            fresh = [new_slot(metric) for _ in range(slots)]
+            data[metric] = fresh
+            if slot_spec(fresh[0]) != (kind, payload):
+                logger.warning(f"DNA metric {metric}: slot type changed, reset")
+                mismatched.append(metric)
+                continue
+            offset, rec_size = offsets[metric]
+            f.seek(offset)
+            for i, slot in enumerate(fresh):
+                _unpack_record(f.read(rec_size), payload, slot, f"{metric}[{i}]")
+    return data, mismatched
+
+
+def _unpack_record(record: bytes, payload: int, slot, label: str):
+    if len(record) < _record_size(payload):
+        logger.warning(f"DNA slot {label} truncated, reset")
+        return
+    count, head, crc, _ = _RECORD_HEAD.unpack_from(record)
+    raw = record[_RECORD_HEAD.size:]
+    if zlib.crc32(struct.pack("<II", count, head) + raw) != crc:
+        logger.warning(f"DNA slot {label} checksum mismatch, reset")
+        return
+    buf = array("d", raw)
+    if sys.byteorder != "little":
+        buf.byteswap()
+    slot.load_raw_state(count, head, buf.tobytes())
+
+
+def write_full(path: str, data: dict):
+    """Полная запись через temp-файл и атомарный os.replace."""
+    slots = len(next(iter(data.values()))) if data else 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(data), slots))
+        for metric, metric_slots in data.items():
+            kind, payload = slot_spec(metric_slots[0])
+            f.write(_METRIC_ENTRY.pack(metric.encode("ascii")[:16], kind, payload))
+        for metric_slots in data.values():
+            for slot in metric_slots:
+                f.write(_pack_record(slot))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_slots(path: str, data: dict, dirty: set):
+    """Перезаписывает на месте только записи из dirty = {(metric, slot), ...}."""
+    slots = len(next(iter(data.values())))
+    entries = [(metric, *slot_spec(metric_slots[0])) for metric, metric_slots in data.items()]
+    offsets = _offsets(slots, entries)
+    with open(path, "r+b") as f:
+        for metric, slot in sorted(dirty, key=lambda ms: offsets[ms[0]][0] + ms[1] * offsets[ms[0]][1]):
+            offset, rec_size = offsets[metric]
+            f.seek(offset + slot * rec_size)
+            f.write(_pack_record(data[metric][slot]))
+        f.flush()
+        os.fsync(f.fileno())
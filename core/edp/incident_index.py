@@ -0,0 +1,286 @@
+"""
+EDP Incident Index — векторизованный in-memory индекс fingerprints.
+Паттерн кодируется строкой int-кодов направлений, отклонения — строкой
+float64 с флагами присутствия. Сходство считается одним проходом NumPy по
+той же формуле, что IncidentMemory._calculate_similarity.
+Строки сгруппированы в бакеты по паттерну: направления дают 70% скора,
+поэтому бакет, который даже с идеальными отклонениями не дотягивает до
+порога, отсекается целиком — скорятся только кандидаты.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from core.edp.types import IncidentFingerprint
+
+# Веса сходства: направления / близость отклонений
+_DIRECTION_WEIGHT = 0.7
+_DEVIATION_WEIGHT = 0.3
+
+# Базовые ключи и направления; неизвестные добавляются на лету
+_PATTERN_KEYS = ("cpu", "ram", "pps", "jitter", "probes")
+_DEVIATION_KEYS = ("cpu", "ram", "pps", "jitter")
+_MISSING = -1
+
+
+class FingerprintIndex:
+    """
+    Колоночные (Fortran-order) матрицы fingerprints с удвоением ёмкости;
+    строки удаляются swap-remove. Отсутствующее отклонение хранится как 0
+    с флагом присутствия — без NaN-арифметики на горячем пути.
+    """
+
+    def __init__(self, directions: tuple, capacity: int = 64):
+        self._codes = {d: i for i, d in enumerate(directions)}
+        self._pattern_keys = {k: i for i, k in enumerate(_PATTERN_KEYS)}
+        self._deviation_keys = {k: i for i, k in enumerate(_DEVIATION_KEYS)}
+
+        self._size = 0
+        n_p, n_d = len(self._pattern_keys), len(self._deviation_keys)
+        self._patterns = np.full((capacity, n_p), _MISSING, dtype=np.int16, order="F")
+        self._deviations = np.zeros((capacity, n_d), order="F")
+        self._dev_abs = np.zeros((capacity, n_d), order="F")
+        self._dev_present = np.zeros((capacity, n_d), dtype=bool, order="F")
+        self._thresholds = np.zeros(capacity)
+        self._fingerprints: list[IncidentFingerprint] = []
+        self._rows: dict[str, int] = {}
+        self._row_bucket = np.full(capacity, -1, dtype=np.int32)
+
+        # Бакеты по паттерну: ключ → id, коды направлений, min порог, строки
+        self._bucket_ids: dict[tuple, int] = {}
+        self._bucket_patterns = np.full((capacity, n_p), _MISSING, dtype=np.int16)
+        self._bucket_thresholds = np.full(capacity, np.inf)
+        self._bucket_rows: list[set[int]] = []
+
+    # --- Кодирование ---
+
+    def _code(self, direction: str) -> int:
+        code = self._codes.get(direction)
+        if code is None:
+            code = self._codes[direction] = len(self._codes)
+        return code
+
+    def _add_column(self, attr: str, fill):
+        matrix = getattr(self, attr)
+        extra = np.full((matrix.shape[0], 1), fill, dtype=matrix.dtype)
+        setattr(self, attr, np.asfortranarray(np.hstack((matrix, extra))))
+
+    def _encode(self, pattern: dict, deviations: dict) -> tuple[dict, dict]:
+        """{колонка: код направления}, {колонка: отклонение}; новые ключи расширяют матрицы."""
+        for key in pattern:
+            if key not in self._pattern_keys:
+                self._pattern_keys[key] = len(self._pattern_keys)
+                self._add_column("_patterns", _MISSING)
+                self._add_column("_bucket_patterns", _MISSING)
+        for key in deviations:
+            if key not in self._deviation_keys:
+                self._deviation_keys[key] = len(self._deviation_keys)
+                for attr, fill in (("_deviations", 0.0), ("_dev_abs", 0.0), ("_dev_present", False)):
+                    self._add_column(attr, fill)
+        codes = {self._pattern_keys[k]: self._code(v) for k, v in pattern.items()}
+        values = {self._deviation_keys[k]: float(v) for k, v in deviations.items()}
+        return codes, values
+
+    # --- Изменение ---
+
+    _MATRICES = (
+        ("_patterns", _MISSING), ("_deviations", 0.0), ("_dev_abs", 0.0),
+        ("_dev_present", False), ("_thresholds", 0.0), ("_row_bucket", -1),
+    )
+
+    def _grow(self):
+        capacity = self._patterns.shape[0] * 2
+        for attr, fill in self._MATRICES:
+            old = getattr(self, attr)
+            new = np.full((capacity,) + old.shape[1:], fill, dtype=old.dtype, order="F")
+            new[:self._size] = old[:self._size]
+            setattr(self, attr, new)
+
+    def _bucket(self, pattern: dict, codes: dict) -> int:
+        """id бакета для паттерна (создаёт новый при необходимости)."""
+        key = tuple(sorted(pattern.items()))
+        bucket = self._bucket_ids.get(key)
+        if bucket is None:
+            bucket = self._bucket_ids[key] = len(self._bucket_rows)
+            if bucket == self._bucket_patterns.shape[0]:
+                self._bucket_patterns = np.vstack(
+                    (self._bucket_patterns, np.full_like(self._bucket_patterns, _MISSING))
+                )
+                self._bucket_thresholds = np.concatenate(
+                    (self._bucket_thresholds, np.full_like(self._bucket_thresholds, np.inf))
+                )
+            for col, code in codes.items():
+                self._bucket_patterns[bucket, col] = code
+            self._bucket_rows.append(set())
+        return bucket
+
+    def upsert(self, fp: IncidentFingerprint):
+        """Добавляет fingerprint или перезаписывает строку с тем же id."""
+        codes, values = self._encode(fp.pattern, fp.deviations)
+        row = self._rows.get(fp.id)
+        if row is None:
+            if self._size == self._patterns.shape[0]:
+                self._grow()
+            row = self._size
+            self._size += 1
+            self._rows[fp.id] = row
+            self._fingerprints.append(fp)
+        else:
+            self._fingerprints[row] = fp
+            self._bucket_rows[self._row_bucket[row]].discard(row)
+        bucket = self._bucket(fp.pattern, codes)
+        self._bucket_rows[bucket].add(row)
+        self._row_bucket[row] = bucket
+        # Порог бакета — минимум по его строкам; после удалений может
+        # остаться заниженным, это лишь ослабляет отсечение
+        self._bucket_thresholds[bucket] = min(self._bucket_thresholds[bucket], fp.match_threshold)
+        self._patterns[row] = _MISSING
+        for col, code in codes.items():
+            self._patterns[row, col] = code
+        self._deviations[row] = 0.0
+        self._dev_present[row] = False
+        for col, value in values.items():
+            self._deviations[row, col] = value
+            self._dev_present[row, col] = True
+        self._dev_abs[row] = np.abs(self._deviations[row])
+        self._thresholds[row] = fp.match_threshold
+
+    def remove(self, incident_id: str):
+        """Удаляет строку, перенося на её место последнюю."""
+        row = self._rows.pop(incident_id, None)
+        if row is None:
+            return
+        last = self._size - 1
+        self._bucket_rows[self._row_bucket[row]].discard(row)
+        if row != last:
+            moved = self._fingerprints[last]
+            self._fingerprints[row] = moved
+            self._rows[moved.id] = row
+            moved_bucket = self._bucket_rows[self._row_bucket[last]]
+            moved_bucket.discard(last)
+            moved_bucket.add(row)
+            for attr, _ in self._MATRICES:
+                matrix = getattr(self, attr)
+                matrix[row] = matrix[last]
+        self._fingerprints.pop()
+        self._size = last
+
+    def get(self, incident_id: str) -> Optional[IncidentFingerprint]:
+        row = self._rows.get(incident_id)
+        return None if row is None else self._fingerprints[row]
+
+    # --- Поиск ---
+
+    def similarities(self, pattern: dict, deviations: dict,
+                     rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Сходство запроса с каждой строкой (или только с rows):
+        0.7 × доля совпавших направлений по общим ключам
+        + 0.3 × средняя близость отклонений по общим ключам (0.5, если их нет);
+        0.0, если общих ключей паттерна нет.
+        Проход идёт по колонкам, которые есть в запросе (≤ 5 + 4).
+        """
+        codes, values = self._encode(pattern, deviations)
+        n = self._size if rows is None else len(rows)
+
+        def column(attr: str, col: int) -> np.ndarray:
+            data = getattr(self, attr)[:self._size, col]
+            return data if rows is None else data[rows]
+
+        n_common = np.zeros(n, dtype=np.uint8)
+        n_equal = np.zeros(n, dtype=np.uint8)
+        for col, code in codes.items():
+            directions = column("_patterns", col)
+            n_common += directions != _MISSING
+            n_equal += directions == code
+
+        n_dev = np.zeros(n, dtype=np.uint8)
+        closeness = np.zeros(n)
+        diff = np.empty(n)
+        scale = np.empty(n)
+        for col, q in values.items():
+            present = column("_dev_present", col)
+            # 1 - min(|a - b| / max(|a|, |b|, 1), 1), только где метрика есть у обоих
+            np.subtract(column("_deviations", col), q, out=diff)
+            np.abs(diff, out=diff)
+            np.maximum(column("_dev_abs", col), max(abs(q), 1.0), out=scale)
+            np.divide(diff, scale, out=diff)
+            np.minimum(diff, 1.0, out=diff)
+            np.subtract(1.0, diff, out=diff)
+            diff *= present
+            closeness += diff
+            n_dev += present
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            deviation_score = np.where(n_dev > 0, closeness / n_dev, 0.5)
+            direction_score = n_equal / n_common
+        score = direction_score * _DIRECTION_WEIGHT + deviation_score * _DEVIATION_WEIGHT
+        return np.where(n_common > 0, score, 0.0)
+
+    def _candidates(self, codes: dict, floors: np.ndarray) -> np.ndarray:
+        """
+        Строки бакетов, чья верхняя граница сходства (идеальные отклонения:
+        0.7 × доля совпавших направлений + 0.3) дотягивает до floors[бакет].
+        """
+        n_buckets = len(self._bucket_rows)
+        patterns = self._bucket_patterns[:n_buckets]
+        n_common = np.zeros(n_buckets, dtype=np.uint8)
+        n_equal = np.zeros(n_buckets, dtype=np.uint8)
+        for col, code in codes.items():
+            n_common += patterns[:, col] != _MISSING
+            n_equal += patterns[:, col] == code
+        with np.errstate(invalid="ignore", divide="ignore"):
+            upper = np.where(n_common > 0,
+                             n_equal / n_common * _DIRECTION_WEIGHT + _DEVIATION_WEIGHT, 0.0)
+        # Допуск на округление: граница не должна отсечь ровно пороговый скор
+        alive = np.flatnonzero(upper + 1e-9 >= floors)
+        rows = [row for bucket in alive for row in self._bucket_rows[bucket]]
+        return np.array(rows, dtype=np.int64)
+
+    def match(self, pattern: dict, deviations: dict) -> list[tuple[IncidentFingerprint, float]]:
+        """(fingerprint, similarity) для строк, прошедших свой match_threshold."""
+        if not self._size:
+            return []
+        codes, _ = self._encode(pattern, deviations)
+        rows = self._candidates(codes, self._bucket_thresholds[:len(self._bucket_rows)])
+        if not len(rows):
+            return []
+        scores = self.similarities(pattern, deviations, rows)
+        hits = np.flatnonzero(scores >= self._thresholds[rows])
+        return [(self._fingerprints[rows[i]], float(scores[i])) for i in hits]
+
+    def most_similar(self, pattern: dict, deviations: dict,
+                     min_similarity: float) -> Optional[tuple[IncidentFingerprint, float]]:
+        """Ближайший инцидент со сходством строго больше min_similarity (без учёта его порога)."""
+        if not self._size:
+            return None
+        codes, _ = self._encode(pattern, deviations)
+        rows = self._candidates(codes, np.full(len(self._bucket_rows), min_similarity))
+        if not len(rows):
+            return None
+        scores = self.similarities(pattern, deviations, rows)
+        best = int(np.argmax(scores))
+        if scores[best] <= min_similarity:
+            return None
+        return self._fingerprints[rows[best]], float(scores[best])
+
+    def buckets(self) -> list[np.ndarray]:
+        """
+        Строки непустых бакетов (fingerprints с одинаковым паттерном) — для
+        компакции. Номера строк валидны до следующего remove().
+        """
+        return [np.fromiter(rows, dtype=np.int64, count=len(rows))
+                for rows in self._bucket_rows if rows]
+
+    def at(self, row: int) -> IncidentFingerprint:
+        return self._fingerprints[row]
+
+    def __iter__(self):
+        return iter(list(self._fingerprints))
+
+    def __contains__(self, incident_id: str) -> bool:
+        return incident_id in self._rows
+
+    def __len__(self) -> int:
+        return self._size
@@ -1,17 +1,24 @@
 """
 EDP Memory — Temporal Memory + Incident Memory.
-Temporal: кольцевой буфер снэпшотов (in-memory).
-Incident: SQLite-хранилище fingerprints инцидентов с pattern matching.
+Temporal: кольцевой буфер снэпшотов + колоночный NumPy ring buffer,
+скользящие агрегаты и rollup-уровни 1 мин / 1 час (in-memory).
+Incident: SQLite-хранилище fingerprints инцидентов с in-memory индексом для matching.
 """
 
+import itertools
 import json
 import logging
 import sqlite3
+import threading
 import uuid
 from collections import deque
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
 
+import numpy as np
+
+from core.edp.incident_index import FingerprintIndex
+from core.edp.timeseries import ColumnarRing, RollupTier, WindowAggregate
 from core.edp.types import IncidentFingerprint, IncidentMatch, MetricSnapshot
 
 logger = logging.getLogger(__name__)
@@ -19,16 +26,65 @@ logger = logging.getLogger(__name__)
 # Направления для pattern matching
 _DIRECTIONS = ("spike", "up", "stable", "down", "drop", "new", "none")
 
+# Retention Incident Memory по умолчанию
+_MAX_ROWS = 5000
+_MAX_AGE_DAYS = 180
+_MERGE_SIMILARITY = 0.95
+_COMPACT_EVERY = 100     # Компакция каждые N новых инцидентов
+_MERGE_BUDGET = 200_000  # Сравнений строк на слияние дубликатов за один compact()
+
+# Числовые колонки Temporal Memory
+_COLUMNS = ("cpu", "ram", "pps", "jitter", "users_count")
+_COLUMN_INDEX = {name: i for i, name in enumerate(_COLUMNS)}
+_METRICS = ("cpu", "ram", "pps", "jitter")
+
+# Окно get_summary по умолчанию — его агрегаты ведутся с первого замера
+_SUMMARY_WINDOW = 60
+
+# Уровни даунсэмплинга: имя → (длина бакета, сек; ёмкость в бакетах)
+_TIERS = {
+    "1m": (60, 24 * 60),        # Минутные rollup-ы за 24 часа
+    "1h": (3600, 30 * 24),      # Часовые rollup-ы за 30 дней
+}
+
+# Горизонты для сводки AI: (уровень, длительность, подпись)
+_HORIZONS = (
+    ("1m", 24 * 3600, "24 ч"),
+    ("1h", 30 * 24 * 3600, "30 дн"),
+)
+
 
 class TemporalMemory:
-    """Кольцевой буфер снэпшотов — in-memory time-series хранилище."""
+    """
+    In-memory time-series хранилище: снэпшоты (для last/previous/history)
+    + колоночный ring buffer значений для оконных запросов без обхода объектов
+    + инкрементальные агрегаты окна сводки и rollup-уровни (1 мин / 1 час).
+    """
 
     def __init__(self, max_size: int = 360):
         self._buffer: deque[MetricSnapshot] = deque(maxlen=max_size)
+        self._ring = ColumnarRing(max_size, _COLUMNS)
+        # metric → скользящие sum/peak окна сводки по умолчанию, обновляются в add().
+        # Только фиксированный набор: остальные окна считаются по ring без кэша
+        self._aggregates = {
+            metric: WindowAggregate(min(_SUMMARY_WINDOW, max_size)) for metric in _METRICS
+        }
+        self._tiers = {
+            name: RollupTier(bucket, capacity, _METRICS)
+            for name, (bucket, capacity) in _TIERS.items()
+        }
 
     def add(self, snapshot: MetricSnapshot):
         """Добавляет снэпшот в буфер."""
+        values = (snapshot.cpu.value, snapshot.ram.value, snapshot.pps.value,
+                  snapshot.jitter.value, snapshot.users_count)
+        ts = snapshot.timestamp.timestamp()
         self._buffer.append(snapshot)
+        self._ring.append(ts, values)
+        for metric, agg in self._aggregates.items():
+            agg.add(values[_COLUMN_INDEX[metric]])
+        for tier in self._tiers.values():
+            tier.add(ts, values[:len(_METRICS)])
 
     @property
     def last(self) -> Optional[MetricSnapshot]:
@@ -42,29 +98,39 @@ class TemporalMemory:
 
     def get_history(self, count: int = 60) -> list[MetricSnapshot]:
         """Возвращает последние N снэпшотов."""
-        items = list(self._buffer)
-        return items[-count:] if len(items) > count else items
+        if count >= len(self._buffer):
+            return list(self._buffer)
+        return list(itertools.islice(self._buffer, len(self._buffer) - count, None))
+
+    def window(self, metric: str, count: int = 60) -> np.ndarray:
+        """Последние N значений метрики — read-only view без копирования."""
+        return self._ring.view(metric, count)
+
+    def timestamps(self, count: int = 60) -> np.ndarray:
+        """Unix-время последних N замеров — read-only view."""
+        return self._ring.timestamps(count)
 
     def get_metric_values(self, metric: str, count: int = 60) -> list[float]:
         """Возвращает список значений одной метрики за последние N замеров."""
-        history = self.get_history(count)
-        result = []
-        for snap in history:
-            mv = getattr(snap, metric, None)
-            if mv is not None:
-                result.append(mv.value if hasattr(mv, "value") else float(mv))
-        return result
+        if metric not in self._ring:
+            return []
+        return self._ring.view(metric, count).tolist()
 
     def get_trend(self, metric: str, window: int = 10) -> str:
         """Определяет тренд метрики: 'up' | 'down' | 'stable'."""
-        values = self.get_metric_values(metric, window)
-        if len(values) < 3:
+        if metric not in self._ring:
+            return "stable"
+        n = min(window, len(self._ring))
+        if n < 3:
             return "stable"
 
-        # Линейный тренд: среднее первой vs второй половины
-        mid = len(values) // 2
-        first_half = sum(values[:mid]) / mid
-        second_half = sum(values[mid:]) / (len(values) - mid)
+        # Линейный тренд: среднее первой vs второй половины. Окно короткое —
+        # половины считаются прямо по view: разность running sum оставляет
+        # остаток округления, и проверка first_half == 0 его не ловит
+        mid = n // 2
+        values = self._ring.view(metric, n)
+        first_half = values[:mid].mean()
+        second_half = values[mid:].mean()
 
         if first_half == 0:
             return "stable"
@@ -78,17 +144,18 @@ class TemporalMemory:
 
     def get_summary(self, count: int = 60) -> str:
         """Текстовая сводка истории для AI."""
-        values = {
-            m: self.get_metric_values(m, count)
-            for m in ("cpu", "ram", "pps", "jitter")
-        }
-
         parts = []
-        for metric, vals in values.items():
-            if not vals:
-                continue
-            avg = sum(vals) / len(vals)
-            peak = max(vals)
+        for metric in _METRICS:
+            agg = self._aggregates[metric]
+            if min(count, self._ring.capacity) == agg.size:
+                if not agg.count:
+                    continue
+                avg, peak = agg.avg, agg.peak
+            else:
+                values = self._ring.view(metric, count)
+                if not len(values):
+                    continue
+                avg, peak = values.mean(), values.max()
             parts.append(f"{metric}: avg {avg:.0f}, peak {peak:.0f}")
 
         if not parts:
@@ -96,22 +163,97 @@ class TemporalMemory:
 
         return f"За последние {count} замеров: " + ", ".join(parts)
 
+    def get_rollups(self, tier: str = "1m", count: int = None) -> dict:
+        """
+        Закрытые бакеты уровня "1m" | "1h" для графиков:
+        {"timestamps": ..., "count": ..., "<metric>": {"avg", "min", "max"}} — read-only views.
+        """
+        rollup = self._tiers[tier]
+        result = {"timestamps": rollup.timestamps(count), "count": rollup.counts(count)}
+        for metric in _METRICS:
+            result[metric] = {
+                stat: rollup.view(metric, stat, count) for stat in ("avg", "min", "max")
+            }
+        return result
+
+    def get_horizon_summary(self) -> str:
+        """
+        Сводка по длинным горизонтам (24 ч, 30 дн) из rollup-уровней.
+        Горизонт попадает в сводку, только если покрывает больше, чем уже
+        есть в сырых замерах и предыдущем горизонте.
+        """
+        if not len(self._ring):
+            return ""
+        ts = self._ring.timestamps()
+        now = ts[-1]
+        covered = now - ts[0]
+
+        parts = []
+        for tier_name, seconds, label in _HORIZONS:
+            tier = self._tiers[tier_name]
+            n = tier.since(now - seconds)
+            if not n or now - tier.timestamps(n)[0] <= covered:
+                continue
+            covered = now - tier.timestamps(n)[0]
+            counts = tier.counts(n)
+            metrics = []
+            for metric in _METRICS:
+                avg = float((tier.view(metric, "avg", n) * counts).sum() / counts.sum())
+                peak = float(tier.view(metric, "max", n).max())
+                metrics.append(f"{metric} avg {avg:.0f}, peak {peak:.0f}")
+            parts.append(f"за {label}: " + ", ".join(metrics))
+        return "; ".join(parts)
+
     def __len__(self) -> int:
         return len(self._buffer)
 
 
 class IncidentMemory:
-    """SQLite-хранилище fingerprints инцидентов с pattern matching."""
-
-    def __init__(self, db_path: str = "edp_incidents.db"):
+    """
+    SQLite-хранилище fingerprints инцидентов с pattern matching.
+    Одно долгоживущее WAL-соединение + in-memory индекс fingerprints:
+    запись идёт в БД и сразу в индекс (write-through), match() диск не трогает.
+    Retention: повторы инцидента копятся в hit_count, компакция удаляет
+    старое, сливает почти-дубликаты и держит БД в пределах max_rows.
+    """
+
+    def __init__(self, db_path: str = "edp_incidents.db",
+                 max_rows: int = _MAX_ROWS, max_age_days: float = _MAX_AGE_DAYS,
+                 merge_similarity: float = _MERGE_SIMILARITY):
+        """
+        Args:
+            max_rows: сколько инцидентов хранить; лишние вытесняются
+                      (неподтверждённые и редкие — первыми). 0 — без лимита.
+            max_age_days: неподтверждённые инциденты старше удаляются. 0 — без лимита.
+            merge_similarity: при компакции дубликаты с таким сходством
+                              сливаются в одну запись с hit_count.
+        """
         self._db_path = db_path
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        self.merge_similarity = merge_similarity
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._saves_since_compact = 0
+        # Стартовая компакция откладывается до первой записи — не в конструкторе
+        self._compact_pending = True
+        self._merge_cursor = 0      # С какого бакета продолжить слияние
+        # Векторизованный индекс fingerprints; загружается один раз при старте
+        self._index = FingerprintIndex(_DIRECTIONS)
         self._init_db()
+        # Просроченное удаляем ещё в SQL — загрузка не растёт вместе с историей
+        self._expire()
+        for fp in self._load_all():
+            self._index.upsert(fp)
 
     def _init_db(self):
-        """Создаёт таблицу если не существует."""
+        """Открывает соединение и создаёт таблицу если не существует."""
         try:
-            conn = sqlite3.connect(self._db_path)
-            conn.execute("""
+            # Pipeline живёт в GUI-потоке, но close() может прийти из aboutToQuit
+            self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
                 CREATE TABLE IF NOT EXISTS incident_memory (
                     id TEXT PRIMARY KEY,
                     timestamp TEXT NOT NULL,
@@ -121,80 +263,238 @@ class IncidentMemory:
                     outcome_source TEXT DEFAULT 'auto',
                     resolution TEXT,
                     resolution_worked INTEGER DEFAULT 0,
-                    match_threshold REAL DEFAULT 0.75
+                    match_threshold REAL DEFAULT 0.75,
+                    hit_count INTEGER DEFAULT 1,
+                    last_seen TEXT
                 )
             """)
-            conn.commit()
-            conn.close()
+            # Миграция БД, созданных до retention
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(incident_memory)")}
+            if "hit_count" not in columns:
+                self._conn.execute("ALTER TABLE incident_memory ADD COLUMN hit_count INTEGER DEFAULT 1")
+            if "last_seen" not in columns:
+                self._conn.execute("ALTER TABLE incident_memory ADD COLUMN last_seen TEXT")
+            self._conn.commit()
         except Exception as e:
             logger.error(f"IncidentMemory DB init error: {e}")
 
     def save_incident(self, fingerprint: IncidentFingerprint):
-        """Сохраняет fingerprint инцидента в БД."""
+        """Сохраняет fingerprint инцидента в БД и индекс."""
+        if self._compact_pending:
+            self.compact()
         try:
-            conn = sqlite3.connect(self._db_path)
-            conn.execute(
-                """INSERT OR REPLACE INTO incident_memory
-                   (id, timestamp, pattern, deviations, outcome, outcome_source,
-                    resolution, resolution_worked, match_threshold)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                (
-                    fingerprint.id,
-                    fingerprint.timestamp.isoformat(),
-                    json.dumps(fingerprint.pattern, ensure_ascii=False),
-                    json.dumps(fingerprint.deviations, ensure_ascii=False),
-                    fingerprint.outcome,
-                    fingerprint.outcome_source,
-                    fingerprint.resolution,
-                    1 if fingerprint.resolution_worked else 0,
-                    fingerprint.match_threshold,
-                ),
-            )
-            conn.commit()
-            conn.close()
+            with self._lock, self._conn:
+                self._conn.execute(
+                    """INSERT OR REPLACE INTO incident_memory
+                       (id, timestamp, pattern, deviations, outcome, outcome_source,
+                        resolution, resolution_worked, match_threshold, hit_count, last_seen)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (
+                        fingerprint.id,
+                        fingerprint.timestamp.isoformat(),
+                        json.dumps(fingerprint.pattern, ensure_ascii=False),
+                        json.dumps(fingerprint.deviations, ensure_ascii=False),
+                        fingerprint.outcome,
+                        fingerprint.outcome_source,
+                        fingerprint.resolution,
+                        1 if fingerprint.resolution_worked else 0,
+                        fingerprint.match_threshold,
+                        fingerprint.hit_count,
+                        fingerprint.last_seen.isoformat() if fingerprint.last_seen else None,
+                    ),
+                )
+                self._index.upsert(fingerprint)
             logger.info(f"Incident saved: {fingerprint.id} ({fingerprint.outcome})")
         except Exception as e:
             logger.error(f"IncidentMemory save error: {e}")
+            return
 
-    def match(self, current_pattern: dict, current_deviations: dict) -> list[IncidentMatch]:
-        """Сравнивает текущую ситуацию со всеми сохранёнными инцидентами."""
-        incidents = self._load_all()
-        matches = []
+        self._saves_since_compact += 1
+        if self._saves_since_compact >= _COMPACT_EVERY:
+            self.compact()
 
-        for fp in incidents:
-            similarity = self._calculate_similarity(current_pattern, fp.pattern,
-                                                     current_deviations, fp.deviations)
-            if similarity >= fp.match_threshold:
-                msg = (
-                    f"Совпадение {similarity:.0%} с инцидентом от "
-                    f"{fp.timestamp.strftime('%d.%m.%Y %H:%M')}. "
-                    f"Тогда это был: {fp.outcome}"
+    def record_hit(self, incident_id: str, when: datetime):
+        """Повтор известного инцидента: +1 к hit_count вместо новой записи."""
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    """UPDATE incident_memory
+                       SET hit_count = hit_count + 1, last_seen = ?
+                       WHERE id = ?""",
+                    (when.isoformat(), incident_id),
                 )
-                matches.append(IncidentMatch(
-                    fingerprint=fp,
-                    similarity=similarity,
-                    message=msg,
-                ))
+                fp = self._index.get(incident_id)
+                if fp is not None:
+                    fp.hit_count += 1
+                    fp.last_seen = when
+        except Exception as e:
+            logger.error(f"IncidentMemory hit error: {e}")
+
+    def match(self, current_pattern: dict, current_deviations: dict) -> list[IncidentMatch]:
+        """Сравнивает текущую ситуацию со всеми сохранёнными инцидентами (из индекса)."""
+        matches = []
 
-        return sorted(matches, key=lambda m: m.similarity, reverse=True)
+        # Один векторизованный проход по всем инцидентам с фильтром по match_threshold
+        for fp, similarity in self._index.match(current_pattern, current_deviations):
+            msg = (
+                f"Совпадение {similarity:.0%} с инцидентом от "
+                f"{fp.timestamp.strftime('%d.%m.%Y %H:%M')}. "
+                f"Тогда это был: {fp.outcome}"
+            )
+            matches.append(IncidentMatch(
+                fingerprint=fp,
+                similarity=similarity,
+                message=msg,
+            ))
+
+        # При равном сходстве — более свежий инцидент первым
+        return sorted(matches, key=lambda m: (m.similarity, m.fingerprint.timestamp),
+                      reverse=True)
+
+    def find_similar(self, pattern: dict, deviations: dict,
+                     min_similarity: float = 0.9) -> Optional[IncidentFingerprint]:
+        """Ближайший инцидент со сходством > min_similarity (дедупликация)."""
+        best = self._index.most_similar(pattern, deviations, min_similarity)
+        return best[0] if best else None
 
     def update_outcome(self, incident_id: str, outcome: str,
                        resolution: Optional[str] = None,
-                       resolution_worked: bool = False):
-        """Обновляет outcome инцидента после разбора."""
+                       resolution_worked: bool = False,
+                       outcome_source: Optional[str] = None):
+        """Обновляет outcome инцидента после разбора (outcome_source — если задан)."""
         try:
-            conn = sqlite3.connect(self._db_path)
-            conn.execute(
-                """UPDATE incident_memory
-                   SET outcome = ?, resolution = ?, resolution_worked = ?
-                   WHERE id = ?""",
-                (outcome, resolution, 1 if resolution_worked else 0, incident_id),
-            )
-            conn.commit()
-            conn.close()
+            with self._lock, self._conn:
+                self._conn.execute(
+                    """UPDATE incident_memory
+                       SET outcome = ?, resolution = ?, resolution_worked = ?,
+                           outcome_source = COALESCE(?, outcome_source)
+                       WHERE id = ?""",
+                    (outcome, resolution, 1 if resolution_worked else 0,
+                     outcome_source, incident_id),
+                )
+                fp = self._index.get(incident_id)
+                if fp is not None:
+                    fp.outcome = outcome
+                    fp.resolution = resolution
+                    fp.resolution_worked = resolution_worked
+                    if outcome_source is not None:
+                        fp.outcome_source = outcome_source
         except Exception as e:
             logger.error(f"IncidentMemory update error: {e}")
 
+    # --- Retention ---
+
+    def _expire(self):
+        """Удаляет неподтверждённые инциденты старше max_age_days прямо в SQL."""
+        if not self.max_age_days:
+            return
+        cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    """DELETE FROM incident_memory
+                       WHERE COALESCE(last_seen, timestamp) < ?
+                         AND resolution_worked = 0
+                         AND COALESCE(outcome_source, '') != 'user_feedback'""",
+                    (cutoff,),
+                )
+        except Exception as e:
+            logger.error(f"IncidentMemory expire error: {e}")
+
+    @staticmethod
+    def _keep_rank(fp: IncidentFingerprint) -> tuple:
+        """Чем больше, тем ценнее запись: подтверждённые, частые, свежие."""
+        return (fp.is_confirmed, fp.hit_count, fp.last_seen or fp.timestamp)
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """
+        Retention-проход: возраст → слияние дубликатов → лимит строк.
+        Подтверждённые (resolution_worked / user_feedback) инциденты не
+        удаляются по возрасту и вытесняются по лимиту последними.
+        Слияние ограничено _MERGE_BUDGET сравнениями: если бюджет кончился,
+        следующий вызов продолжит со следующего бакета.
+        Возвращает число удалённых записей.
+        """
+        self._saves_since_compact = 0
+        self._compact_pending = False
+        now = now or datetime.now()
+        removed: set[str] = set()
+        updated: dict[str, IncidentFingerprint] = {}
+
+        # 1. Возраст
+        if self.max_age_days:
+            cutoff = now - timedelta(days=self.max_age_days)
+            for fp in self._index:
+                if not fp.is_confirmed and (fp.last_seen or fp.timestamp) < cutoff:
+                    removed.add(fp.id)
+
+        # 2. Слияние почти-дубликатов внутри бакета с одинаковым паттерном:
+        # хранитель сравнивается со всем остатком бакета одним проходом индекса
+        buckets = self._index.buckets()
+        budget = _MERGE_BUDGET
+        for step in range(len(buckets)):
+            if budget <= 0:
+                break
+            position = (self._merge_cursor + step) % len(buckets)
+            self._merge_cursor = position + 1
+            group = sorted((row for row in buckets[position]
+                            if self._index.at(row).id not in removed),
+                           key=lambda row: self._keep_rank(self._index.at(row)), reverse=True)
+            rows = np.array(group, dtype=np.int64)
+            confirmed = np.array([self._index.at(row).is_confirmed for row in rows], dtype=bool)
+            while len(rows) > 1 and budget > 0:
+                keeper, rest = self._index.at(rows[0]), rows[1:]
+                scores = self._index.similarities(keeper.pattern, keeper.deviations, rest)
+                budget -= len(rest)
+                duplicates = (scores >= self.merge_similarity) & ~confirmed[1:]
+                for row in rest[duplicates]:
+                    fp = self._index.at(row)
+                    keeper.hit_count += fp.hit_count
+                    seen = fp.last_seen or fp.timestamp
+                    if keeper.last_seen is None or seen > keeper.last_seen:
+                        keeper.last_seen = seen
+                    removed.add(fp.id)
+                    updated[keeper.id] = keeper
+                rows, confirmed = rest[~duplicates], confirmed[1:][~duplicates]
+
+        # 3. Лимит строк: вытесняем наименее ценные
+        alive = [fp for fp in self._index if fp.id not in removed]
+        if self.max_rows and len(alive) > self.max_rows:
+            alive.sort(key=self._keep_rank)
+            for fp in alive[:len(alive) - self.max_rows]:
+                removed.add(fp.id)
+                updated.pop(fp.id, None)
+
+        if not removed and not updated:
+            return 0
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "DELETE FROM incident_memory WHERE id = ?",
+                    [(incident_id,) for incident_id in removed],
+                )
+                self._conn.executemany(
+                    "UPDATE incident_memory SET hit_count = ?, last_seen = ? WHERE id = ?",
+                    [(fp.hit_count, fp.last_seen.isoformat() if fp.last_seen else None, fp.id)
+                     for fp in updated.values()],
+                )
+                for incident_id in removed:
+                    self._index.remove(incident_id)
+        except Exception as e:
+            logger.error(f"IncidentMemory compact error: {e}")
+            return 0
+
+        if removed:
+            logger.info(f"Incident Memory compacted: -{len(removed)} records, {len(self._index)} left")
+        return len(removed)
+
+    def close(self):
+        """Закрывает соединение с БД (при выходе из приложения)."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
     def create_fingerprint(self, snapshot: MetricSnapshot,
                            outcome: str = "unknown",
                            outcome_source: str = "auto") -> IncidentFingerprint:
@@ -209,12 +509,14 @@ class IncidentMemory:
         )
 
     def _load_all(self) -> list[IncidentFingerprint]:
-        """Загружает все инциденты из БД."""
+        """Загружает все инциденты из БД (один раз — для построения индекса)."""
         try:
-            conn = sqlite3.connect(self._db_path)
-            cursor = conn.execute("SELECT * FROM incident_memory ORDER BY timestamp DESC")
-            rows = cursor.fetchall()
-            conn.close()
+            with self._lock:
+                rows = self._conn.execute(
+                    """SELECT id, timestamp, pattern, deviations, outcome, outcome_source,
+                              resolution, resolution_worked, match_threshold, hit_count, last_seen
+                       FROM incident_memory ORDER BY timestamp DESC"""
+                ).fetchall()
 
             return [
                 IncidentFingerprint(
@@ -227,6 +529,8 @@ class IncidentMemory:
                     resolution=row[6],
                     resolution_worked=bool(row[7]),
                     match_threshold=row[8],
+                    hit_count=row[9] or 1,
+                    last_seen=datetime.fromisoformat(row[10]) if row[10] else None,
                 )
                 for row in rows
             ]
@@ -240,6 +544,7 @@ class IncidentMemory:
         """
         Вычисляет сходство двух инцидентов.
         Комбинация: совпадение направлений (70%) + близость отклонений (30%).
+        Эталон для FingerprintIndex.similarities (пакетный расчёт в match).
         """
         # 1. Direction matching (70% веса)
         common_keys = set(pattern_a.keys()) & set(pattern_b.keys())
@@ -269,11 +574,4 @@ class IncidentMemory:
     @property
     def count(self) -> int:
         """Количество сохранённых инцидентов."""
-        try:
-            conn = sqlite3.connect(self._db_path)
-            cursor = conn.execute("SELECT COUNT(*) FROM incident_memory")
-            result = cursor.fetchone()[0]
-            conn.close()
-            return result
-        except Exception:
-            return 0
+        return len(self._index)
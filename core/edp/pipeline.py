@@ -17,6 +17,7 @@ from typing import Optional
 
 from core.edp.bus import EDPBus
 from core.edp.correlator import Correlator
+from core.edp.rules import RuleWatcher
 from core.edp.memory import IncidentMemory, TemporalMemory
 from core.edp.server_dna import ServerDNA
 from core.edp.types import (
@@ -43,19 +44,42 @@ class PipelineResult:
 class EDPPipeline:
     """4-стадийный Pipeline обработки данных."""
 
-    def __init__(self, data_dir: str = ""):
+    def __init__(self, data_dir: str = "", dna_granularity: str = "hour",
+                 dna_decay: str = "window", dna_halflife: float = 250.0,
+                 dna_quantile_metrics: tuple = (),
+                 incident_max_rows: int = 5000, incident_max_age_days: float = 180,
+                 rules_path: str = ""):
         """
         Args:
             data_dir: директория для persistence (DNA, incidents).
                       Пустая строка — без persistence.
+            dna_granularity / dna_decay / dna_halflife / dna_quantile_metrics:
+                      настройки базлайнов ServerDNA.
+            incident_max_rows / incident_max_age_days: retention Incident Memory.
+            rules_path: YAML/JSON-файл правил корреляции; перечитывается
+                        при изменении. Пустая строка — только встроенные правила.
         """
-        dna_path = os.path.join(data_dir, "server_dna.json") if data_dir else ""
+        dna_path = os.path.join(data_dir, "server_dna.bin") if data_dir else ""
+        legacy_dna_path = os.path.join(data_dir, "server_dna.json") if data_dir else ""
         incidents_db = os.path.join(data_dir, "edp_incidents.db") if data_dir else "edp_incidents.db"
 
-        self.dna = ServerDNA(persist_path=dna_path)
+        self.dna = ServerDNA(
+            persist_path=dna_path,
+            legacy_path=legacy_dna_path,
+            granularity=dna_granularity,
+            decay=dna_decay,
+            halflife=dna_halflife,
+            quantile_metrics=tuple(dna_quantile_metrics),
+        )
         self.temporal = TemporalMemory(max_size=360)
-        self.incidents = IncidentMemory(db_path=incidents_db)
+        self.incidents = IncidentMemory(
+            db_path=incidents_db,
+            max_rows=incident_max_rows,
+            max_age_days=incident_max_age_days,
+        )
         self.correlator = Correlator()
+        self._rule_watcher = RuleWatcher(rules_path) if rules_path else None
+        self._reload_rules(force=True)
         self.bus = EDPBus()
 
         self._prev_probes: list[str] = []
@@ -104,11 +128,12 @@ class EDPPipeline:
             risk_data=risk_data,
         )
 
-        # Публикуем через Bus
-        self.bus.publish(snapshot)
-        self.bus.publish_many(events)
-        for match in incident_matches:
-            self.bus.publish(match)
+        # Публикуем через Bus одним тиком: batch/latest-подписчики
+        # получают по одному вызову на цикл
+        with self.bus.batch():
+            self.bus.publish(snapshot)
+            self.bus.publish_many(events)
+            self.bus.publish_many(incident_matches)
 
         return result
 
@@ -141,13 +166,13 @@ class EDPPipeline:
         """Стадия 2: обогащение через Server DNA + вычисление дельт."""
         # На этом этапе текущий snapshot ещё НЕ в temporal → last = предыдущий
         prev = self.temporal.last
-        hour = snapshot.timestamp.hour
+        when = snapshot.timestamp
 
         for metric_name in ("cpu", "ram", "pps", "jitter"):
             raw_val = getattr(snapshot, metric_name).value
 
             # Server DNA оценка
-            enriched = self.dna.evaluate(metric_name, raw_val, hour)
+            enriched = self.dna.evaluate(metric_name, raw_val, when=when)
 
             # Вычисляем дельту относительно предыдущего замера
             if prev:
@@ -161,14 +186,23 @@ class EDPPipeline:
                     enriched.pct_change = 0.0 if raw_val == 0 else 100.0
 
             # Обновляем DNA
-            self.dna.update(metric_name, raw_val, hour)
+            self.dna.update(metric_name, raw_val, when=when)
 
             setattr(snapshot, metric_name, enriched)
 
         return snapshot
 
+    def _reload_rules(self, force: bool = False):
+        """Подхватывает изменения файла правил (stat не чаще раза в пару секунд)."""
+        if self._rule_watcher is None:
+            return
+        rules = self._rule_watcher.poll(force=force)
+        if rules is not None:
+            self.correlator.set_file_rules(rules)
+
     def _correlate(self, snapshot: MetricSnapshot) -> list[ThreatEvent]:
         """Стадия 3: проверка правил корреляции."""
+        self._reload_rules()
         prev = self.temporal.last  # Предыдущий (ещё не добавлен текущий)
 
         events = self.correlator.evaluate(snapshot, prev)
@@ -213,14 +247,19 @@ class EDPPipeline:
                     f"best: {matches[0].similarity:.0%}"
                 )
 
-            # Сохраняем новый инцидент, если есть correlation events
-            # и нет close match (чтобы не дублировать)
-            if has_correlations and not any(m.similarity > 0.9 for m in matches):
-                outcome = events[0].rule_id if events else "unknown"
-                fp = self.incidents.create_fingerprint(
-                    snapshot, outcome=outcome, outcome_source="auto"
-                )
-                self.incidents.save_incident(fp)
+            # Сохраняем новый инцидент, если есть correlation events.
+            # Close match (по всем инцидентам, а не только прошедшим свой
+            # match_threshold) не дублируется — у него растёт hit_count.
+            if has_correlations:
+                similar = self.incidents.find_similar(pattern, deviations, 0.9)
+                if similar is not None:
+                    self.incidents.record_hit(similar.id, snapshot.timestamp)
+                else:
+                    outcome = events[0].rule_id if events else "unknown"
+                    fp = self.incidents.create_fingerprint(
+                        snapshot, outcome=outcome, outcome_source="auto"
+                    )
+                    self.incidents.save_incident(fp)
 
         return matches
 
@@ -250,12 +289,21 @@ class EDPPipeline:
         return AIContext(
             anomalies=anomalies,
             correlations=events,
-            server_dna_summary=self.dna.get_summary(snapshot.timestamp.hour),
-            history_summary=self.temporal.get_summary(),
+            server_dna_summary=self.dna.get_summary(when=snapshot.timestamp),
+            history_summary="; ".join(
+                part for part in (self.temporal.get_summary(),
+                                  self.temporal.get_horizon_summary()) if part
+            ),
             incident_matches=matches,
             raw_metrics=snapshot.to_raw_dict(),
         )
 
+    def close(self):
+        """Дожидается доставки Bus, сбрасывает DNA на диск и закрывает БД инцидентов."""
+        self.bus.close()
+        self.dna.save()
+        self.incidents.close()
+
     def get_ai_context(self) -> Optional[AIContext]:
         """Возвращает последний AI Context (для внешнего использования)."""
         last = self.temporal.last
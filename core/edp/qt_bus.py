@@ -0,0 +1,64 @@
+"""
+EDP Qt Bus — доставка событий EDPBus в поток Qt-объекта (обычно GUI).
+Подписка синхронная и дешёвая: событие кладётся в ограниченную очередь
+адаптера, а Qt-сигнал будит слот в потоке адаптера не чаще одного раза
+на пачку. UI не вызывается из чужих потоков, publish из потока адаптера
+не выполняет callback синхронно, а медленный UI не копит бесконечную
+очередь событий Qt.
+"""
+
+import logging
+import threading
+from typing import Callable
+
+from PySide6.QtCore import QObject, Qt, Signal, Slot
+
+from core.edp.bus import EDPBus, SubscriberQueue
+
+logger = logging.getLogger(__name__)
+
+
+class QtBusAdapter(QObject):
+    """Маршалинг подписки EDPBus в поток, которому принадлежит адаптер."""
+
+    _wake = Signal()
+
+    def __init__(self, bus: EDPBus, event_type, callback: Callable,
+                 max_queue: int = 100, policy: str = "drop_oldest",
+                 per_tick: str = "each", parent=None):
+        super().__init__(parent)
+        self._callback = callback
+        self._queue = SubscriberQueue(max_queue, policy)
+        self._lock = threading.Lock()
+        self._pending = False
+        # Всегда через очередь событий: и из чужого потока, и из своего
+        # (пайплайн публикует из GUI-потока) — publish не ждёт подписчика
+        self._wake.connect(self._flush, Qt.ConnectionType.QueuedConnection)
+        self.subscription = bus.subscribe(event_type, self._enqueue, per_tick=per_tick)
+
+    def _enqueue(self, event):
+        """Вызывается в потоке publish: только очередь + один сигнал на пачку."""
+        self._queue.put(event)
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        self._wake.emit()
+
+    @Slot()
+    def _flush(self):
+        with self._lock:
+            self._pending = False
+        for event in self._queue.take_all():
+            try:
+                self._callback(event)
+            except Exception as e:
+                logger.error(f"EDP Qt Bus delivery error: {e}")
+
+    @property
+    def dropped(self) -> int:
+        return self._queue.dropped
+
+    def detach(self, bus: EDPBus):
+        """Отписывает адаптер от шины."""
+        bus.unsubscribe(self.subscription)
@@ -0,0 +1,251 @@
+"""
+EDP Rules — декларативные правила корреляции из YAML/JSON.
+Файл разбирается один раз: каждое условие компилируется в предикат
+(attrgetter + operator), одинаковые условия разных правил — один и тот же
+объект, поэтому Correlator вычисляет их один раз за тик. RuleWatcher
+перечитывает файл при изменении — пороги меняются без перезапуска.
+
+Формат (JSON или YAML):
+
+    rules:
+      - id: dpi_throttling
+        name: DPI Throttling
+        severity: high
+        description: PPS падает, jitter растёт, пользователи на месте
+        when:
+          - pps.pct_change < -30
+          - jitter.pct_change > 100
+          - abs(users_delta) <= 1
+
+Поля: {cpu,ram,pps,jitter}.{value,delta,pct_change,baseline,deviation},
+users_count, users_delta, probes и new_probes (количество).
+Условие можно записать и словарём: {field: pps.deviation, op: ">", value: 3}.
+
+Оконные условия (состояние хранится в Correlator, история не пересканируется):
+
+          - sustained: jitter.pct_change > 50      # 5 тиков подряд
+            ticks: 5
+          - count: new_probes >= 1                 # 3 раза за 5 минут
+            at_least: 3
+            seconds: 300
+          - first: new_probes >= 3                 # PPS spike не позже 60 с после проб
+            then: pps.pct_change > 100
+            within: 60
+"""
+
+import json
+import logging
+import operator
+import os
+import re
+import time
+from typing import Optional
+
+from core.edp.correlator import CorrelationRule, CountInWindow, FollowedBy, Sustained
+
+# PyYAML опционален: без него читаются только JSON-файлы
+try:
+    import yaml
+    _HAS_YAML = True
+except ImportError:
+    _HAS_YAML = False
+
+logger = logging.getLogger(__name__)
+
+_METRICS = ("cpu", "ram", "pps", "jitter")
+_METRIC_FIELDS = ("value", "delta", "pct_change", "baseline", "deviation")
+_SEVERITIES = ("critical", "high", "medium", "low", "info")
+
+_OPS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+_CONDITION_RE = re.compile(
+    r"^\s*(?:abs\(\s*(?P<abs_field>[a-z_.]+)\s*\)|(?P<field>[a-z_.]+))"
+    r"\s*(?P<op><=|>=|==|!=|<|>)\s*(?P<value>[-+]?\d+(?:\.\d+)?)\s*$"
+)
+
+# Интернированные предикаты: (поле, abs, op, порог) → callable
+_PREDICATES: dict[tuple, object] = {}
+
+
+class RuleFormatError(ValueError):
+    """Файл правил не разобран (синтаксис, неизвестное поле или оператор)."""
+
+
+def _getter(field: str):
+    """Извлекатель числа из снэпшота для имени поля."""
+    if field in ("probes", "new_probes"):
+        return lambda snap: len(getattr(snap, field))
+    if field in ("users_count", "users_delta"):
+        return operator.attrgetter(field)
+    metric, _, attr = field.partition(".")
+    if metric in _METRICS and attr in _METRIC_FIELDS:
+        return operator.attrgetter(field)
+    raise RuleFormatError(f"unknown field: {field}")
+
+
+def compile_condition(field: str, op: str, value: float, use_abs: bool = False):
+    """Предикат callable(snapshot, prev) -> bool; одинаковые условия — один объект."""
+    if op not in _OPS:
+        raise RuleFormatError(f"unknown operator: {op}")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise RuleFormatError(f"threshold is not a number: {value!r}") from None
+
+    key = (field, use_abs, op, value)
+    predicate = _PREDICATES.get(key)
+    if predicate is not None:
+        return predicate
+
+    get = _getter(field)
+    compare = _OPS[op]
+    if use_abs:
+        def predicate(snap, prev):
+            return compare(abs(get(snap)), value)
+    else:
+        def predicate(snap, prev):
+            return compare(get(snap), value)
+    predicate.__name__ = f"abs({field}) {op} {value:g}" if use_abs else f"{field} {op} {value:g}"
+    _PREDICATES[key] = predicate
+    return predicate
+
+
+def _parse_condition(raw):
+    if isinstance(raw, str):
+        match = _CONDITION_RE.match(raw)
+        if not match:
+            raise RuleFormatError(f"bad condition: {raw!r}")
+        use_abs = match.group("abs_field") is not None
+        field = match.group("abs_field") or match.group("field")
+        return compile_condition(field, match.group("op"), match.group("value"), use_abs)
+    if isinstance(raw, dict) and raw.keys() & {"sustained", "count", "first"}:
+        return _parse_window(raw)
+    if isinstance(raw, dict):
+        try:
+            return compile_condition(raw["field"], raw["op"], raw["value"], bool(raw.get("abs", False)))
+        except KeyError as e:
+            raise RuleFormatError(f"condition without {e}: {raw!r}") from None
+    raise RuleFormatError(f"bad condition: {raw!r}")
+
+
+def _parse_window(raw: dict):
+    """Оконный оператор; новый объект на каждый разбор — состояние у каждого своё."""
+    try:
+        if "sustained" in raw:
+            return Sustained(_parse_condition(raw["sustained"]),
+                             ticks=int(raw.get("ticks", 0)), seconds=float(raw.get("seconds", 0)))
+        if "count" in raw:
+            return CountInWindow(_parse_condition(raw["count"]), count=int(raw["at_least"]),
+                                 ticks=int(raw.get("ticks", 0)), seconds=float(raw.get("seconds", 0)))
+        return FollowedBy(_parse_condition(raw["first"]), _parse_condition(raw["then"]),
+                          seconds=float(raw["within"]))
+    except RuleFormatError:
+        raise
+    except KeyError as e:
+        raise RuleFormatError(f"window condition without {e}: {raw!r}") from None
+    except (TypeError, ValueError) as e:
+        raise RuleFormatError(f"bad window condition {raw!r}: {e}") from None
+
+
+def parse_rules(data) -> list[CorrelationRule]:
+    """Правила из уже разобранного JSON/YAML (словарь с ключом rules или список)."""
+    if isinstance(data, dict):
+        data = data.get("rules", [])
+    if not isinstance(data, list):
+        raise RuleFormatError("expected a list of rules")
+
+    rules, seen = [], set()
+    for raw in data:
+        if not isinstance(raw, dict) or not raw.get("id"):
+            raise RuleFormatError(f"rule without id: {raw!r}")
+        rule_id = str(raw["id"])
+        if rule_id in seen:
+            raise RuleFormatError(f"duplicate rule id: {rule_id}")
+        seen.add(rule_id)
+
+        severity = raw.get("severity", "medium")
+        if severity not in _SEVERITIES:
+            raise RuleFormatError(f"rule {rule_id}: unknown severity {severity!r}")
+        conditions = raw.get("when") or []
+        if not isinstance(conditions, list) or not conditions:
+            raise RuleFormatError(f"rule {rule_id}: empty 'when'")
+
+        rules.append(CorrelationRule(
+            rule_id=rule_id,
+            name=str(raw.get("name", rule_id)),
+            severity=severity,
+            description=str(raw.get("description", "")),
+            conditions=[_parse_condition(cond) for cond in conditions],
+        ))
+    return rules
+
+
+def load_rules(path: str) -> list[CorrelationRule]:
+    """Читает и компилирует файл правил (.yaml/.yml — YAML, иначе JSON)."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        if not _HAS_YAML:
+            raise RuleFormatError("PyYAML is not installed, use a .json rules file")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise RuleFormatError(f"YAML error: {e}") from None
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise RuleFormatError(f"JSON error: {e}") from None
+    return parse_rules(data or [])
+
+
+class RuleWatcher:
+    """
+    Следит за файлом правил по mtime/size. poll() дёшев (один stat не чаще
+    раза в check_interval секунд) и вызывается из тика пайплайна.
+    """
+
+    def __init__(self, path: str, check_interval: float = 2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._signature: Optional[tuple] = None
+        self._last_check: Optional[float] = None
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def poll(self, force: bool = False) -> Optional[list[CorrelationRule]]:
+        """
+        Новый список правил, если файл изменился; иначе None.
+        Удалённый файл — пустой список; битый файл — None (правила не меняются).
+        """
+        now = time.monotonic()
+        if not force and self._last_check is not None and now - self._last_check < self.check_interval:
+            return None
+        self._last_check = now
+
+        signature = self._stat()
+        if signature == self._signature:
+            return None
+        self._signature = signature
+        if signature is None:
+            logger.info(f"Rules file removed: {self.path}")
+            return []
+        try:
+            rules = load_rules(self.path)
+        except (OSError, RuleFormatError) as e:
+            logger.error(f"Rules file {self.path} not loaded: {e}")
+            return None
+        logger.info(f"Rules loaded from {self.path}: {len(rules)}")
+        return rules
@@ -1,6 +1,7 @@
 """
 EDP Server DNA — поведенческий профиль сервера.
-Автоматически строит базлайны (среднее + σ) для каждой метрики по часу дня.
+Автоматически строит базлайны (среднее + σ) для каждой метрики по слоту времени:
+час дня, час × день недели или 15-минутный интервал.
 Определяет является ли текущее значение нормой, повышенным или аномалией.
 """
 
@@ -9,7 +10,10 @@ import logging
 import math
 import os
 from datetime import datetime
+from typing import Optional
 
+from core.edp import dna_store
+from core.edp.stats import EwmaStats, QuantileSketch, RollingWindow
 from core.edp.types import MetricValue
 
 logger = logging.getLogger(__name__)
@@ -17,58 +21,147 @@ logger = logging.getLogger(__name__)
 # Минимум замеров перед тем как начать выдавать verdict != "normal"
 _MIN_SAMPLES = 10
 
+# Размер скользящего окна на слот
+_WINDOW_SIZE = 500
+
+# Гранулярность базлайна → количество слотов на метрику
+GRANULARITIES = {
+    "hour": 24,             # Час дня (исходное поведение)
+    "weekday_hour": 168,    # Час × день недели: выходные не портят будни
+    "quarter_hour": 96,     # 15-минутные интервалы суток
+}
+
+# Способ забывания старых замеров
+DECAY_MODES = ("window", "ewma")
+
+# Перцентильные полосы для метрик с quantile-скетчем: нижние p1/p5
+# ловят резкое падение (PPS при throttling), верхние p95/p99 — всплеск
+_QUANTILES = (0.01, 0.05, 0.5, 0.95, 0.99)
+
+_WEEKDAYS = ("пн", "вт", "ср", "чт", "пт", "сб", "вс")
+
+
+def slot_index(granularity: str, when: datetime) -> int:
+    """Номер слота для момента времени."""
+    if granularity == "weekday_hour":
+        return when.weekday() * 24 + when.hour
+    if granularity == "quarter_hour":
+        return when.hour * 4 + when.minute // 15
+    return when.hour
+
+
+def slot_hour(granularity: str, index: int) -> int:
+    """Час дня, к которому относится слот."""
+    if granularity == "weekday_hour":
+        return index % 24
+    if granularity == "quarter_hour":
+        return index // 4
+    return index
+
+
+def slot_label(granularity: str, index: int) -> str:
+    """Человекочитаемое имя слота для сводки."""
+    if granularity == "weekday_hour":
+        return f"{_WEEKDAYS[index // 24]} {index % 24}:00"
+    if granularity == "quarter_hour":
+        return f"{index // 4}:{(index % 4) * 15:02d}"
+    return f"{index}:00"
+
 
 class ServerDNA:
-    """Поведенческий отпечаток сервера: учится что «нормально» для каждого часа."""
+    """Поведенческий отпечаток сервера: учится что «нормально» для каждого слота времени."""
 
-    def __init__(self, persist_path: str = ""):
-        # 24 слота (по часу), для каждой метрики храним список значений
-        self._data: dict[str, list[list[float]]] = {}
+    def __init__(self, persist_path: str = "", legacy_path: str = "",
+                 granularity: str = "hour", decay: str = "window",
+                 halflife: float = 250.0, quantile_metrics: tuple = ()):
+        """
+        Args:
+            persist_path: бинарный файл DNA Store.
+            legacy_path: старый server_dna.json — читается один раз для миграции,
+                         если бинарного файла ещё нет.
+            granularity: ключ из GRANULARITIES.
+            decay: "window" — последние 500 замеров слота поровну;
+                   "ewma" — экспоненциальное забывание, 2 float на слот.
+            halflife: для "ewma" — за сколько замеров слота вес падает вдвое.
+            quantile_metrics: метрики с тяжёлым хвостом (pps, jitter), которые
+                              оцениваются перцентильными полосами p1/p5/p50/p95/p99
+                              вместо mean ± σ.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown DNA granularity: {granularity}")
+        if decay not in DECAY_MODES:
+            raise ValueError(f"Unknown DNA decay mode: {decay}")
+        self.granularity = granularity
+        self.decay = decay
+        self._slots = GRANULARITIES[granularity]
+        self._alpha = EwmaStats.alpha_for_halflife(halflife)
+        self.quantile_metrics = frozenset(quantile_metrics)
+
+        # Для каждой метрики — слоты с инкрементальными mean/σ (окно или EWMA)
+        # либо P²-скетч квантилей
+        self._data: dict[str, list] = {}
         self._persist_path = persist_path
-        self._dirty = False
+        # Слоты, изменившиеся с последнего save: {(metric, slot), ...}
+        self._dirty_slots: set[tuple[str, int]] = set()
+        # Раскладка метрик в файле; None — файла нет или нужна полная перезапись
+        self._file_layout: list[str] | None = None
         self._update_counter = 0
         # Автосохранение каждые N обновлений
         self._save_every = 30
 
         if persist_path and os.path.exists(persist_path):
-            self._load()
+            self._load(persist_path)
+        elif persist_path and legacy_path and os.path.exists(legacy_path):
+            self._load(legacy_path)
+
+    def _new_slot(self, metric: str):
+        if metric in self.quantile_metrics:
+            return QuantileSketch(_QUANTILES)
+        if self.decay == "ewma":
+            return EwmaStats(self._alpha)
+        return RollingWindow(_WINDOW_SIZE)
 
     def _ensure_metric(self, metric: str):
         """Инициализирует хранилище для метрики если нужно."""
         if metric not in self._data:
-            self._data[metric] = [[] for _ in range(24)]
+            self._data[metric] = [self._new_slot(metric) for _ in range(self._slots)]
 
-    def update(self, metric: str, value: float, hour: int = -1):
-        """Добавляет значение метрики в профиль для текущего часа."""
-        if hour < 0:
-            hour = datetime.now().hour
-        self._ensure_metric(metric)
+    def _slot(self, hour: int, when: Optional[datetime]) -> int:
+        """Слот по явному времени, либо по часу (для остальных полей — сейчас)."""
+        if when is None:
+            if hour >= 0 and self.granularity == "hour":
+                return hour
+            when = datetime.now()
+            if hour >= 0:
+                when = when.replace(hour=hour)
+        return slot_index(self.granularity, when)
 
-        slot = self._data[metric][hour]
-        slot.append(value)
+    def update(self, metric: str, value: float, hour: int = -1,
+               when: Optional[datetime] = None):
+        """Добавляет значение метрики в профиль для текущего слота."""
+        idx = self._slot(hour, when)
+        self._ensure_metric(metric)
 
-        # Ограничиваем до 500 значений на слот (скользящее окно)
-        if len(slot) > 500:
-            self._data[metric][hour] = slot[-500:]
+        # Окно само вытесняет старые значения сверх 500, EWMA — плавно забывает
+        self._data[metric][idx].add(value)
 
-        self._dirty = True
+        self._dirty_slots.add((metric, idx))
         self._update_counter += 1
 
         if self._update_counter >= self._save_every:
             self._update_counter = 0
             self.save()
 
-    def evaluate(self, metric: str, value: float, hour: int = -1) -> MetricValue:
+    def evaluate(self, metric: str, value: float, hour: int = -1,
+                 when: Optional[datetime] = None) -> MetricValue:
         """Оценивает значение метрики относительно DNA-профиля."""
-        if hour < 0:
-            hour = datetime.now().hour
+        idx = self._slot(hour, when)
         self._ensure_metric(metric)
 
-        slot = self._data[metric][hour]
-        total_samples = len(slot)
+        slot = self._data[metric][idx]
 
         # Недостаточно данных — не делаем выводов
-        if total_samples < _MIN_SAMPLES:
+        if slot.count < _MIN_SAMPLES:
             return MetricValue(
                 value=value,
                 baseline=value,
@@ -76,9 +169,12 @@ class ServerDNA:
                 verdict="normal",
             )
 
-        mean = sum(slot) / total_samples
-        # Вычисляем стандартное отклонение
-        variance = sum((x - mean) ** 2 for x in slot) / total_samples
+        if isinstance(slot, QuantileSketch):
+            return self._evaluate_quantiles(slot, value)
+
+        # O(1): mean и σ поддерживаются слотом инкрементально при любой гранулярности
+        mean = slot.mean
+        variance = slot.variance
         std = math.sqrt(variance) if variance > 0 else 0.001  # Защита от деления на 0
 
         deviation = (value - mean) / std
@@ -98,20 +194,58 @@ class ServerDNA:
             verdict=verdict,
         )
 
-    def get_summary(self, hour: int = -1) -> str:
-        """Создаёт текстовую сводку DNA для текущего часа (для AI)."""
-        if hour < 0:
-            hour = datetime.now().hour
+    @staticmethod
+    def _evaluate_quantiles(slot: QuantileSketch, value: float) -> MetricValue:
+        """
+        Verdict по перцентильным полосам: выше p95 или ниже p5 — elevated,
+        выше p99 или ниже p1 — anomaly. deviation в тех же единицах, что и
+        σ-режим: ±1.0 на p95/p5, ±2.0 на p99/p1.
+        """
+        p1, p5, p50, p95, p99 = (slot.quantile(q) for q in _QUANTILES)
+        if value > p99:
+            deviation = 2.0 + (value - p99) / max(p99 - p95, 0.001)
+        elif value > p95:
+            deviation = 1.0 + (value - p95) / max(p99 - p95, 0.001)
+        elif value >= p50:
+            deviation = (value - p50) / max(p95 - p50, 0.001)
+        elif value >= p5:
+            deviation = (value - p50) / max(p50 - p5, 0.001)
+        elif value >= p1:
+            deviation = -1.0 + (value - p5) / max(p5 - p1, 0.001)
+        else:
+            deviation = -2.0 + (value - p1) / max(p5 - p1, 0.001)
+
+        if value > p99 or value < p1:
+            verdict = "anomaly"
+        elif value > p95 or value < p5:
+            verdict = "elevated"
+        else:
+            verdict = "normal"
+
+        return MetricValue(
+            value=value,
+            baseline=round(p50, 2),
+            deviation=round(deviation, 2),
+            verdict=verdict,
+        )
+
+    def get_summary(self, hour: int = -1, when: Optional[datetime] = None) -> str:
+        """Создаёт текстовую сводку DNA для текущего слота (для AI)."""
+        idx = self._slot(hour, when)
 
         parts = []
         for metric in ("cpu", "ram", "pps", "jitter"):
             if metric not in self._data:
                 continue
-            slot = self._data[metric][hour]
-            if len(slot) < _MIN_SAMPLES:
+            slot = self._data[metric][idx]
+            if slot.count < _MIN_SAMPLES:
                 continue
-            mean = sum(slot) / len(slot)
-            std = math.sqrt(sum((x - mean) ** 2 for x in slot) / len(slot))
+            if isinstance(slot, QuantileSketch):
+                p1, p5, p50, p95, p99 = (slot.quantile(q) for q in _QUANTILES)
+                parts.append(f"{metric}: p5={p5:.0f}, p50={p50:.0f}, p95={p95:.0f}, p99={p99:.0f}")
+                continue
+            mean = slot.mean
+            std = slot.std
             lo = max(0, mean - std)
             hi = mean + std
             parts.append(f"{metric}: {lo:.0f}-{hi:.0f} (σ={std:.1f})")
@@ -119,33 +253,70 @@ class ServerDNA:
         if not parts:
             return "Недостаточно данных для DNA-профиля (нужно ~10 замеров)"
 
-        return f"Обычно для {hour}:00: " + ", ".join(parts)
+        return f"Обычно для {slot_label(self.granularity, idx)}: " + ", ".join(parts)
 
     def save(self):
-        """Сохраняет DNA на диск."""
-        if not self._persist_path or not self._dirty:
+        """
+        Сохраняет DNA на диск. Обычно перезаписываются только изменившиеся
+        слоты; новая метрика или первая запись — полный файл через temp + rename.
+        """
+        if not self._persist_path:
+            return
+        layout = list(self._data)
+        if layout == self._file_layout and not self._dirty_slots:
             return
         try:
-            with open(self._persist_path, "w", encoding="utf-8") as f:
-                json.dump(self._data, f, ensure_ascii=False)
-            self._dirty = False
+            if layout != self._file_layout:
+                dna_store.write_full(self._persist_path, self._data)
+                self._file_layout = layout
+            else:
+                dna_store.write_slots(self._persist_path, self._data, self._dirty_slots)
+            self._dirty_slots.clear()
         except Exception as e:
+            # Раскладка файла неизвестна — следующий save пишет его целиком
+            self._file_layout = None
             logger.error(f"DNA save error: {e}")
 
-    def _load(self):
-        """Загружает DNA с диска."""
+    def _load(self, path: str):
+        """Загружает DNA с диска (бинарный формат или legacy JSON)."""
         try:
-            with open(self._persist_path, "r", encoding="utf-8") as f:
-                self._data = json.load(f)
+            if dna_store.is_dna_file(path):
+                slots, entries = dna_store.read_layout(path)
+                if slots != self._slots:
+                    # Сменили гранулярность — старый профиль несовместим
+                    raise dna_store.DNAFormatError(f"{slots} slots per metric != {self._slots}")
+                self._data, mismatched = dna_store.load(path, self._new_slot)
+                if path == self._persist_path and not mismatched:
+                    self._file_layout = [metric for metric, _, _ in entries]
+                return
+
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            self._data = {metric: self._from_hourly(metric, slots) for metric, slots in raw.items()}
+            logger.info(f"DNA migrated from JSON: {path}")
         except Exception as e:
             logger.warning(f"DNA load error, starting fresh: {e}")
             self._data = {}
 
+    def _from_hourly(self, metric: str, hourly: list[list[float]]) -> list:
+        """Слоты из почасовых списков значений (legacy JSON): час копируется во все свои слоты."""
+        slots = []
+        for idx in range(self._slots):
+            values = hourly[slot_hour(self.granularity, idx)]
+            slot = self._new_slot(metric)
+            if isinstance(slot, RollingWindow):
+                slot = RollingWindow.from_values(values, _WINDOW_SIZE)
+            else:
+                for v in values:
+                    slot.add(v)
+            slots.append(slot)
+        return slots
+
     @property
     def has_enough_data(self) -> bool:
         """Есть ли достаточно данных хотя бы для одной метрики."""
         for metric_slots in self._data.values():
             for slot in metric_slots:
-                if len(slot) >= _MIN_SAMPLES:
+                if slot.count >= _MIN_SAMPLES:
                     return True
         return False
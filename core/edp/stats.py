@@ -0,0 +1,270 @@
+"""
+EDP Stats — потоковая статистика для базлайнов.
+Скользящее окно фиксированного размера с Welford-аккумуляторами,
+экспоненциально взвешенные моменты (EWMA) и P²-оценка квантилей:
+добавление и чтение за O(1) без хранения сырых значений сверх окна.
+"""
+
+import math
+from array import array
+
+
+class RollingWindow:
+    """
+    Кольцевой буфер на N значений + running mean / M2 (Welford с удалением).
+    Семантика совпадает с «список последних N значений»: mean и
+    популяционная дисперсия считаются ровно по тем же значениям.
+    """
+
+    __slots__ = ("capacity", "_buf", "_head", "_count", "_mean", "_m2", "_evictions")
+
+    def __init__(self, capacity: int = 500):
+        self.capacity = capacity
+        self._buf = array("d", bytes(8 * capacity))
+        self._head = 0          # Индекс следующей записи
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0          # Сумма квадратов отклонений от mean
+        self._evictions = 0
+
+    def add(self, value: float):
+        """Добавляет значение; при переполнении вытесняет самое старое."""
+        value = float(value)
+        if self._count == self.capacity:
+            old = self._buf[self._head]
+            self._buf[self._head] = value
+            self._head = (self._head + 1) % self.capacity
+            # Замена old → value без изменения n
+            delta = value - old
+            new_mean = self._mean + delta / self._count
+            self._m2 += delta * (value - new_mean + old - self._mean)
+            self._mean = new_mean
+            self._evictions += 1
+            # Периодическая пересборка гасит накопленную ошибку округления
+            if self._evictions >= self.capacity:
+                self._recompute()
+        else:
+            self._buf[self._head] = value
+            self._head = (self._head + 1) % self.capacity
+            self._count += 1
+            delta = value - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (value - self._mean)
+
+    def _recompute(self):
+        """Точный пересчёт mean/M2 по буферу (двухпроходный, как в исходной формуле)."""
+        self._evictions = 0
+        n = self._count
+        if n == 0:
+            self._mean = self._m2 = 0.0
+            return
+        values = self.values()
+        mean = sum(values) / n
+        self._mean = mean
+        self._m2 = sum((x - mean) ** 2 for x in values)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def mean(self) -> float:
+        return self._mean
+
+    @property
+    def variance(self) -> float:
+        """Популяционная дисперсия (делитель n)."""
+        if self._count == 0:
+            return 0.0
+        var = self._m2 / self._count
+        # Остаток округления на постоянном ряду — это ровно 0
+        if var < 1e-12 * max(1.0, self._mean * self._mean):
+            return 0.0
+        return var
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def values(self) -> list[float]:
+        """Значения в хронологическом порядке (для persistence и отладки)."""
+        if self._count < self.capacity:
+            return list(self._buf[:self._count])
+        return list(self._buf[self._head:]) + list(self._buf[:self._head])
+
+    def raw_state(self) -> tuple[int, int, array]:
+        """(count, head, буфер) — как есть, для бинарной persistence."""
+        return self._count, self._head, self._buf
+
+    def load_raw_state(self, count: int, head: int, data: bytes):
+        """Восстанавливает окно из raw_state() без повторного add()."""
+        self._buf = array("d", data)
+        self._count = min(count, self.capacity)
+        self._head = head % self.capacity
+        self._recompute()
+
+    @classmethod
+    def from_values(cls, values, capacity: int = 500) -> "RollingWindow":
+        """Восстанавливает окно из списка (берутся последние capacity значений)."""
+        window = cls(capacity)
+        for v in list(values)[-capacity:]:
+            window.add(v)
+        window._recompute()
+        return window
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class EwmaStats:
+    """
+    Экспоненциально взвешенные mean и дисперсия (инкрементальная форма Finch).
+    Вместо жёсткого обрезания окна старые значения плавно теряют вес;
+    память — два float на слот.
+    """
+
+    __slots__ = ("alpha", "_count", "_mean", "_var")
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self._count = 0
+        self._mean = 0.0
+        self._var = 0.0
+
+    @staticmethod
+    def alpha_for_halflife(halflife: float) -> float:
+        """Коэффициент, при котором вес замера падает вдвое за halflife замеров."""
+        return 1.0 - 0.5 ** (1.0 / max(halflife, 1.0))
+
+    def add(self, value: float):
+        value = float(value)
+        if self._count == 0:
+            self._mean = value
+            self._var = 0.0
+        else:
+            delta = value - self._mean
+            increment = self.alpha * delta
+            self._mean += increment
+            self._var = (1.0 - self.alpha) * (self._var + delta * increment)
+        self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def mean(self) -> float:
+        return self._mean
+
+    @property
+    def variance(self) -> float:
+        if self._var < 1e-12 * max(1.0, self._mean * self._mean):
+            return 0.0
+        return self._var
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def raw_state(self) -> tuple[int, int, array]:
+        return self._count, 0, array("d", (self._mean, self._var))
+
+    def load_raw_state(self, count: int, head: int, data: bytes):
+        self._count = count
+        self._mean, self._var = array("d", data)
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class QuantileSketch:
+    """
+    Потоковые квантили алгоритмом P² (Jain & Chlamtac): на каждый квантиль —
+    5 маркеров (высота + позиция), сырые значения не хранятся.
+    Память фиксирована, add() — O(число квантилей).
+    """
+
+    __slots__ = ("quantiles", "_count", "_heights", "_positions")
+
+    def __init__(self, quantiles: tuple = (0.5, 0.95, 0.99)):
+        self.quantiles = tuple(quantiles)
+        self._count = 0
+        # По 5 маркеров на квантиль; пока замеров < 5 — здесь просто первые значения
+        self._heights = [[0.0] * 5 for _ in self.quantiles]
+        self._positions = [[0.0, 1.0, 2.0, 3.0, 4.0] for _ in self.quantiles]
+
+    def add(self, value: float):
+        value = float(value)
+        n = self._count
+        self._count += 1
+        if n < 5:
+            for heights in self._heights:
+                heights[n] = value
+                if n == 4:
+                    heights.sort()
+            return
+        for p, q, pos in zip(self.quantiles, self._heights, self._positions):
+            self._add_marker(p, q, pos, value)
+
+    def _add_marker(self, p: float, q: list, pos: list, x: float):
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            pos[i] += 1
+
+        # Желаемые позиции маркеров при count замерах (0-based)
+        last = self._count - 1
+        desired = (0.0, last * p / 2, last * p, last * (1 + p) / 2, last)
+        for i in (1, 2, 3):
+            d = desired[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                d = 1.0 if d > 0 else -1.0
+                # Параболическая (P²) поправка, при выходе за соседей — линейная
+                qp = q[i] + d / (pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + d) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+                    + (pos[i + 1] - pos[i] - d) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1])
+                )
+                if not q[i - 1] < qp < q[i + 1]:
+                    j = i + int(d)
+                    qp = q[i] + d * (q[j] - q[i]) / (pos[j] - pos[i])
+                q[i] = qp
+                pos[i] += d
+
+    def quantile(self, p: float) -> float:
+        """Оценка квантиля p (должен быть одним из self.quantiles)."""
+        idx = self.quantiles.index(p)
+        if self._count == 0:
+            return 0.0
+        if self._count < 5:
+            values = sorted(self._heights[idx][:self._count])
+            return values[min(len(values) - 1, int(p * len(values)))]
+        return self._heights[idx][2]
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def raw_state(self) -> tuple[int, int, array]:
+        buf = array("d")
+        for heights, positions in zip(self._heights, self._positions):
+            buf.extend(heights)
+            buf.extend(positions)
+        return self._count, 0, buf
+
+    def load_raw_state(self, count: int, head: int, data: bytes):
+        buf = array("d", data)
+        self._count = count
+        for i in range(len(self.quantiles)):
+            self._heights[i] = list(buf[i * 10:i * 10 + 5])
+            self._positions[i] = list(buf[i * 10 + 5:i * 10 + 10])
+
+    def __len__(self) -> int:
+        return self._count
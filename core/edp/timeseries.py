@@ -0,0 +1,189 @@
+"""
+EDP Timeseries — колоночное in-memory хранилище временных рядов.
+По одному предвыделенному float64-массиву на метрику + массив timestamps:
+запросы по окну — срезы NumPy без копирования и без обхода объектов.
+Скользящие агрегаты за O(1) и уровни даунсэмплинга (rollup) с
+ограниченной памятью для длинных горизонтов.
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+
+
+class ColumnarRing:
+    """
+    Колоночный кольцевой буфер фиксированной ёмкости.
+    Каждое значение пишется дважды (в i и i + capacity), поэтому последние
+    n ≤ capacity значений всегда лежат непрерывно и отдаются как view.
+    """
+
+    def __init__(self, capacity: int, columns: tuple):
+        self.capacity = capacity
+        self.columns = tuple(columns)
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self._data = np.zeros((len(self.columns), 2 * capacity), dtype=np.float64)
+        self._ts = np.zeros(2 * capacity, dtype=np.float64)
+        self._head = 0          # Индекс следующей записи
+        self._count = 0
+
+    def append(self, timestamp: float, values):
+        """Добавляет строку; values — в порядке self.columns."""
+        head = self._head
+        self._data[:, head] = values
+        self._data[:, head + self.capacity] = values
+        self._ts[head] = self._ts[head + self.capacity] = timestamp
+        self._head = (head + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def _span(self, count) -> slice:
+        n = self._count if count is None else max(0, min(count, self._count))
+        end = self._head + self.capacity
+        return slice(end - n, end)
+
+    def view(self, column: str, count: int = None) -> np.ndarray:
+        """
+        Последние count значений колонки (по умолчанию все) — read-only view.
+        View смотрит в живой буфер: если результат нужен после следующих
+        append(), его надо скопировать.
+        """
+        values = self._data[self._index[column], self._span(count)]
+        values.flags.writeable = False
+        return values
+
+    def timestamps(self, count: int = None) -> np.ndarray:
+        """Unix-время последних count строк — read-only view."""
+        values = self._ts[self._span(count)]
+        values.flags.writeable = False
+        return values
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._index
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class WindowAggregate:
+    """
+    Скользящие sum/avg/peak по последним N значениям с обновлением за O(1):
+    running sum + монотонная очередь максимумов.
+    """
+
+    __slots__ = ("size", "_values", "_sum", "_peaks", "_seq", "_evictions")
+
+    def __init__(self, size: int):
+        self.size = size
+        self._values: deque = deque()
+        self._sum = 0.0
+        self._peaks: deque = deque()    # (seq, value), значения строго убывают
+        self._seq = 0
+        self._evictions = 0
+
+    def add(self, value: float):
+        value = float(value)
+        self._values.append(value)
+        self._sum += value
+        if len(self._values) > self.size:
+            self._sum -= self._values.popleft()
+            self._evictions += 1
+            # Периодический точный пересчёт гасит накопленную ошибку округления
+            if self._evictions >= self.size:
+                self._evictions = 0
+                self._sum = math.fsum(self._values)
+
+        while self._peaks and self._peaks[-1][1] <= value:
+            self._peaks.pop()
+        self._peaks.append((self._seq, value))
+        if self._peaks[0][0] <= self._seq - self.size:
+            self._peaks.popleft()
+        self._seq += 1
+
+    @property
+    def count(self) -> int:
+        return len(self._values)
+
+    @property
+    def total(self) -> float:
+        return self._sum
+
+    @property
+    def avg(self) -> float:
+        return self._sum / len(self._values) if self._values else 0.0
+
+    @property
+    def peak(self) -> float:
+        return self._peaks[0][1] if self._peaks else 0.0
+
+
+class RollupTier:
+    """
+    Уровень даунсэмплинга: значения агрегируются в бакеты фиксированной
+    длины (avg/min/max/count по колонке), закрытые бакеты лежат в
+    ColumnarRing ограниченной ёмкости — память не растёт со временем.
+    """
+
+    def __init__(self, bucket_seconds: int, capacity: int, columns: tuple):
+        self.bucket_seconds = bucket_seconds
+        self.columns = tuple(columns)
+        rollup_columns = ["count"]
+        for name in self.columns:
+            rollup_columns += [f"{name}_avg", f"{name}_min", f"{name}_max"]
+        self._ring = ColumnarRing(capacity, tuple(rollup_columns))
+        self._bucket_start = None
+        self._count = 0
+        n = len(self.columns)
+        self._sums = np.zeros(n)
+        self._mins = np.full(n, np.inf)
+        self._maxs = np.full(n, -np.inf)
+
+    def add(self, timestamp: float, values):
+        """Добавляет замер; при переходе в новый бакет закрывает текущий."""
+        bucket = timestamp - timestamp % self.bucket_seconds
+        if self._bucket_start is None:
+            self._bucket_start = bucket
+        elif bucket > self._bucket_start:
+            self._flush()
+            self._bucket_start = bucket
+        # Замер «из прошлого» (сдвиг часов) учитывается в открытом бакете
+        values = np.asarray(values, dtype=np.float64)
+        self._count += 1
+        self._sums += values
+        np.minimum(self._mins, values, out=self._mins)
+        np.maximum(self._maxs, values, out=self._maxs)
+
+    def _flush(self):
+        if not self._count:
+            return
+        row = np.empty(1 + 3 * len(self.columns))
+        row[0] = self._count
+        row[1::3] = self._sums / self._count
+        row[2::3] = self._mins
+        row[3::3] = self._maxs
+        self._ring.append(self._bucket_start, row)
+        self._count = 0
+        self._sums[:] = 0.0
+        self._mins[:] = np.inf
+        self._maxs[:] = -np.inf
+
+    def view(self, column: str, stat: str = "avg", count: int = None) -> np.ndarray:
+        """Закрытые бакеты: stat — "avg" | "min" | "max" (read-only view)."""
+        return self._ring.view(f"{column}_{stat}", count)
+
+    def counts(self, count: int = None) -> np.ndarray:
+        """Число замеров в каждом закрытом бакете."""
+        return self._ring.view("count", count)
+
+    def timestamps(self, count: int = None) -> np.ndarray:
+        """Начало каждого закрытого бакета (unix-время)."""
+        return self._ring.timestamps(count)
+
+    def since(self, start: float) -> int:
+        """Сколько последних закрытых бакетов начинаются не раньше start."""
+        ts = self._ring.timestamps()
+        return len(ts) - int(np.searchsorted(ts, start, side="left"))
+
+    def __len__(self) -> int:
+        return len(self._ring)
@@ -107,6 +107,13 @@ class IncidentFingerprint:
     resolution: Optional[str] = None  # "Переключил на Reality" | None
     resolution_worked: bool = False
     match_threshold: float = 0.75   # Порог совпадения для matching
+    hit_count: int = 1              # Сколько раз паттерн повторялся (слитые дубликаты)
+    last_seen: Optional[datetime] = None  # Последнее повторение (None — только timestamp)
+
+    @property
+    def is_confirmed(self) -> bool:
+        """Подтверждённый разбор — такие инциденты retention удаляет последними."""
+        return self.resolution_worked or self.outcome_source == "user_feedback"
 
 
 @dataclass
@@ -125,6 +132,7 @@ class IncidentMatch:
             "resolution": self.fingerprint.resolution,
             "resolution_worked": self.fingerprint.resolution_worked,
             "incident_date": self.fingerprint.timestamp.isoformat(),
+            "hit_count": self.fingerprint.hit_count,
         }
 
 
@@ -0,0 +1,52 @@
+"""
+Entropy - Local Stats
+Чтение локальной копии monitor_stats.db для UI-тика: голые sqlite3-курсоры
+и кортежи строк вместо DataFrame. Соединение живёт один тик (см.
+read_local_stats), так что подготовленные выражения между тиками не
+переиспользуются: два коротких запроса компилируются заново каждый раз.
+"""
+
+import sqlite3
+
+SQL_LATEST_SYSTEM = "SELECT cpu, ram FROM system_stats ORDER BY rowid DESC LIMIT 1"
+
+# user_totals — одна строка на пользователя (upsert на сервере): O(users)
+SQL_USER_TOTALS = (
+    "SELECT email, down / 1048576.0, up / 1048576.0 FROM user_totals ORDER BY down DESC"
+)
+
+# Старый monitor.py без user_totals: кумулятивные счётчики в user_stats
+SQL_USER_TOTALS_LEGACY = (
+    "SELECT email, MAX(down) / 1048576.0 AS d, MAX(up) / 1048576.0 FROM user_stats "
+    "GROUP BY email ORDER BY d DESC"
+)
+
+
+def read_latest_system(conn: sqlite3.Connection) -> tuple[float, float]:
+    """(cpu, ram) последнего замера; (0.0, 0.0) если замеров нет."""
+    row = conn.execute(SQL_LATEST_SYSTEM).fetchone()
+    if row is None:
+        return 0.0, 0.0
+    return float(row[0] or 0.0), float(row[1] or 0.0)
+
+
+def read_user_totals(conn: sqlite3.Connection) -> list[tuple[str, float, float]]:
+    """[(email, down_mb, up_mb), ...] по убыванию down."""
+    try:
+        return conn.execute(SQL_USER_TOTALS).fetchall()
+    except sqlite3.OperationalError:
+        return conn.execute(SQL_USER_TOTALS_LEGACY).fetchall()
+
+
+def read_local_stats(db_path: str) -> tuple[tuple[float, float], list[tuple[str, float, float]]]:
+    """
+    Системные метрики и трафик пользователей одним коротким соединением.
+    Соединение не держится между тиками: полный SFTP-download из
+    DataLoader перезаписывает файл БД на месте в другом потоке, а открытое
+    WAL-соединение оставило бы рядом -wal/-shm от старого файла.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        return read_latest_system(conn), read_user_totals(conn)
+    finally:
+        conn.close()
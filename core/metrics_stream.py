@@ -0,0 +1,187 @@
+"""
+Entropy - Metrics Stream
+Push-режим телеметрии: агент на VPS пишет newline-delimited JSON фреймы
+в один долгоживущий SSH-канал, клиент разбирает их инкрементально.
+"""
+
+import json
+import logging
+import shlex
+import socket
+import time
+
+from PySide6.QtCore import QThread, Signal
+
+logger = logging.getLogger(__name__)
+
+# Агент выполняется на VPS через `python3 -c <script> <interval_sec>`.
+# Только stdlib. Ping и auth.log обновляются в своём ритме (медленнее фреймов),
+# во фрейм попадает последнее известное значение.
+AGENT_SCRIPT = r'''
+import json, re, subprocess, sys, threading, time
+
+interval = float(sys.argv[1])
+state = {"latencies": [], "ssh_probes": []}
+
+def sh(cmd, timeout=10):
+    try:
+        return subprocess.run(cmd, shell=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, timeout=timeout).stdout.decode(errors="replace")
+    except Exception:
+        return ""
+
+def slow_loop():
+    while True:
+        out = sh("ping -c 4 -i 0.2 8.8.8.8", timeout=15)
+        state["latencies"] = [float(m) for m in re.findall(r"time=([0-9.]+)", out)]
+        lines = sh("grep 'Failed password' /var/log/auth.log | tail -n 5").splitlines()
+        state["ssh_probes"] = [l.split()[-4] for l in lines if len(l.split()) >= 4]
+        time.sleep(max(interval, 5))
+
+def raw_packets():
+    with open("/proc/net/dev") as f:
+        for line in f:
+            if ":" in line and "lo:" not in line:
+                return line.split(":", 1)[1].split()[1]
+    return ""
+
+def cpu_times():
+    with open("/proc/stat") as f:
+        values = [int(v) for v in f.readline().split()[1:]]
+    return sum(values), values[3] + (values[4] if len(values) > 4 else 0)
+
+def ram_percent():
+    info = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            info[key] = int(value.split()[0])
+    total = info.get("MemTotal", 0)
+    avail = info.get("MemAvailable", info.get("MemFree", 0))
+    return round((total - avail) * 100.0 / total, 1) if total else 0.0
+
+threading.Thread(target=slow_loop, daemon=True).start()
+prev_total, prev_idle = cpu_times()
+while True:
+    time.sleep(interval)
+    total, idle = cpu_times()
+    busy = (total - prev_total) - (idle - prev_idle)
+    cpu = round(busy * 100.0 / (total - prev_total), 1) if total > prev_total else 0.0
+    prev_total, prev_idle = total, idle
+    frame = {
+        "t": time.time(),
+        "system": {"cpu": cpu, "ram": ram_percent()},
+        "security": {"raw_packets": raw_packets(), "latencies": state["latencies"],
+                     "ssh_probes": state["ssh_probes"]},
+    }
+    sys.stdout.write(json.dumps(frame) + "\n")
+    sys.stdout.flush()
+'''
+
+
+def build_agent_command(interval_ms: int) -> str:
+    """Команда запуска агента: весь скрипт inline, интервал фреймов в секундах."""
+    return f"python3 -u -c {shlex.quote(AGENT_SCRIPT)} {max(interval_ms, 100) / 1000.0}"
+
+
+class FrameDecoder:
+    """Инкрементальный разбор NDJSON: байты приходят кусками произвольной длины."""
+
+    def __init__(self, max_line: int = 1024 * 1024):
+        self._buffer = b""
+        self._max_line = max_line
+        self._discarding = False  # Пропускаем хвост слишком длинного фрейма до \n
+
+    def feed(self, data: bytes) -> list[dict]:
+        """Добавляет байты, возвращает все завершённые фреймы."""
+        if self._discarding:
+            newline = data.find(b"\n")
+            if newline < 0:
+                return []
+            data = data[newline + 1:]
+            self._discarding = False
+
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        if len(self._buffer) > self._max_line:
+            logger.warning("Metrics stream: oversized frame dropped")
+            self._buffer = b""
+            self._discarding = True
+
+        frames = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                frame = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                logger.debug(f"Metrics stream: bad frame {line[:80]!r}")
+                continue
+            if isinstance(frame, dict):
+                frames.append(frame)
+        return frames
+
+
+class MetricsStream(QThread):
+    """Поток, держащий один SSH-канал с агентом и эмитящий фреймы метрик."""
+    frame_ready = Signal(dict)
+    stream_error = Signal(str)
+
+    def __init__(self, ssh_manager, interval_ms: int = 1000, reconnect_delay: float = 5.0):
+        super().__init__()
+        self.ssh = ssh_manager
+        self.interval_ms = interval_ms
+        self.reconnect_delay = reconnect_delay
+        self._running = True
+        self._channel = None
+
+    def run(self):
+        while self._running:
+            try:
+                self._consume()
+            except Exception as e:
+                logger.warning(f"Metrics stream error: {e}")
+                self.stream_error.emit(str(e))
+            finally:
+                self._close_channel()
+
+            # Пауза перед переподключением, прерываемая stop()
+            deadline = time.monotonic() + self.reconnect_delay
+            while self._running and time.monotonic() < deadline:
+                time.sleep(0.1)
+
+    def _consume(self):
+        """Открывает канал с агентом и читает фреймы до EOF или stop()."""
+        if not self.ssh.connect():
+            raise ConnectionError("SSH connection failed")
+
+        self._channel = self.ssh.open_stream(build_agent_command(self.interval_ms))
+        if self._channel is None:
+            raise ConnectionError("Cannot open stream channel")
+        # Таймаут чтения — чтобы stop() срабатывал без ожидания следующего фрейма
+        self._channel.settimeout(1.0)
+        logger.info("Metrics stream: agent started")
+
+        decoder = FrameDecoder()
+        while self._running:
+            try:
+                data = self._channel.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                raise ConnectionError("Agent channel closed")
+            for frame in decoder.feed(data):
+                self.frame_ready.emit(frame)
+
+    def _close_channel(self):
+        channel, self._channel = self._channel, None
+        if channel is not None:
+            try:
+                channel.close()
+            except Exception:
+                pass
+
+    def stop(self):
+        """Останавливает поток; агент на VPS завершается по закрытию канала."""
+        self._running = False
+        self._close_channel()
@@ -1,6 +1,7 @@
 """
 Entropy - SSH Connection Manager
-Maintains persistent SSH connection with auto-reconnect and keepalive
+Maintains persistent SSH connection with auto-reconnect and keepalive.
+Connections to the same ip:port:user share one authenticated transport.
 """
 
 import paramiko
@@ -8,38 +9,143 @@ import os
 import logging
 import socket
 import threading
-import time
+import weakref
 from typing import Optional, Tuple
 
+from core.ssh_scheduler import (
+    CommandScheduler, DEFAULT_BURST, DEFAULT_MAX_IN_FLIGHT, DEFAULT_RATE
+)
+
 logger = logging.getLogger(__name__)
 
 
+class _SharedTransport:
+    """Одно аутентифицированное SSH-соединение, общее для нескольких менеджеров."""
+    
+    def __init__(self, key: str, scheduler: CommandScheduler):
+        self.key = key
+        self.client: Optional[paramiko.SSHClient] = None
+        self.scheduler = scheduler  # Общий token bucket / лимит каналов на transport
+        self.lock = threading.Lock()  # Сериализует (пере)подключение
+        self.consumers = weakref.WeakSet()
+    
+    def is_active(self) -> bool:
+        if not self.client:
+            return False
+        try:
+            transport = self.client.get_transport()
+            return transport is not None and transport.is_active()
+        except Exception:
+            return False
+    
+    def close(self):
+        if self.client:
+            try:
+                self.client.close()
+            except:
+                pass
+            self.client = None
+
+
+class TransportRegistry:
+    """
+    Process-wide реестр SSH transport-ов по ключу ip:port:user.
+    DataBridge, EAIS и AIAnalyzer получают каналы одного соединения
+    вместо отдельных TCP+KEX handshake на каждого потребителя.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[str, _SharedTransport] = {}
+    
+    def acquire(self, key: str, consumer, scheduler_factory) -> _SharedTransport:
+        """Регистрирует потребителя и возвращает общий transport для ключа."""
+        stale = None
+        with self._lock:
+            entry = self._entries.get(key)
+            # Все потребители исчезли без close() — соединение никому не принадлежит
+            if entry is not None and len(entry.consumers) == 0:
+                stale, entry = entry, None
+            if entry is None:
+                entry = _SharedTransport(key, scheduler_factory())
+                self._entries[key] = entry
+            entry.consumers.add(consumer)
+        if stale:
+            stale.close()
+        return entry
+    
+    def release(self, entry: _SharedTransport, consumer):
+        """Снимает потребителя; последний закрывает соединение."""
+        with self._lock:
+            entry.consumers.discard(consumer)
+            if len(entry.consumers) > 0:
+                return
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+        entry.close()
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+transports = TransportRegistry()
+
+
 class SSHConnectionManager:
     """
     Manages a persistent SSH connection with:
     - Auto-reconnect on failure
     - Keepalive packets every 30 seconds
     - Thread-safe operations
+    - Token-bucket планировщик команд с приоритетами
+    - Общий transport для всех менеджеров одного ip:port:user
     """
     
-    def __init__(self, config_manager):
+    def __init__(self, config_manager, priority: str = "sync",
+                 max_concurrency: Optional[int] = None):
         self.cfg = config_manager
+        self.priority = priority  # Класс приоритета команд по умолчанию
+        self.scheduler = self._make_scheduler()  # После connect — общий scheduler transport-а
+        # Лимит одновременных команд этого потребителя на общем transport
+        self._consumer_slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._entry: Optional[_SharedTransport] = None
         self._client: Optional[paramiko.SSHClient] = None
         self._sftp: Optional[paramiko.SFTPClient] = None
         self._lock = threading.Lock()
         self._connected = False
         self._last_server_key = None  # Для отслеживания смены сервера
         
+    def _num_setting(self, key: str, default):
+        """Числовая настройка из конфига (некорректные значения → default)."""
+        value = self.cfg.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+            return value
+        return default
+    
+    def _make_scheduler(self) -> CommandScheduler:
+        return CommandScheduler(
+            rate=self._num_setting("ssh_rate_per_sec", DEFAULT_RATE),
+            burst=self._num_setting("ssh_burst", DEFAULT_BURST),
+            max_in_flight=self._num_setting("ssh_max_in_flight", DEFAULT_MAX_IN_FLIGHT),
+        )
+    
     @property
     def _server_key(self) -> str:
         """Уникальный ключ сервера для определения смены"""
         return f"{self.cfg.get('ip')}:{self.cfg.get('port')}"
     
+    @property
+    def _transport_key(self) -> str:
+        """Ключ общего transport в реестре"""
+        return f"{self._server_key}:{self.cfg.get('user')}"
+    
     def _should_reconnect(self) -> bool:
         """Проверяем нужно ли переподключение"""
         if not self._connected or not self._client:
             return True
-        if self._server_key != self._last_server_key:
+        if self._server_key != self._last_server_key or (
+                self._entry is not None and self._entry.key != self._transport_key):
             logger.info("Server changed, reconnecting...")
             return True
         # Проверяем живое ли соединение
@@ -60,50 +166,61 @@ class SSHConnectionManager:
             # Закрываем старое соединение если есть
             self._close_internal()
             
+            entry = None
             try:
                 ip = self.cfg.get("ip")
                 port = self.cfg.get("port")
                 user = self.cfg.get("user")
                 key_path = self.cfg.get("key_path")
                 
-                logger.info(f"SSH: Подключение к {ip}:{port}...")
-                
-                self._client = paramiko.SSHClient()
-                self._client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                
                 if not key_path or not os.path.exists(key_path):
                     raise FileNotFoundError(f"SSH ключ не найден: {key_path}")
                 
-                self._client.connect(
-                    hostname=ip,
-                    port=port,
-                    username=user,
-                    key_filename=key_path,
-                    timeout=15,
-                    banner_timeout=30
-                )
-                
-                # Настраиваем keepalive
-                transport = self._client.get_transport()
-                if transport:
-                    transport.set_keepalive(30)  # Keepalive каждые 30 сек
+                entry = transports.acquire(self._transport_key, self, self._make_scheduler)
+                with entry.lock:
+                    if entry.is_active():
+                        logger.debug(f"SSH: Общий transport {entry.key}")
+                    else:
+                        entry.close()
+                        logger.info(f"SSH: Подключение к {ip}:{port}...")
+                        
+                        client = paramiko.SSHClient()
+                        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                        client.connect(
+                            hostname=ip,
+                            port=port,
+                            username=user,
+                            key_filename=key_path,
+                            timeout=15,
+                            banner_timeout=30
+                        )
+                        
+                        # Настраиваем keepalive
+                        transport = client.get_transport()
+                        if transport:
+                            transport.set_keepalive(30)  # Keepalive каждые 30 сек
+                        
+                        entry.client = client
+                        logger.info("SSH: Соединение установлено (persistent)")
                 
+                self._entry = entry
+                self._client = entry.client
+                self.scheduler = entry.scheduler
                 self._connected = True
                 self._last_server_key = self._server_key
-                logger.info("SSH: Соединение установлено (persistent)")
                 return True
                 
             except Exception as e:
                 logger.error(f"SSH: Ошибка подключения: {e}")
+                if entry is not None:
+                    transports.release(entry, self)
                 self._connected = False
                 self._client = None
                 return False
     
-    def exec_command(self, command: str, timeout: int = 10) -> Tuple[bool, str]:
+    def exec_command(self, command: str, timeout: int = 10,
+                     priority: Optional[str] = None) -> Tuple[bool, str]:
         """Выполнить команду на сервере (thread-safe, без блокировки других команд)"""
-        # Throttling: предотвращает слишком быструю отправку команд от 3-х пулов
-        time.sleep(0.1)
-        
         if not self.connect():
             return False, "Connection failed"
         
@@ -112,21 +229,58 @@ class SSHConnectionManager:
             
         if not client:
             return False, "Client not available"
+        
+        # Лимит потребителя: не даём одному модулю занять все каналы transport-а
+        if self._consumer_slots and not self._consumer_slots.acquire(timeout=timeout):
+            logger.warning(f"SSH consumer limit timeout [{command[:60]}] (timeout={timeout}s)")
+            return False, f"Command timed out after {timeout}s"
+        try:
+            return self._exec_scheduled(client, command, timeout, priority or self.priority)
+        finally:
+            if self._consumer_slots:
+                self._consumer_slots.release()
+    
+    def _exec_scheduled(self, client, command: str, timeout: int, priority: str) -> Tuple[bool, str]:
+        """Выполняет команду в слоте планировщика transport-а"""
+        # Throttling: token bucket + лимит каналов вместо фиксированной задержки
+        with self.scheduler.slot(priority, timeout=timeout) as acquired:
+            if not acquired:
+                logger.warning(f"SSH scheduler timeout [{command[:60]}] (timeout={timeout}s)")
+                return False, f"Command timed out after {timeout}s"
             
+            try:
+                # exec_command открывает новый channel. Это потокобезопасно.
+                stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+                output = stdout.read().decode().strip()
+                error = stderr.read().decode().strip()
+                return True, output if output else error
+            except (TimeoutError, socket.timeout):
+                # Таймаут команды — соединение живо, просто команда долгая
+                logger.warning(f"SSH timeout [{command[:60]}] (timeout={timeout}s)")
+                return False, f"Command timed out after {timeout}s"
+            except Exception as e:
+                # Реальная ошибка канала, но не обязательно всего соединения
+                logger.error(f"SSH exec error [{command[:60]}]: {type(e).__name__}: {e}")
+                return False, str(e)
+    
+    def open_stream(self, command: str) -> Optional[paramiko.Channel]:
+        """Открыть долгоживущий exec-канал (вне планировщика — не занимает слот)"""
+        if not self.connect():
+            return None
+        
+        with self._lock:
+            client = self._client
+        
+        if not client:
+            return None
+        
         try:
-            # exec_command открывает новый channel. Это потокобезопасно.
-            stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
-            output = stdout.read().decode().strip()
-            error = stderr.read().decode().strip()
-            return True, output if output else error
-        except (TimeoutError, socket.timeout):
-            # Таймаут команды — соединение живо, просто команда долгая
-            logger.warning(f"SSH timeout [{command[:60]}] (timeout={timeout}s)")
-            return False, f"Command timed out after {timeout}s"
+            channel = client.get_transport().open_session()
+            channel.exec_command(command)
+            return channel
         except Exception as e:
-            # Реальная ошибка канала, но не обязательно всего соединения
-            logger.error(f"SSH exec error [{command[:60]}]: {type(e).__name__}: {e}")
-            return False, str(e)
+            logger.error(f"SSH stream open error: {type(e).__name__}: {e}")
+            return None
     
     def get_sftp(self) -> Optional[paramiko.SFTPClient]:
         """Получить общий SFTP клиент (переиспользуемый)"""
@@ -181,12 +335,16 @@ class SSHConnectionManager:
                 pass
             self._sftp = None
         
-        if self._client:
+        if self._entry is not None:
+            # Общий transport закрывает последний потребитель
+            transports.release(self._entry, self)
+            self._entry = None
+        elif self._client:
             try:
                 self._client.close()
             except:
                 pass
-            self._client = None
+        self._client = None
         
         self._connected = False
     
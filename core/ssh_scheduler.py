@@ -0,0 +1,105 @@
+"""
+Entropy - SSH Command Scheduler
+Token bucket + лимит одновременных каналов с приоритетами для SSH-команд.
+Заменяет фиксированный sleep перед каждой командой: в простое команда
+уходит сразу, а всплески (например, сбор контекста EAIS) сглаживаются.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Классы приоритета: меньше — важнее. Sync-тик не должен ждать AI и sandbox.
+PRIORITIES = {
+    "sync": 0,
+    "sandbox": 1,
+    "ai": 2,
+}
+
+DEFAULT_RATE = 20.0        # Команд в секунду в установившемся режиме
+DEFAULT_BURST = 10         # Ёмкость bucket — сколько команд уходит без задержки
+DEFAULT_MAX_IN_FLIGHT = 8  # Одновременно открытых exec-каналов на transport
+
+
+class CommandScheduler:
+    """Thread-safe планировщик: token bucket + max-in-flight + приоритетная очередь."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._waiters: list = []  # heap из (priority, seq)
+        self._seq = itertools.count()
+
+    def _refill(self):
+        """Пополняет bucket пропорционально прошедшему времени (под lock)."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, priority: str = "sync", timeout: Optional[float] = None) -> bool:
+        """
+        Ждёт слот для команды. Слот выдаётся первому в очереди по приоритету,
+        когда есть токен и свободный канал. False — если истёк timeout.
+        """
+        ticket = (PRIORITIES.get(priority, len(PRIORITIES)), next(self._seq))
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    self._refill()
+                    is_next = self._waiters[0] == ticket
+                    if is_next and self._in_flight < self.max_in_flight and self._tokens >= 1:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        self._in_flight += 1
+                        return True
+
+                    # Ждём либо следующий токен, либо release/смену головы очереди
+                    wait = None
+                    if is_next and self._in_flight < self.max_in_flight:
+                        wait = (1 - self._tokens) / self.rate
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._waiters.remove(ticket)
+                            heapq.heapify(self._waiters)
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                # Голова очереди могла смениться — будим остальных
+                self._cond.notify_all()
+
+    def release(self):
+        """Освобождает канал после завершения команды."""
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str = "sync", timeout: Optional[float] = None):
+        """Контекст-менеджер: `with scheduler.slot("ai") as ok:`."""
+        acquired = self.acquire(priority, timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release()
+
+    @property
+    def in_flight(self) -> int:
+        """Сколько команд выполняется прямо сейчас."""
+        with self._cond:
+            return self._in_flight
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('resources', 'resources'), ('core', 'core'), ('ai', 'ai'), ('src', 'src')],
-    hiddenimports=['paramiko', 'pandas', 'openai', 'anthropic', 'google.generativeai', 'dotenv'],
+    hiddenimports=['paramiko', 'numpy', 'openai', 'anthropic', 'google.generativeai', 'dotenv', 'yaml'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
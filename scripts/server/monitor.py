@@ -5,86 +5,366 @@ import os
 import subprocess
 import json
 
+# grpcio is optional: without it stats are read through the xray CLI
+try:
+    import grpc
+except ImportError:
+    grpc = None
+
 # Configuration
 DB_NAME = "/root/monitoring/monitor_stats.db"
-MAX_DB_SIZE_MB = 500
 XRAY_PATH = "/usr/local/x-ui/bin/xray-linux-amd64" # Default X-UI/Xray path
+XRAY_API = "127.0.0.1:62789"
 UPDATE_INTERVAL = 30 # Seconds
 
-def init_db():
-    os.makedirs(os.path.dirname(DB_NAME), exist_ok=True)
-    conn = sqlite3.connect(DB_NAME)
+# Only per-user counters are requested; the filter runs inside Xray
+XRAY_STATS_PATTERN = "user>>>"
+# reset=True makes Xray return deltas and zero its counters. Off by default:
+# the x-ui panel reads the same counters with reset and would lose traffic.
+XRAY_RESET = False
+
+# Retention: raw rows older than this are deleted by an indexed range DELETE
+RAW_RETENTION_DAYS = 14
+RETENTION_EVERY = 120 # Ticks between retention runs (~1 hour)
+
+# Per-interval user traffic deltas in user_deltas (user_totals is always kept).
+# Off by default: about active users x 2880 rows/day. When on, retention also
+# keeps at most USER_HISTORY_MAX_ROWS newest rows.
+USER_HISTORY = False
+USER_HISTORY_MAX_ROWS = 2_000_000
+
+# Rollup tiers of system_stats: table -> (strftime bucket format, retention days)
+ROLLUP_TIERS = {
+    "system_rollup_1m": ("%Y-%m-%d %H:%M:00", 60),
+    "system_rollup_1h": ("%Y-%m-%d %H:00:00", 730),
+    "system_rollup_1d": ("%Y-%m-%d 00:00:00", 3650),
+}
+# Rolled-up series; net_* are rates in bytes/s derived from the raw counters
+ROLLUP_METRICS = ("cpu", "ram", "net_down", "net_up")
+
+# Statements are constant strings: sqlite3 keeps them prepared in the
+# connection's statement cache, so every tick reuses the compiled plan.
+SQL_INSERT_SYSTEM = "INSERT INTO system_stats (cpu, ram, net_down, net_up) VALUES (?, ?, ?, ?)"
+SQL_UPSERT_TOTALS = """
+    INSERT INTO user_totals (email, down, up, last_down, last_up, updated)
+    VALUES (?, ?, ?, ?, ?, datetime('now', 'localtime'))
+    ON CONFLICT(email) DO UPDATE SET
+        down = down + excluded.down,
+        up = up + excluded.up,
+        last_down = excluded.last_down,
+        last_up = excluded.last_up,
+        updated = excluded.updated"""
+SQL_INSERT_DELTA = "INSERT INTO user_deltas (email, down, up) VALUES (?, ?, ?)"
+SQL_RETENTION = (
+    "DELETE FROM system_stats WHERE timestamp < datetime('now', 'localtime', ?)",
+    "DELETE FROM user_deltas WHERE timestamp < datetime('now', 'localtime', ?)",
+    "DELETE FROM user_stats WHERE timestamp < datetime('now', 'localtime', ?)",
+)
+# Row ceiling for user_deltas: a rowid range delete of the oldest rows
+SQL_TRIM_DELTAS = "DELETE FROM user_deltas WHERE rowid <= (SELECT MAX(rowid) FROM user_deltas) - ?"
+
+def init_db(conn):
     curr = conn.cursor()
     # System metrics table
     curr.execute('''CREATE TABLE IF NOT EXISTS system_stats
                  (timestamp DATETIME DEFAULT (datetime('now','localtime')),
                   cpu REAL, ram REAL, net_down REAL, net_up REAL)''')
-    # User traffic stats table
+    # Legacy cumulative user counters: no longer written, old rows age out
     curr.execute('''CREATE TABLE IF NOT EXISTS user_stats
                  (timestamp DATETIME DEFAULT (datetime('now','localtime')),
                   email TEXT, down INTEGER, up INTEGER)''')
+    # One row per user: traffic totals (bytes) + last raw Xray counters
+    curr.execute('''CREATE TABLE IF NOT EXISTS user_totals
+                 (email TEXT PRIMARY KEY, down INTEGER, up INTEGER,
+                  last_down INTEGER, last_up INTEGER, updated DATETIME)''')
+    # Optional history: traffic per user per interval (only users with traffic)
+    curr.execute('''CREATE TABLE IF NOT EXISTS user_deltas
+                 (timestamp DATETIME DEFAULT (datetime('now','localtime')),
+                  email TEXT, down INTEGER, up INTEGER)''')
+    # Retention deletes by time range instead of scanning the table
+    curr.execute("CREATE INDEX IF NOT EXISTS idx_system_stats_ts ON system_stats(timestamp)")
+    curr.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_ts ON user_stats(timestamp)")
+    curr.execute("CREATE INDEX IF NOT EXISTS idx_user_deltas_ts ON user_deltas(timestamp)")
+    # Rollups: one row per bucket with sample count and min/max/avg per metric
+    rollup_columns = ", ".join(f"{m}_{stat} REAL" for m in ROLLUP_METRICS for stat in ("min", "max", "avg"))
+    for table in ROLLUP_TIERS:
+        curr.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                     f"(bucket DATETIME PRIMARY KEY, samples INTEGER, {rollup_columns})")
     conn.commit()
-    conn.close()
-
-def get_xray_stats():
-    try:
-        # Querying Xray API directly
-        cmd = f"{XRAY_PATH} api statsquery --server=127.0.0.1:62789"
-        result = subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT).decode()
-        return json.loads(result)
-    except Exception as e:
-        print(f"Xray statistics unavailable: {e}")
-        return None
-
-def cleanup_db():
-    """Deletes old data when DB size exceeds 500MB"""
-    if os.path.exists(DB_NAME) and os.path.getsize(DB_NAME) > MAX_DB_SIZE_MB * 1024 * 1024:
-        conn = sqlite3.connect(DB_NAME)
-        curr = conn.cursor()
-        curr.execute("DELETE FROM system_stats WHERE rowid IN (SELECT rowid FROM system_stats LIMIT 500)")
-        curr.execute("DELETE FROM user_stats WHERE rowid IN (SELECT rowid FROM user_stats LIMIT 500)")
-        conn.commit()
-        conn.close()
-
-def collect():
+
+def open_db():
+    """One long-lived connection in WAL mode: readers (delta sync) never block the collector."""
+    os.makedirs(os.path.dirname(DB_NAME), exist_ok=True)
     conn = sqlite3.connect(DB_NAME)
-    curr = conn.cursor()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    init_db(conn)
+    return conn
 
-    # System data
-    cpu = psutil.cpu_percent()
-    ram = psutil.virtual_memory().percent
-    net = psutil.net_io_counters()
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
 
-    curr.execute("INSERT INTO system_stats (cpu, ram, net_down, net_up) VALUES (?, ?, ?, ?)",
-                 (cpu, ram, net.bytes_recv, net.bytes_sent))
+def _read_varint(buf, pos):
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
 
-    # Xray data
-    xstats = get_xray_stats()
-    if xstats and isinstance(xstats.get('stat'), list):
-        for entry in xstats['stat']:
-            name = entry.get('name', '')
-            val = entry.get('value', 0)
+def _fields(buf):
+    """Minimal protobuf reader: yields (field number, value) for varint and bytes fields."""
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire == 2:
+            size, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + size], pos + size
+        elif wire == 1:
+            value, pos = None, pos + 8
+        elif wire == 5:
+            value, pos = None, pos + 4
+        else:
+            raise ValueError(f"unsupported wire type {wire}")
+        yield field, value
 
-            parts = name.split('>>>')
-            if len(parts) >= 4 and parts[0] == 'user':
-                email = parts[1]
-                type_t = parts[3]
+def encode_query_stats(pattern, reset):
+    """QueryStatsRequest{string pattern = 1; bool reset = 2;}"""
+    raw = pattern.encode()
+    return b"\x0a" + _varint(len(raw)) + raw + (b"\x10\x01" if reset else b"")
 
-                if type_t == 'downlink':
-                    curr.execute("INSERT INTO user_stats (email, down, up) VALUES (?, ?, 0)", (email, val))
-                elif type_t == 'uplink':
-                    curr.execute("INSERT INTO user_stats (email, down, up) VALUES (?, 0, ?)", (email, val))
+def decode_query_stats(buf):
+    """QueryStatsResponse{repeated Stat stat = 1;} -> [(name, value), ...]"""
+    stats = []
+    for field, stat in _fields(buf):
+        if field != 1:
+            continue
+        name, value = "", 0
+        for sub_field, sub_value in _fields(stat):
+            if sub_field == 1:
+                name = sub_value.decode()
+            elif sub_field == 2:
+                value = sub_value
+        stats.append((name, value))
+    return stats
 
-    conn.commit()
-    conn.close()
+class XrayStats:
+    """
+    Xray StatsService client. Keeps one gRPC channel open for the life of
+    the collector (no process spawn per tick); the messages are encoded by
+    hand, so only grpcio is needed. Falls back to the xray CLI.
+    """
+
+    METHOD = "/xray.app.stats.command.StatsService/QueryStats"
+
+    def __init__(self, server=XRAY_API, pattern=XRAY_STATS_PATTERN, reset=XRAY_RESET):
+        self.server = server
+        self.pattern = pattern
+        self.reset = reset
+        self._query = None
+        if grpc is not None:
+            channel = grpc.insecure_channel(server)
+            self._query = channel.unary_unary(
+                self.METHOD,
+                request_serializer=lambda req: encode_query_stats(*req),
+                response_deserializer=decode_query_stats,
+            )
+
+    def query(self):
+        """[(counter name, value), ...] or None if Xray is unavailable."""
+        if self._query is not None:
+            try:
+                return self._query((self.pattern, self.reset), timeout=5)
+            except grpc.RpcError as e:
+                print(f"Xray gRPC stats unavailable: {e.code()}")
+        return self._query_cli()
+
+    def _query_cli(self):
+        cmd = [XRAY_PATH, "api", "statsquery", f"--server={self.server}", "-pattern", self.pattern]
+        if self.reset:
+            cmd.append("-reset")
+        try:
+            result = json.loads(subprocess.check_output(cmd, stderr=subprocess.STDOUT, timeout=10))
+            return [(entry.get('name', ''), entry.get('value', 0)) for entry in result.get('stat') or []]
+        except Exception as e:
+            print(f"Xray statistics unavailable: {e}")
+            return None
+
+def parse_user_stats(stats):
+    """[(name, value), ...] Xray counters -> {email: [down, up]}."""
+    counters = {}
+    for name, val in stats or ():
+        parts = name.split('>>>')
+        if len(parts) >= 4 and parts[0] == 'user':
+            email = parts[1]
+            type_t = parts[3]
+
+            if type_t == 'downlink':
+                counters.setdefault(email, [0, 0])[0] = int(val)
+            elif type_t == 'uplink':
+                counters.setdefault(email, [0, 0])[1] = int(val)
+    return counters
+
+def counter_delta(current, last):
+    """Traffic since the last sample; a smaller counter means Xray restarted."""
+    return current - last if current >= last else current
+
+class Rollup:
+    """
+    Open bucket of one rollup tier, updated in memory per sample.
+    The bucket row is rewritten with INSERT OR REPLACE every tick: a crash
+    loses nothing, and each rewrite gets a new rowid, so the client's
+    rowid-based delta sync picks the updated row up.
+    """
+
+    def __init__(self, table, bucket_format):
+        self.table = table
+        self.bucket_format = bucket_format
+        self.bucket = None
+        self.samples = 0
+        self.mins = self.maxs = self.sums = None
+        columns = ", ".join(["bucket", "samples"] + [f"{m}_{stat}" for m in ROLLUP_METRICS for stat in ("min", "max", "avg")])
+        self.sql_upsert = f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({', '.join('?' * (2 + 3 * len(ROLLUP_METRICS)))})"
+        self.sql_load = f"SELECT {columns} FROM {table} WHERE bucket = ?"
+
+    def resume(self, conn, when):
+        """Continue the current bucket after a restart instead of overwriting it."""
+        bucket = time.strftime(self.bucket_format, time.localtime(when))
+        row = conn.execute(self.sql_load, (bucket,)).fetchone()
+        if row is None:
+            return
+        self.bucket, self.samples = row[0], row[1]
+        stats = row[2:]
+        self.mins = list(stats[0::3])
+        self.maxs = list(stats[1::3])
+        self.sums = [avg * self.samples for avg in stats[2::3]]
+
+    def add(self, when, values):
+        """Adds a sample; returns the bucket row to upsert."""
+        bucket = time.strftime(self.bucket_format, time.localtime(when))
+        if bucket != self.bucket:
+            self.bucket, self.samples = bucket, 0
+            self.mins, self.maxs, self.sums = list(values), list(values), [0.0] * len(values)
+        self.samples += 1
+        for i, v in enumerate(values):
+            self.sums[i] += v
+            if v < self.mins[i]:
+                self.mins[i] = v
+            if v > self.maxs[i]:
+                self.maxs[i] = v
+        row = [self.bucket, self.samples]
+        for lo, hi, total in zip(self.mins, self.maxs, self.sums):
+            row += [lo, hi, total / self.samples]
+        return row
+
+class Collector:
+    """Collector loop state: persistent connection and the retention schedule."""
+
+    def __init__(self):
+        self.conn = open_db()
+        self.xray = XrayStats()
+        self.ticks = 0
+        self.last_net = None # (time, bytes_recv, bytes_sent) for net rates
+        now = time.time()
+        self.rollups = [Rollup(table, fmt) for table, (fmt, _) in ROLLUP_TIERS.items()]
+        for rollup in self.rollups:
+            rollup.resume(self.conn, now)
+        # Last raw Xray counters per user, to turn cumulative values into deltas
+        self.counters = {
+            email: (last_down or 0, last_up or 0)
+            for email, last_down, last_up in self.conn.execute(
+                "SELECT email, last_down, last_up FROM user_totals")
+        }
+
+    def user_rows(self, counters):
+        """Upsert rows for users whose counters moved, and the matching deltas."""
+        upserts, deltas = [], []
+        for email, (down, up) in counters.items():
+            last = self.counters.get(email)
+            if self.xray.reset:
+                # Counters are already deltas since the previous query
+                if not (down or up) and last is not None:
+                    continue
+                d_down, d_up = down, up
+                down, up = last or (0, 0)
+            else:
+                if last == (down, up):
+                    continue
+                last_down, last_up = last or (0, 0)
+                d_down, d_up = counter_delta(down, last_down), counter_delta(up, last_up)
+            upserts.append((email, d_down, d_up, down, up))
+            if d_down or d_up:
+                deltas.append((email, d_down, d_up))
+        return upserts, deltas
+
+    def collect(self):
+        # Gather everything first, then write in one short transaction
+        cpu = psutil.cpu_percent()
+        ram = psutil.virtual_memory().percent
+        net = psutil.net_io_counters()
+        counters = parse_user_stats(self.xray.query())
+        upserts, deltas = self.user_rows(counters)
+        rollup_rows = self.rollup_rows(time.time(), cpu, ram, net)
+
+        with self.conn:
+            self.conn.execute(SQL_INSERT_SYSTEM, (cpu, ram, net.bytes_recv, net.bytes_sent))
+            self.conn.executemany(SQL_UPSERT_TOTALS, upserts)
+            if USER_HISTORY:
+                self.conn.executemany(SQL_INSERT_DELTA, deltas)
+            for rollup, row in rollup_rows:
+                self.conn.execute(rollup.sql_upsert, row)
+        self.counters.update((row[0], (row[3], row[4])) for row in upserts)
+        # Keep the main DB file current for clients that download it via SFTP
+        self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+        self.ticks += 1
+        if self.ticks % RETENTION_EVERY == 1:
+            self.retention()
+
+    def rollup_rows(self, now, cpu, ram, net):
+        """Feeds the sample into every tier (net as bytes/s since the previous sample)."""
+        last, self.last_net = self.last_net, (now, net.bytes_recv, net.bytes_sent)
+        if last is None or now <= last[0]:
+            return [] # No rate yet: the first sample only primes the net counters
+        elapsed = now - last[0]
+        net_down = max(0, net.bytes_recv - last[1]) / elapsed
+        net_up = max(0, net.bytes_sent - last[2]) / elapsed
+        values = (cpu, ram, net_down, net_up)
+        return [(rollup, rollup.add(now, values)) for rollup in self.rollups]
+
+    def retention(self):
+        cutoff = f"-{RAW_RETENTION_DAYS} days"
+        with self.conn:
+            for sql in SQL_RETENTION:
+                self.conn.execute(sql, (cutoff,))
+            self.conn.execute(SQL_TRIM_DELTAS, (USER_HISTORY_MAX_ROWS,))
+            # Per-tier age retention; bucket is the primary key, so these are range deletes
+            for table, (_, days) in ROLLUP_TIERS.items():
+                self.conn.execute(f"DELETE FROM {table} WHERE bucket < datetime('now', 'localtime', ?)",
+                                  (f"-{days} days",))
+
+    def close(self):
+        self.conn.close()
 
 if __name__ == "__main__":
-    init_db()
+    collector = Collector()
     print(f"Monitoring started. Interval: {UPDATE_INTERVAL}s. DB: {DB_NAME}")
     while True:
         try:
-            collect()
-            cleanup_db()
+            collector.collect()
         except Exception as e:
             print(f"Collection error: {e}")
         time.sleep(UPDATE_INTERVAL)
@@ -3,7 +3,6 @@ import sys
 import os
 import signal
 import sqlite3
-import pandas as pd
 import time
 import logging
 
@@ -41,6 +40,8 @@ os.environ["QSG_RHI_BACKEND"] = "opengl"
 
 from core.config import ConfigManager
 from core.data_loader import DataLoader
+from core.local_stats import read_local_stats
+from core.metrics_stream import MetricsStream
 from core.ssh_manager import SSHConnectionManager
 from core.security_engine import SecurityEngine
 from core.edp.pipeline import EDPPipeline
@@ -55,16 +56,28 @@ class DataBridge(QObject):
         self.vm = main_vm
         self.ssh = ssh_manager  # Persistent SSH connection
         self.loader = None
+        self.stream = None  # MetricsStream в режиме telemetry_mode == "stream"
         self.eaii_worker = None
         self.ai_analyzer = None
         self.last_raw_packets = None
+        self._last_frame_t = None
+        self._users_list = []
         self.last_metrics = {}
         self.discovery_data = {}
         self._discovery_done = False
         self._last_server_ip = None
         
         # EDP Pipeline — центральный обработчик данных
-        self.edp = EDPPipeline(data_dir=DATA_DIR)
+        self.edp = EDPPipeline(
+            data_dir=DATA_DIR,
+            dna_granularity=self.cfg.get("dna_granularity", "hour"),
+            dna_decay=self.cfg.get("dna_decay", "window"),
+            dna_halflife=self.cfg.get("dna_halflife", 250),
+            dna_quantile_metrics=self.cfg.get("dna_quantile_metrics", []),
+            incident_max_rows=self.cfg.get("incident_max_rows", 5000),
+            incident_max_age_days=self.cfg.get("incident_max_age_days", 180),
+            rules_path=os.path.join(DATA_DIR, self.cfg.get("correlation_rules_path", "edp_rules.yaml")),
+        )
         self._last_ai_context = None
         
         # Connect manual trigger to Interactive Deep Scan
@@ -81,6 +94,13 @@ class DataBridge(QObject):
         self._first_run = True
         
     def start(self):
+        # Push-режим: метрики идут фреймами по одному каналу, таймер sync
+        # остаётся только для БД (пользователи) и discovery
+        if self.cfg.get("telemetry_mode") == "stream":
+            self.stream = MetricsStream(self.ssh, self.cfg.get("stream_interval_ms", 1000))
+            self.stream.frame_ready.connect(self.on_stream_frame)
+            self.stream.start()
+        
         self.request_data()
         self.timer.start(self.interval)
         
@@ -89,6 +109,13 @@ class DataBridge(QObject):
             eaii_interval_ms = self.cfg.get("eaii_interval_min", 5) * 60 * 1000
             self._eaii_timer.start(eaii_interval_ms)
 
+    def stop(self):
+        if self.stream:
+            self.stream.stop()
+            self.stream.wait(3000)
+            self.stream = None
+        self.edp.close()
+
     def request_data(self):
         if self.loader and self.loader.isRunning():
             return
@@ -97,7 +124,8 @@ class DataBridge(QObject):
         current_ip = self.cfg.get("ip")
         need_discovery = not self._discovery_done or current_ip != self._last_server_ip
         
-        self.loader = DataLoader(self.ssh, self.cfg, skip_discovery=not need_discovery)
+        self.loader = DataLoader(self.ssh, self.cfg, skip_discovery=not need_discovery,
+                                 skip_metrics=self.stream is not None)
         self.loader.finished.connect(self.on_data_ready)
         self.loader.start()
         
@@ -152,6 +180,53 @@ class DataBridge(QObject):
             self.discovery_data = discovery
             self._discovery_done = True
         
+        cpu, ram, users_list = self._read_local_db()
+        self._users_list = users_list
+        
+        if self.stream is not None:
+            # Метрики приходят фреймами стрима, sync обновляет только пользователей
+            self.vm.update_users(users_list)
+            return
+        
+        self._process_metrics(cpu, ram, security_data, self.interval)
+        self.vm.update_users(users_list)
+
+    def on_stream_frame(self, frame):
+        """Фрейм push-телеметрии: CPU/RAM из агента, пользователи — из последнего sync БД."""
+        system = frame.get("system") or {}
+        # PPS считаем по реальному интервалу между фреймами
+        t = frame.get("t")
+        interval_ms = self.cfg.get("stream_interval_ms", 1000)
+        if t is not None and self._last_frame_t is not None and t > self._last_frame_t:
+            interval_ms = (t - self._last_frame_t) * 1000
+        self._last_frame_t = t
+        
+        self._process_metrics(
+            float(system.get("cpu", 0.0)), float(system.get("ram", 0.0)),
+            frame.get("security") or {}, interval_ms,
+        )
+
+    def _read_local_db(self):
+        """DB Data (CPU/RAM/Users) из локальной копии monitor_stats.db."""
+        cpu = 0.0
+        ram = 0.0
+        users_list = []
+        try:
+            (cpu, ram), users = read_local_stats(self.cfg.get("local_db"))
+            for email, down_mb, up_mb in users:
+                users_list.append({
+                    "user": email,
+                    "ip": "N/A",
+                    "traffic": f"{round(down_mb + up_mb, 2)} MB"
+                })
+        except sqlite3.OperationalError:
+            pass
+        except Exception as e:
+            logger.error(f"DB Error: {e}")
+        return cpu, ram, users_list
+
+    def _process_metrics(self, cpu, ram, security_data, interval_ms):
+        """Security-метрики + EDP Pipeline + обновление VM."""
         current_pps = 0
         current_jitter = 0.0
         probing_list = []
@@ -161,7 +236,7 @@ class DataBridge(QObject):
             raw_packets = security_data.get('raw_packets')
             if self.last_raw_packets:
                 current_pps = SecurityEngine.calculate_pps(
-                    raw_packets, self.last_raw_packets, self.interval
+                    raw_packets, self.last_raw_packets, interval_ms
                 )
             self.last_raw_packets = raw_packets
             
@@ -170,42 +245,13 @@ class DataBridge(QObject):
             
             # 3. PROBING
             probing_list = SecurityEngine.parse_probes(security_data.get('ssh_probes', []))
-            
-        # 4. DB Data (CPU/RAM/Users)
-        cpu = 0.0
-        ram = 0.0
-        users_list = []
-        try:
-            conn = sqlite3.connect(self.cfg.get("local_db"))
-            
-            query_sys = "SELECT cpu, ram FROM system_stats ORDER BY timestamp DESC LIMIT 1"
-            df_sys = pd.read_sql(query_sys, conn)
-            
-            query_users = "SELECT email, MAX(down)/1024/1024 as d, MAX(up)/1024/1024 as u FROM user_stats GROUP BY email ORDER BY d DESC"
-            df_users = pd.read_sql(query_users, conn)
-            
-            conn.close()
-            
-            if not df_sys.empty:
-                cpu = float(df_sys.iloc[0]['cpu'])
-                ram = float(df_sys.iloc[0]['ram'])
-                
-            if not df_users.empty:
-                for _, row in df_users.iterrows():
-                    users_list.append({
-                        "user": row['email'],
-                        "ip": "N/A",
-                        "traffic": f"{round(row['d'] + row['u'], 2)} MB"
-                    })
-        except sqlite3.OperationalError:
-            pass
-        except Exception as e:
-            logger.error(f"DB Error: {e}")
+
+        users_count = len(self._users_list)
 
         # === EDP Pipeline — единственный обработчик данных ===
         raw_edp = {
             "cpu": cpu, "ram": ram, "pps": current_pps, "jitter": current_jitter,
-            "users_count": len(users_list),
+            "users_count": users_count,
             "probes": probing_list,
         }
         edp_result = self.edp.process(raw_edp)
@@ -216,7 +262,7 @@ class DataBridge(QObject):
         
         self.last_metrics = {
             "cpu": cpu, "ram": ram, "pps": current_pps, "jitter": current_jitter,
-            "risk_score": risk_data[2], "users_count": len(users_list)
+            "risk_score": risk_data[2], "users_count": users_count
         }
         
         # EAII на первом успешном sync
@@ -227,7 +273,6 @@ class DataBridge(QObject):
         # UPDATE VM
         self.vm.update_metrics(cpu, ram, current_pps, current_jitter, risk_data)
         self.vm.update_metrics_edp(edp_result)
-        self.vm.update_users(users_list)
         self.vm.update_probes(probing_list if security_data else [])
 
 def main():
@@ -249,8 +294,9 @@ def main():
     local_db = cfg.get("local_db", "local_stats.db")
     if not os.path.isabs(local_db):
         cfg.set("local_db", os.path.join(DATA_DIR, local_db))
+    # Оба менеджера используют один transport (реестр по ip:port:user)
     ssh_manager = SSHConnectionManager(cfg)  # SSH для DataBridge (sync)
-    ssh_sandbox = SSHConnectionManager(cfg)  # Отдельное SSH для EAIS (sandbox)
+    ssh_sandbox = SSHConnectionManager(cfg, priority="sandbox", max_concurrency=5)  # EAIS (sandbox)
     main_vm = MainViewModel(None, SecurityEngine, cfg)
     sandbox_vm = SandboxViewModel(ssh_sandbox, cfg)
     bridge = DataBridge(cfg, main_vm, ssh_manager)
@@ -270,6 +316,7 @@ def main():
     if not engine.rootObjects():
         sys.exit(-1)
         
+    app.aboutToQuit.connect(bridge.stop)
     bridge.start()
     sys.exit(app.exec())
 
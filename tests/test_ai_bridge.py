@@ -49,7 +49,7 @@ def test_ai_analyzer_success_no_tools(MockAdapter, mock_cfg):
 
     analyzer.result_ready.emit.assert_called_once_with("Analysis Result")
 
-@patch("ai.bridge.paramiko.SSHClient")
+@patch("ai.bridge.SSHConnectionManager")
 @patch("ai.adapters.openai_adapter.OpenAIAdapter")
 def test_ai_analyzer_with_tools_and_limit(MockAdapter, MockSSH, mock_cfg):
     mock_adapter_instance = MockAdapter.return_value
@@ -71,18 +71,15 @@ def test_ai_analyzer_with_tools_and_limit(MockAdapter, MockSSH, mock_cfg):
     mock_adapter_instance.generate.side_effect = [first_response, second_response]
     
     mock_ssh_instance = MockSSH.return_value
-    mock_stdout = MagicMock()
-    mock_stdout.read.return_value = b"file1\nfile2"
-    mock_stderr = MagicMock()
-    mock_stderr.read.return_value = b""
-    mock_ssh_instance.exec_command.return_value = (None, mock_stdout, mock_stderr)
+    mock_ssh_instance.exec_command.return_value = (True, "file1\nfile2")
     
     analyzer = AIAnalyzer(mock_cfg, {}, {})
     analyzer.result_ready = MagicMock()
     analyzer.run()
     
     analyzer.result_ready.emit.assert_called_once_with("Final Analysis")
-    mock_ssh_instance.connect.assert_called_once()
+    # Общий transport через реестр, с приоритетом AI
+    MockSSH.assert_called_once_with(mock_cfg, priority="ai", max_concurrency=1)
     mock_ssh_instance.exec_command.assert_called_once_with("ls", timeout=15)
     mock_ssh_instance.close.assert_called_once()
 
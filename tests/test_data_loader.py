@@ -1,6 +1,8 @@
+import json
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from core.data_loader import DataLoader
+from core.db_sync import DeltaSyncError
 
 def test_data_loader_success():
     mock_ssh = MagicMock()
@@ -95,3 +97,85 @@ def test_data_loader_exception():
     args, _ = loader.finished.emit.call_args
     assert args[0] is False
     assert "DataLoader error: Test Error" in args[1]
+
+def _collector_cfg(key):
+    return {"remote_db": "remote.db", "local_db": "local.db", "sync_mode": "collector"}.get(key)
+
+def test_data_loader_collector_mode():
+    mock_ssh = MagicMock()
+    mock_ssh.connect.return_value = True
+    mock_ssh.exec_command.return_value = (True, json.dumps({
+        "security": {"raw_packets": "123456", "latencies": [10.5, 20.1], "ssh_probes": ["1.1.1.1"]},
+        "discovery": {"cpu_model": "Intel Core", "ram_total": "16G", "os_version": "Ubuntu 22.04", "panels": ["Marzban"]},
+    }))
+    mock_ssh.download_file.return_value = True
+    mock_cfg = MagicMock()
+    mock_cfg.get.side_effect = _collector_cfg
+
+    loader = DataLoader(mock_ssh, mock_cfg, skip_discovery=False)
+    loader.finished = MagicMock()
+    loader.run()
+
+    # Один round-trip на всё
+    mock_ssh.exec_command.assert_called_once()
+    assert "python3 -c" in mock_ssh.exec_command.call_args[0][0]
+    args, _ = loader.finished.emit.call_args
+    assert args[0] is True
+    assert args[2]['detected_panels'] == "Marzban"
+    assert args[3] == {"raw_packets": "123456", "latencies": [10.5, 20.1], "ssh_probes": ["1.1.1.1"]}
+
+def test_data_loader_collector_fallback():
+    mock_ssh = MagicMock()
+    mock_ssh.connect.return_value = True
+
+    def mock_exec_command(cmd, timeout=None):
+        if "python3 -c" in cmd: return True, "python3: command not found"
+        if "cat /proc/net/dev" in cmd: return True, "777"
+        return True, ""
+
+    mock_ssh.exec_command.side_effect = mock_exec_command
+    mock_ssh.download_file.return_value = True
+    mock_cfg = MagicMock()
+    mock_cfg.get.side_effect = _collector_cfg
+
+    loader = DataLoader(mock_ssh, mock_cfg, skip_discovery=True)
+    loader.finished = MagicMock()
+    loader.run()
+
+    args, _ = loader.finished.emit.call_args
+    assert args[0] is True
+    assert args[3]['raw_packets'] == "777"
+
+@patch("core.data_loader.sync_delta", return_value=5)
+def test_data_loader_delta_db_sync(mock_sync_delta):
+    mock_ssh = MagicMock()
+    mock_ssh.connect.return_value = True
+    mock_ssh.exec_command.return_value = (True, "")
+    mock_cfg = MagicMock()
+    mock_cfg.get.side_effect = lambda k: {"remote_db": "remote.db", "local_db": "local.db",
+                                          "db_sync_mode": "delta"}.get(k)
+
+    loader = DataLoader(mock_ssh, mock_cfg, skip_discovery=True)
+    loader.finished = MagicMock()
+    loader.run()
+
+    mock_sync_delta.assert_called_once_with(mock_ssh, "remote.db", "local.db")
+    mock_ssh.download_file.assert_not_called()
+    assert loader.finished.emit.call_args[0][0] is True
+
+@patch("core.data_loader.sync_delta", side_effect=DeltaSyncError("no local db"))
+def test_data_loader_delta_falls_back_to_download(mock_sync_delta):
+    mock_ssh = MagicMock()
+    mock_ssh.connect.return_value = True
+    mock_ssh.exec_command.return_value = (True, "")
+    mock_ssh.download_file.return_value = True
+    mock_cfg = MagicMock()
+    mock_cfg.get.side_effect = lambda k: {"remote_db": "remote.db", "local_db": "local.db",
+                                          "db_sync_mode": "delta"}.get(k)
+
+    loader = DataLoader(mock_ssh, mock_cfg, skip_discovery=True)
+    loader.finished = MagicMock()
+    loader.run()
+
+    mock_ssh.download_file.assert_called_once_with("remote.db", "local.db")
+    assert loader.finished.emit.call_args[0][0] is True
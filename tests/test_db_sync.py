@@ -0,0 +1,169 @@
+"""
+Тесты инкрементальной синхронизации monitor_stats.db.
+Remote-скрипт выполняется локально через bash вместо SSH.
+"""
+
+import os
+import sqlite3
+import subprocess
+import tempfile
+
+import pytest
+from unittest.mock import MagicMock
+
+from core.db_sync import DeltaSyncError, get_local_cursors, sync_delta
+
+
+def _create_monitor_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE system_stats
+                    (timestamp DATETIME DEFAULT (datetime('now','localtime')),
+                     cpu REAL, ram REAL, net_down REAL, net_up REAL)""")
+    conn.execute("""CREATE TABLE user_deltas
+                    (timestamp DATETIME DEFAULT (datetime('now','localtime')),
+                     email TEXT, down INTEGER, up INTEGER)""")
+    conn.execute("""CREATE TABLE user_totals
+                    (email TEXT PRIMARY KEY, down INTEGER, up INTEGER,
+                     last_down INTEGER, last_up INTEGER, updated DATETIME)""")
+    for tier in ("1m", "1h", "1d"):
+        conn.execute(f"CREATE TABLE system_rollup_{tier} "
+                     "(bucket DATETIME PRIMARY KEY, samples INTEGER, cpu_avg REAL)")
+    conn.commit()
+    conn.close()
+
+
+def _insert_system(path, *cpus):
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO system_stats (cpu, ram, net_down, net_up) VALUES (?, 50, 0, 0)",
+                     [(c,) for c in cpus])
+    conn.commit()
+    conn.close()
+
+
+def _local_ssh():
+    ssh = MagicMock()
+
+    def run(cmd, timeout=10):
+        proc = subprocess.run(["bash", "-c", cmd], capture_output=True, text=True, timeout=timeout)
+        return proc.returncode == 0, (proc.stdout or proc.stderr).strip()
+
+    ssh.exec_command.side_effect = run
+    return ssh
+
+
+@pytest.fixture
+def dbs():
+    tmp = tempfile.mkdtemp()
+    remote = os.path.join(tmp, "remote.db")
+    local = os.path.join(tmp, "local.db")
+    _create_monitor_db(remote)
+    _create_monitor_db(local)
+    yield remote, local
+    import shutil
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_delta_appends_only_new_rows(dbs):
+    remote, local = dbs
+    ssh = _local_ssh()
+    _insert_system(remote, 10, 20)
+    assert sync_delta(ssh, remote, local) == 2
+
+    _insert_system(remote, 30)
+    assert sync_delta(ssh, remote, local) == 1
+    assert get_local_cursors(local)["system_stats"] == 3
+
+    conn = sqlite3.connect(local)
+    cpus = [r[0] for r in conn.execute("SELECT cpu FROM system_stats ORDER BY rowid")]
+    conn.close()
+    assert cpus == [10, 20, 30]
+
+
+def test_delta_mirrors_remote_retention(dbs):
+    remote, local = dbs
+    ssh = _local_ssh()
+    _insert_system(remote, 10, 20, 30)
+    sync_delta(ssh, remote, local)
+
+    conn = sqlite3.connect(remote)
+    conn.execute("DELETE FROM system_stats WHERE rowid <= 2")
+    conn.commit()
+    conn.close()
+    sync_delta(ssh, remote, local)
+
+    conn = sqlite3.connect(local)
+    assert conn.execute("SELECT COUNT(*) FROM system_stats").fetchone()[0] == 1
+    conn.close()
+
+
+def test_delta_requires_full_download_without_local_db(dbs):
+    remote, local = dbs
+    os.unlink(local)
+    with pytest.raises(DeltaSyncError):
+        sync_delta(_local_ssh(), remote, local)
+
+
+def test_delta_detects_recreated_remote_db(dbs):
+    remote, local = dbs
+    ssh = _local_ssh()
+    _insert_system(remote, 10, 20, 30)
+    sync_delta(ssh, remote, local)
+
+    os.unlink(remote)
+    _create_monitor_db(remote)
+    _insert_system(remote, 40)
+    with pytest.raises(DeltaSyncError):
+        sync_delta(ssh, remote, local)
+
+
+def test_user_totals_copied_whole(dbs):
+    remote, local = dbs
+    ssh = _local_ssh()
+    conn = sqlite3.connect(remote)
+    conn.executemany("INSERT INTO user_totals (email, down, up) VALUES (?, ?, ?)",
+                     [("a@x", 100, 10), ("b@x", 200, 20)])
+    conn.commit()
+    sync_delta(ssh, remote, local)
+
+    # Upsert на remote не создаёт новых rowid — таблица всё равно обновляется
+    conn.execute("UPDATE user_totals SET down = 500 WHERE email = 'a@x'")
+    conn.execute("DELETE FROM user_totals WHERE email = 'b@x'")
+    conn.commit()
+    conn.close()
+    assert sync_delta(ssh, remote, local) == 0
+
+    conn = sqlite3.connect(local)
+    assert conn.execute("SELECT email, down FROM user_totals").fetchall() == [("a@x", 500)]
+    conn.close()
+
+
+def test_delta_requires_full_download_without_remote_totals(dbs):
+    remote, local = dbs
+    conn = sqlite3.connect(remote)
+    conn.execute("DROP TABLE user_totals")
+    conn.commit()
+    conn.close()
+    with pytest.raises(DeltaSyncError):
+        sync_delta(_local_ssh(), remote, local)
+
+
+def test_rollup_bucket_rewrite_is_synced(dbs):
+    remote, local = dbs
+    ssh = _local_ssh()
+    conn = sqlite3.connect(remote)
+    upsert = "INSERT OR REPLACE INTO system_rollup_1m (bucket, samples, cpu_avg) VALUES (?, ?, ?)"
+    conn.execute(upsert, ("2026-03-01 12:00:00", 1, 10.0))
+    conn.commit()
+    sync_delta(ssh, remote, local)
+
+    # Открытый бакет переписан на remote — новый rowid, дельта его подхватывает
+    conn.execute(upsert, ("2026-03-01 12:00:00", 2, 20.0))
+    conn.execute(upsert, ("2026-03-01 12:01:00", 1, 30.0))
+    conn.commit()
+    conn.close()
+    assert sync_delta(ssh, remote, local) == 2
+
+    conn = sqlite3.connect(local)
+    rows = conn.execute("SELECT bucket, samples, cpu_avg FROM system_rollup_1m ORDER BY bucket").fetchall()
+    conn.close()
+    assert rows == [("2026-03-01 12:00:00", 2, 20.0), ("2026-03-01 12:01:00", 1, 30.0)]
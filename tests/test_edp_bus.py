@@ -0,0 +1,184 @@
+"""
+Тесты EDP Bus — sync/async доставка, политики переполнения, Qt-адаптер.
+"""
+
+import threading
+import time
+
+import pytest
+
+from core.edp.bus import EDPBus, SubscriberQueue
+from core.edp.types import MetricValue
+
+
+class TestSubscriberQueue:
+    @pytest.mark.parametrize("policy, expected", [
+        ("drop_oldest", [3, 4, 5]),
+        ("drop_newest", [1, 2, 3]),
+        ("coalesce", [5]),
+    ])
+    def test_overflow_policies(self, policy, expected):
+        queue = SubscriberQueue(maxsize=3, policy=policy)
+        for i in range(1, 6):
+            queue.put(i)
+        assert queue.take_all() == expected
+        assert queue.dropped == 5 - len(expected)
+        assert len(queue) == 0
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            SubscriberQueue(policy="block")
+
+
+class TestEDPBus:
+    def test_sync_delivery(self):
+        bus = EDPBus()
+        received = []
+        bus.subscribe(MetricValue, received.append)
+        bus.subscribe(int, lambda e: received.append("int"))
+        bus.publish(MetricValue(value=1.0))
+        assert [e.value for e in received] == [1.0]
+        assert bus.subscriber_count == 2
+
+    def test_sync_error_isolated(self):
+        bus = EDPBus()
+        received = []
+        bus.subscribe(int, lambda e: 1 / 0)
+        bus.subscribe(int, received.append)
+        bus.publish(7)
+        assert received == [7]
+
+    def test_slow_async_subscriber_does_not_block(self):
+        bus = EDPBus()
+        release = threading.Event()
+        received = []
+        threads = set()
+
+        def slow(event):
+            release.wait(5)
+            threads.add(threading.current_thread().name)
+            received.append(event)
+
+        sub = bus.subscribe(int, slow, mode="async", max_queue=100)
+        start = time.monotonic()
+        for i in range(50):
+            bus.publish(i)
+        assert time.monotonic() - start < 1.0
+        release.set()
+        assert bus.join(timeout=5)
+        assert received == list(range(50))
+        assert sub.delivered == 50
+        assert all(name.startswith("edp-bus") for name in threads)
+        bus.close()
+
+    def test_async_backpressure_drops(self):
+        bus = EDPBus()
+        started, release = threading.Event(), threading.Event()
+        received = []
+
+        def slow(event):
+            started.set()
+            release.wait(5)
+            received.append(event)
+
+        sub = bus.subscribe(int, slow, mode="async", policy="coalesce")
+        bus.publish(0)
+        assert started.wait(5)      # Воркер забрал 0 и ждёт
+        for i in range(1, 10):
+            bus.publish(i)
+        release.set()
+        assert bus.join(timeout=5)
+        assert received == [0, 9]
+        assert sub.dropped == 8
+        bus.close()
+
+    def test_unsubscribe(self):
+        bus = EDPBus()
+        received = []
+        sub = bus.subscribe(int, received.append)
+        bus.unsubscribe(sub)
+        bus.publish(1)
+        assert received == []
+        assert bus.subscriber_count == 0
+
+
+class TestTickDelivery:
+    def test_batch_per_tick(self):
+        bus = EDPBus()
+        batches, each = [], []
+        bus.subscribe((MetricValue, str), batches.append, per_tick="batch")
+        bus.subscribe(str, each.append)
+        with bus.batch():
+            bus.publish(MetricValue(value=1.0))
+            bus.publish_many(["a", "b"])
+            bus.publish(3)
+            assert batches == [] and each == ["a", "b"]
+        assert len(batches) == 1
+        assert [getattr(e, "value", e) for e in batches[0]] == [1.0, "a", "b"]
+        assert bus.subscriber_count == 2
+
+    def test_latest_per_tick(self):
+        bus = EDPBus()
+        latest = []
+        bus.subscribe(int, latest.append, per_tick="latest")
+        with bus.batch():
+            bus.publish_many([1, 2, 3])
+        with bus.batch():
+            bus.publish("nothing for int")
+        bus.publish(4)          # Вне batch — отдельный тик
+        assert latest == [3, 4]
+
+    def test_async_batch(self):
+        bus = EDPBus()
+        batches = []
+        bus.subscribe(int, batches.append, mode="async", per_tick="batch")
+        bus.publish_many(range(5))
+        bus.publish_many(range(2))
+        assert bus.join(timeout=5)
+        assert batches == [[0, 1, 2, 3, 4], [0, 1]]
+        bus.close()
+
+    def test_unknown_tick_mode(self):
+        with pytest.raises(ValueError):
+            EDPBus().subscribe(int, print, per_tick="debounce")
+
+
+class TestQtBusAdapter:
+    def test_delivers_in_adapter_thread(self):
+        from PySide6.QtCore import QCoreApplication
+        from core.edp.qt_bus import QtBusAdapter
+
+        app = QCoreApplication.instance() or QCoreApplication([])
+        bus = EDPBus()
+        received = []
+        adapter = QtBusAdapter(bus, int, lambda e: received.append((e, threading.current_thread())))
+
+        publisher = threading.Thread(target=lambda: [bus.publish(i) for i in range(5)])
+        publisher.start()
+        publisher.join()
+        assert received == []           # До event loop ничего не вызвано
+
+        app.processEvents()
+        assert [e for e, _ in received] == list(range(5))
+        assert all(t is threading.main_thread() for _, t in received)
+        adapter.detach(bus)
+        assert bus.subscriber_count == 0
+
+    def test_same_thread_publish_is_queued(self):
+        from PySide6.QtCore import QCoreApplication
+        from core.edp.qt_bus import QtBusAdapter
+
+        app = QCoreApplication.instance() or QCoreApplication([])
+        bus = EDPBus()
+        received = []
+        adapter = QtBusAdapter(bus, int, received.append)
+
+        # Публикация из потока адаптера (как пайплайн в GUI-потоке)
+        for i in range(3):
+            bus.publish(i)
+        assert received == []           # publish вернулся, callback не вызван
+
+        app.processEvents()
+        assert received == [0, 1, 2]
+        adapter.detach(bus)
+
@@ -2,9 +2,15 @@
 Тесты EDP Correlator — правила корреляции.
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
 
-from core.edp.correlator import Correlator
+import pytest
+
+from core.edp.correlator import (
+    BUILTIN_RULES, CorrelationRule, Correlator, CountInWindow, FollowedBy, Sustained,
+    WindowOperator,
+)
 from core.edp.types import MetricValue, MetricSnapshot
 
 
@@ -94,3 +100,108 @@ class TestCorrelator:
         events = self.correlator.evaluate(snap)
         rule_ids = [e.rule_id for e in events]
         assert "coordinated_attack" not in rule_ids
+
+
+class TestCompiledCorrelator:
+    def test_shared_conditions_deduplicated(self):
+        """_users_stable, _jitter_double и т.п. — один бит на все правила."""
+        correlator = Correlator()
+        total = sum(len(rule.conditions) for rule in BUILTIN_RULES)
+        assert correlator.condition_count == 10 < total
+
+    def test_each_condition_evaluated_once_per_tick(self):
+        shared = MagicMock(return_value=True)
+        other = MagicMock(return_value=True)
+        correlator = Correlator(rules=[
+            CorrelationRule("a", "A", "high", "", [shared]),
+            CorrelationRule("b", "B", "high", "", [shared, other]),
+            CorrelationRule("c", "C", "high", "", [other, shared]),
+        ])
+        snap = _make_snapshot()
+        snap.to_raw_dict = MagicMock(return_value={"cpu": 30})
+
+        events = correlator.evaluate(snap)
+        assert [e.rule_id for e in events] == ["a", "b", "c"]
+        assert shared.call_count == other.call_count == 1
+        snap.to_raw_dict.assert_called_once()
+
+    def test_failing_condition_is_false(self):
+        def broken(snap, prev):
+            raise ValueError("boom")
+
+        correlator = Correlator(rules=[
+            CorrelationRule("broken", "Broken", "high", "", [broken]),
+            CorrelationRule("ok", "OK", "low", "", [lambda s, p: True]),
+        ])
+        assert [e.rule_id for e in correlator.evaluate(_make_snapshot())] == ["ok"]
+
+    def test_add_rule_compiles_new_conditions(self):
+        correlator = Correlator()
+        before = correlator.condition_count
+        correlator.add_rule(CorrelationRule(
+            "hot_cpu", "Hot CPU", "medium", "",
+            [BUILTIN_RULES[2].conditions[0], lambda s, p: s.cpu.pct_change > 50],
+        ))
+        assert correlator.condition_count == before + 1
+        snap = _make_snapshot(cpu_val=95, cpu_pct=80, pps_pct=40)
+        assert [e.rule_id for e in correlator.evaluate(snap)] == ["hot_cpu"]
+
+
+def _tick(n):
+    return datetime(2026, 3, 3, 12, 0) + timedelta(seconds=10 * n)
+
+
+def _run(op, hits):
+    """Прогоняет оператор по тикам раз в 10 с; hits — tuple или bool на тик."""
+    return [op.update(h if isinstance(h, tuple) else (h,), _tick(i)) for i, h in enumerate(hits)]
+
+
+class TestWindowOperators:
+    def test_sustained_ticks(self):
+        op = Sustained(None, ticks=3)
+        assert _run(op, [1, 1, 0, 1, 1, 1, 1]) == [False, False, False, False, False, True, True]
+
+    def test_sustained_seconds(self):
+        op = Sustained(None, seconds=30)
+        assert _run(op, [1, 1, 1, 1, 0, 1]) == [False, False, False, True, False, False]
+
+    def test_count_in_window_ticks(self):
+        op = CountInWindow(None, count=2, ticks=3)
+        assert _run(op, [1, 0, 1, 0, 0, 1, 1]) == [False, False, True, False, False, False, True]
+
+    def test_count_in_window_seconds(self):
+        op = CountInWindow(None, count=2, seconds=30)
+        assert _run(op, [1, 0, 1, 0, 0, 1]) == [False, False, True, True, False, True]
+
+    def test_followed_by(self):
+        op = FollowedBy(None, None, seconds=20)
+        hits = [(1, 1), (0, 0), (0, 1), (0, 0), (0, 0), (0, 1)]
+        # Одновременные first/then не считаются, then через 50 с — уже поздно
+        assert _run(op, hits) == [False, False, True, False, False, False]
+
+    def test_correlator_feeds_operator_from_bits(self):
+        jitter = MagicMock(return_value=True)
+        correlator = Correlator(rules=[
+            CorrelationRule("jitter_now", "J", "low", "", [jitter]),
+            CorrelationRule("jitter_long", "JL", "high", "", [Sustained(jitter, ticks=3)]),
+        ])
+        fired = []
+        for i in range(3):
+            snap = _make_snapshot()
+            snap.timestamp = _tick(i)
+            fired.append([e.rule_id for e in correlator.evaluate(snap)])
+        assert fired == [["jitter_now"], ["jitter_now"], ["jitter_now", "jitter_long"]]
+        assert jitter.call_count == 3
+        assert correlator.condition_count == 2
+
+    def test_operator_as_plain_condition(self):
+        rule = CorrelationRule("x", "X", "low", "", [Sustained(lambda s, p: s.cpu.value > 80, ticks=2)])
+        snap = _make_snapshot(cpu_val=90)
+        assert [rule.evaluate(snap), rule.evaluate(snap)] == [False, True]
+
+    def test_operator_requires_update(self):
+        class NoUpdate(WindowOperator):
+            pass
+
+        with pytest.raises(TypeError):
+            NoUpdate()
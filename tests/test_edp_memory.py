@@ -3,10 +3,13 @@
 """
 
 import os
+import random
 import tempfile
-from datetime import datetime
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
 
-from core.edp.memory import TemporalMemory, IncidentMemory
+from core.edp.incident_index import FingerprintIndex
+from core.edp.memory import TemporalMemory, IncidentMemory, _DIRECTIONS
 from core.edp.types import MetricValue, MetricSnapshot, IncidentFingerprint
 
 
@@ -21,6 +24,19 @@ def _make_snapshot(cpu=30, pps=200, jitter=5, timestamp=None):
     )
 
 
+def _reference_trend(values):
+    """Эталон get_trend: средние половин окна по списку значений."""
+    if len(values) < 3:
+        return "stable"
+    mid = len(values) // 2
+    first = sum(values[:mid]) / mid
+    second = sum(values[mid:]) / (len(values) - mid)
+    if first == 0:
+        return "stable"
+    change = (second - first) / first * 100
+    return "up" if change > 15 else "down" if change < -15 else "stable"
+
+
 class TestTemporalMemory:
     def test_add_and_last(self):
         mem = TemporalMemory(max_size=10)
@@ -86,6 +102,86 @@ class TestTemporalMemory:
         assert "cpu" in summary
         assert "avg" in summary
 
+    def test_window_after_wraparound(self):
+        mem = TemporalMemory(max_size=5)
+        for i in range(13):
+            mem.add(_make_snapshot(cpu=i, pps=i * 100))
+        assert mem.get_metric_values("cpu", 10) == [8, 9, 10, 11, 12]
+        assert mem.window("pps", 3).tolist() == [1000, 1100, 1200]
+        assert [s.cpu.value for s in mem.get_history(2)] == [11, 12]
+        assert len(mem.timestamps(4)) == 4
+
+    def test_window_is_readonly_view(self):
+        mem = TemporalMemory(max_size=10)
+        for v in [1, 2, 3]:
+            mem.add(_make_snapshot(cpu=v))
+        view = mem.window("cpu", 2)
+        assert view.base is not None
+        assert not view.flags.writeable
+        assert mem.get_metric_values("probes") == []
+
+    def test_incremental_aggregates_match_rescan(self):
+        rng = random.Random(5)
+        mem = TemporalMemory(max_size=100)
+        for i in range(250):
+            mem.add(_make_snapshot(cpu=rng.uniform(0, 100), pps=rng.lognormvariate(5, 1)))
+            if i % 17 == 0:
+                for metric in ("cpu", "pps"):
+                    vals = mem.get_metric_values(metric, 60)
+                    agg = mem._aggregates[metric]
+                    assert abs(agg.avg - sum(vals) / len(vals)) < 1e-9
+                    assert agg.peak == max(vals)
+        # Нестандартное окно считается по ring и не заводит новый агрегат
+        peak = max(mem.get_metric_values("cpu", 30))
+        assert f"cpu: avg {sum(mem.get_metric_values('cpu', 30)) / 30:.0f}, peak {peak:.0f}" \
+            in mem.get_summary(30)
+        assert len(mem._aggregates) == 4
+
+    def test_trend_on_full_window(self):
+        mem = TemporalMemory(max_size=50)
+        for v in range(60):
+            mem.add(_make_snapshot(cpu=50))
+        for v in [50, 50, 50, 50, 50, 80, 85, 90, 95, 99]:
+            mem.add(_make_snapshot(cpu=v))
+        assert mem.get_trend("cpu", 10) == "up"
+        assert mem.get_trend("cpu", 4) == "stable"
+
+    def test_trend_all_zero_window_after_values(self):
+        mem = TemporalMemory(max_size=50)
+        for v in [37.3, 12.1, 55.7] + [0.0] * 20:
+            mem.add(_make_snapshot(cpu=v))
+            assert mem.get_trend("cpu", 10) == _reference_trend(mem.get_metric_values("cpu", 10))
+        assert mem.get_trend("cpu", 10) == "stable"
+
+    def test_trend_matches_reference_on_replay(self):
+        rng = random.Random(8)
+        mem = TemporalMemory(max_size=40)
+        for _ in range(2000):
+            mem.add(_make_snapshot(cpu=rng.choice((0.0, 0.0, rng.uniform(0, 100)))))
+            for window in (4, 10, 60):
+                expected = _reference_trend(mem.get_metric_values("cpu", window))
+                assert mem.get_trend("cpu", window) == expected
+
+    def test_rollup_tiers(self):
+        mem = TemporalMemory(max_size=30)
+        start = datetime(2026, 10, 1, 0, 0)
+        # 3 суток замеров раз в 30 секунд — больше, чем вмещает минутный уровень
+        t = start
+        while t < start + timedelta(days=3):
+            mem.add(_make_snapshot(cpu=20 if t.hour else 90, timestamp=t))
+            t += timedelta(seconds=30)
+
+        minutes = mem.get_rollups("1m")
+        assert len(minutes["timestamps"]) == 24 * 60
+        hours = mem.get_rollups("1h", count=24)
+        assert len(hours["cpu"]["avg"]) == 24
+        assert hours["cpu"]["max"].max() == 90
+        assert hours["count"][-1] == 120
+
+        summary = mem.get_horizon_summary()
+        assert "за 24 ч" in summary and "за 30 дн" in summary
+        assert "cpu avg" in summary
+
 
 class TestIncidentMemory:
     def _get_db_path(self):
@@ -189,3 +285,280 @@ class TestIncidentMemory:
             assert fp.deviations["pps"] == 5.0
         finally:
             os.unlink(db)
+
+    def test_match_uses_index_not_disk(self):
+        db = self._get_db_path()
+        try:
+            mem = IncidentMemory(db_path=db)
+            mem.save_incident(IncidentFingerprint(
+                id="inc1",
+                timestamp=datetime(2026, 3, 1),
+                pattern={"pps": "spike", "jitter": "up"},
+                deviations={"pps": 5.0, "jitter": 2.0},
+                outcome="ddos",
+                match_threshold=0.7,
+            ))
+            conn, mem._conn = mem._conn, MagicMock()
+            matches = mem.match({"pps": "spike", "jitter": "up"}, {"pps": 5.0, "jitter": 2.0})
+            assert len(matches) == 1
+            mem._conn.execute.assert_not_called()
+            mem._conn = conn
+            mem.close()
+        finally:
+            os.unlink(db)
+
+    def test_write_through_survives_reload(self):
+        db = self._get_db_path()
+        try:
+            mem = IncidentMemory(db_path=db)
+            mem.save_incident(IncidentFingerprint(
+                id="inc1",
+                timestamp=datetime(2026, 3, 1),
+                pattern={"pps": "spike"},
+                deviations={"pps": 5.0},
+                match_threshold=0.7,
+            ))
+            mem.update_outcome("inc1", "dpi_throttling", "Reality", True)
+            match = mem.match({"pps": "spike"}, {"pps": 5.0})[0]
+            assert match.fingerprint.outcome == "dpi_throttling"
+            mem.close()
+
+            reloaded = IncidentMemory(db_path=db)
+            fp = reloaded.match({"pps": "spike"}, {"pps": 5.0})[0].fingerprint
+            assert (fp.outcome, fp.resolution, fp.resolution_worked) == ("dpi_throttling", "Reality", True)
+            assert reloaded.count == 1
+            reloaded.close()
+        finally:
+            os.unlink(db)
+
+
+    def test_record_hit_instead_of_duplicate(self):
+        db = self._get_db_path()
+        try:
+            mem = IncidentMemory(db_path=db)
+            mem.save_incident(IncidentFingerprint(
+                id="inc1", timestamp=datetime.now(),
+                pattern={"pps": "spike"}, deviations={"pps": 5.0},
+            ))
+            similar = mem.find_similar({"pps": "spike"}, {"pps": 5.1})
+            assert similar.id == "inc1"
+            seen = datetime.now()
+            mem.record_hit(similar.id, seen)
+            assert mem.find_similar({"pps": "drop"}, {"pps": -5.0}) is None
+            mem.close()
+
+            reloaded = IncidentMemory(db_path=db)
+            fp = reloaded.match({"pps": "spike"}, {"pps": 5.0})[0].fingerprint
+            assert (fp.hit_count, fp.last_seen) == (2, seen)
+            assert reloaded.count == 1
+            reloaded.close()
+        finally:
+            os.unlink(db)
+
+    def test_compact_merges_near_duplicates(self):
+        db = self._get_db_path()
+        try:
+            mem = IncidentMemory(db_path=db, merge_similarity=0.95)
+            now = datetime.now()
+            pattern = {"pps": "spike", "jitter": "up"}
+            for i, dev in enumerate((5.0, 5.05, 4.95)):
+                mem.save_incident(IncidentFingerprint(
+                    id=f"dup{i}", timestamp=now - timedelta(hours=i),
+                    pattern=pattern, deviations={"pps": dev, "jitter": 2.0},
+                ))
+            mem.save_incident(IncidentFingerprint(
+                id="other", timestamp=now,
+                pattern=pattern, deviations={"pps": 1.0, "jitter": 9.0},
+            ))
+
+            assert mem.compact() == 2
+            assert mem.count == 2
+            keeper = mem.match(pattern, {"pps": 5.0, "jitter": 2.0})[0].fingerprint
+            assert (keeper.id, keeper.hit_count) == ("dup0", 3)
+            mem.close()
+            assert IncidentMemory(db_path=db).count == 2
+        finally:
+            os.unlink(db)
+
+    def test_compaction_is_lazy_and_budgeted(self, monkeypatch):
+        db = self._get_db_path()
+        try:
+            IncidentMemory(db_path=db).close()
+            import sqlite3
+            now = datetime.now().isoformat()
+            conn = sqlite3.connect(db)
+            conn.executemany(
+                "INSERT INTO incident_memory (id, timestamp, pattern, deviations) VALUES (?, ?, ?, ?)",
+                [(f"{bucket}{i}", now, f'{{"pps": "{bucket}"}}', f'{{"pps": {5 + i * 0.001}}}')
+                 for bucket in ("spike", "drop") for i in range(30)],
+            )
+            conn.commit()
+            conn.close()
+
+            # Конструктор не компактирует: дубликаты ещё на месте
+            mem = IncidentMemory(db_path=db)
+            assert mem.count == 60
+
+            # Бюджет кончается на первом бакете; следующий вызов берёт другой
+            monkeypatch.setattr("core.edp.memory._MERGE_BUDGET", 1)
+            assert mem.compact() == 29
+            assert mem.compact() == 29
+            assert mem.count == 2
+            assert sum(fp.hit_count for fp in mem._index) == 60
+            mem.close()
+        finally:
+            os.unlink(db)
+
+    def test_startup_compaction_runs_on_first_save(self):
+        db = self._get_db_path()
+        try:
+            mem = IncidentMemory(db_path=db)
+            now = datetime.now()
+            for i, metric in enumerate(("cpu", "ram", "pps")):
+                mem.save_incident(IncidentFingerprint(
+                    id=metric, timestamp=now - timedelta(minutes=10 - i),
+                    pattern={metric: "spike"}, deviations={},
+                ))
+            mem.close()
+
+            reopened = IncidentMemory(db_path=db, max_rows=2)
+            assert reopened.count == 3
+            reopened.save_incident(IncidentFingerprint(
+                id="new", timestamp=now, pattern={"jitter": "up"}, deviations={},
+            ))
+            # Отложенная компакция прошла до вставки новой записи
+            assert sorted(fp.id for fp in reopened._index) == ["new", "pps", "ram"]
+            reopened.close()
+        finally:
+            os.unlink(db)
+
+    def test_age_retention_spares_confirmed(self):
+        db = self._get_db_path()
+        try:
+            mem = IncidentMemory(db_path=db, max_age_days=30)
+            old = datetime.now() - timedelta(days=90)
+            for i, pattern in enumerate(({"pps": "spike"}, {"cpu": "spike"}, {"ram": "up"})):
+                mem.save_incident(IncidentFingerprint(
+                    id=f"old{i}", timestamp=old, pattern=pattern, deviations={},
+                    outcome_source="user_feedback" if i == 1 else "auto",
+                    resolution_worked=i == 2,
+                ))
+            mem.save_incident(IncidentFingerprint(
+                id="seen", timestamp=old, last_seen=datetime.now(),
+                pattern={"jitter": "up"}, deviations={},
+            ))
+            mem.close()
+
+            # Просроченное удаляется ещё при открытии БД
+            reloaded = IncidentMemory(db_path=db, max_age_days=30)
+            assert sorted(fp.id for fp in reloaded._index) == ["old1", "old2", "seen"]
+            reloaded.close()
+        finally:
+            os.unlink(db)
+
+    def test_max_rows_evicts_unconfirmed_first(self):
+        db = self._get_db_path()
+        try:
+            mem = IncidentMemory(db_path=db, max_rows=3)
+            now = datetime.now()
+            for i, metric in enumerate(("cpu", "ram", "pps", "jitter", "probes")):
+                mem.save_incident(IncidentFingerprint(
+                    id=metric, timestamp=now - timedelta(minutes=10 - i),
+                    pattern={metric: "spike"}, deviations={},
+                    hit_count=5 if metric == "cpu" else 1,
+                    resolution_worked=metric == "ram",
+                ))
+            assert mem.compact() == 2
+            # Остаются подтверждённый, частый и самый свежий
+            assert sorted(fp.id for fp in mem._index) == ["cpu", "probes", "ram"]
+            mem.close()
+        finally:
+            os.unlink(db)
+
+    def test_migrates_schema_without_hit_count(self):
+        db = self._get_db_path()
+        try:
+            import sqlite3
+            conn = sqlite3.connect(db)
+            conn.execute("""
+                CREATE TABLE incident_memory (
+                    id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, pattern TEXT NOT NULL,
+                    deviations TEXT NOT NULL, outcome TEXT DEFAULT 'unknown',
+                    outcome_source TEXT DEFAULT 'auto', resolution TEXT,
+                    resolution_worked INTEGER DEFAULT 0, match_threshold REAL DEFAULT 0.75
+                )
+            """)
+            conn.execute(
+                "INSERT INTO incident_memory (id, timestamp, pattern, deviations) VALUES (?, ?, ?, ?)",
+                ("legacy", datetime.now().isoformat(), '{"pps": "spike"}', '{"pps": 5.0}'),
+            )
+            conn.commit()
+            conn.close()
+
+            mem = IncidentMemory(db_path=db)
+            fp = mem.find_similar({"pps": "spike"}, {"pps": 5.0})
+            assert (fp.id, fp.hit_count, fp.last_seen) == ("legacy", 1, None)
+            mem.close()
+        finally:
+            os.unlink(db)
+
+class TestFingerprintIndex:
+    def test_vectorized_scores_match_reference(self):
+        rng = random.Random(11)
+        keys = ("cpu", "ram", "pps", "jitter", "probes", "extra")
+
+        def pattern():
+            return {k: rng.choice(_DIRECTIONS) for k in keys if rng.random() < 0.8}
+
+        def deviations():
+            return {k: rng.uniform(-6, 6) for k in keys[:4] if rng.random() < 0.8}
+
+        index = FingerprintIndex(_DIRECTIONS, capacity=4)
+        fps = [
+            IncidentFingerprint(id=str(i), timestamp=datetime(2026, 3, 1),
+                                pattern=pattern(), deviations=deviations(),
+                                match_threshold=rng.choice((0.5, 0.75, 0.9)))
+            for i in range(300)
+        ]
+        for fp in fps:
+            index.upsert(fp)
+        for fp in fps[::5]:
+            index.remove(fp.id)
+        live = [fp for i, fp in enumerate(fps) if i % 5]
+        assert len(index) == len(live)
+
+        for _ in range(30):
+            q_pattern, q_devs = pattern(), deviations()
+            hits = {fp.id: sim for fp, sim in index.match(q_pattern, q_devs)}
+            for fp in live:
+                ref = IncidentMemory._calculate_similarity(q_pattern, fp.pattern,
+                                                           q_devs, fp.deviations)
+                if ref >= fp.match_threshold:
+                    assert abs(hits[fp.id] - ref) < 1e-12
+                else:
+                    assert fp.id not in hits
+
+    def test_bucket_pruning_and_most_similar(self):
+        index = FingerprintIndex(_DIRECTIONS)
+        base = {"cpu": "stable", "ram": "stable", "pps": "spike", "jitter": "up", "probes": "new"}
+        far = {"cpu": "down", "ram": "up", "pps": "drop", "jitter": "down", "probes": "none"}
+        for i in range(50):
+            index.upsert(IncidentFingerprint(id=f"far{i}", timestamp=datetime(2026, 3, 1),
+                                             pattern=dict(far), deviations={"pps": 1.0}))
+        index.upsert(IncidentFingerprint(id="close", timestamp=datetime(2026, 3, 1),
+                                         pattern=dict(base), deviations={"pps": 5.0},
+                                         match_threshold=0.95))
+
+        # Бакет с далёким паттерном не может дотянуть до порога — не скорится
+        rows = index._candidates(index._encode(base, {})[0],
+                                 index._bucket_thresholds[:len(index._bucket_rows)])
+        assert [index._fingerprints[r].id for r in rows] == ["close"]
+
+        # Сходство 0.91 ниже порога строки (0.95), но для дедупликации найдётся
+        assert index.match(base, {"pps": 3.5}) == []
+        assert index.most_similar(base, {"pps": 3.5}, 0.9)[0].id == "close"
+        assert index.most_similar(far, {"pps": 1.0}, 0.9)[0].id.startswith("far")
+        assert index.most_similar(far, {"pps": 9.0}, 0.9) is None
+
+        index.remove("close")
+        assert index.most_similar(base, {"pps": 5.0}, 0.9) is None
@@ -103,3 +103,31 @@ class TestEDPPipeline:
         if correlation_events:
             # Должен быть сохранён incident
             assert self.pipeline.incidents.count >= 1
+
+    def test_rules_file_loaded(self):
+        """Правила из файла участвуют в корреляции без перезапуска."""
+        import json
+        rules_path = os.path.join(self.tmp, "edp_rules.json")
+        pipeline = EDPPipeline(data_dir=self.tmp, rules_path=rules_path)
+        pipeline._rule_watcher.check_interval = 0
+        assert pipeline.process(_raw_normal()).events == []
+
+        with open(rules_path, "w", encoding="utf-8") as f:
+            json.dump({"rules": [{"id": "busy_cpu", "when": ["cpu.value > 20"]}]}, f)
+        events = pipeline.process(_raw_normal()).events
+        assert [e.rule_id for e in events] == ["busy_cpu"]
+        pipeline.close()
+
+    def test_bus_one_batch_per_tick(self):
+        """Снэпшот, события и совпадения приходят одним вызовом за цикл."""
+        from core.edp.types import MetricSnapshot, ThreatEvent, IncidentMatch
+        batches = []
+        self.pipeline.bus.subscribe((MetricSnapshot, ThreatEvent, IncidentMatch),
+                                    batches.append, per_tick="batch")
+        for _ in range(15):
+            self.pipeline.process(_raw_normal())
+        result = self.pipeline.process(_raw_anomaly())
+        assert len(batches) == 16
+        assert batches[-1][0] is result.snapshot
+        assert batches[-1][1:] == result.events + result.incident_matches
+        assert len(result.events) > 1
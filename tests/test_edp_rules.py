@@ -0,0 +1,172 @@
+"""
+Тесты EDP Rules — декларативные правила корреляции и hot-reload.
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.edp.correlator import Correlator
+from core.edp.rules import (
+    RuleFormatError, RuleWatcher, compile_condition, load_rules, parse_rules,
+)
+from core.edp.types import MetricValue, MetricSnapshot
+
+
+DPI_RULE = {
+    "id": "dpi_throttling",
+    "name": "DPI Throttling (tuned)",
+    "severity": "high",
+    "when": ["pps.pct_change < -50", "jitter.pct_change > 100", "abs(users_delta) <= 1"],
+}
+
+
+def _make_snapshot(cpu_val=30, pps_pct=0, jitter_pct=0, users_delta=0, new_probes=None):
+    return MetricSnapshot(
+        timestamp=datetime(2026, 3, 3, 12, 0),
+        cpu=MetricValue(value=cpu_val),
+        ram=MetricValue(value=50),
+        pps=MetricValue(value=200, pct_change=pps_pct),
+        jitter=MetricValue(value=5, pct_change=jitter_pct),
+        users_count=10,
+        users_delta=users_delta,
+        new_probes=new_probes or [],
+    )
+
+
+def _write(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data if isinstance(data, str) else json.dumps(data))
+
+
+class TestRuleParsing:
+    def test_string_and_dict_conditions(self):
+        rules = parse_rules({"rules": [{
+            "id": "probe_storm",
+            "severity": "medium",
+            "when": ["new_probes >= 5", {"field": "pps.deviation", "op": ">", "value": 3}],
+        }]})
+        rule = rules[0]
+        assert (rule.rule_id, rule.name, rule.severity) == ("probe_storm", "probe_storm", "medium")
+        snap = _make_snapshot(new_probes=[f"10.0.0.{i}" for i in range(5)])
+        snap.pps.deviation = 3.5
+        assert rule.evaluate(snap)
+        snap.pps.deviation = 2.0
+        assert not rule.evaluate(snap)
+
+    def test_abs_condition(self):
+        cond = compile_condition("users_delta", "<=", 1, use_abs=True)
+        assert cond(_make_snapshot(users_delta=-1), None)
+        assert not cond(_make_snapshot(users_delta=-3), None)
+
+    def test_identical_conditions_are_interned(self):
+        rules = parse_rules([
+            {"id": "a", "when": ["cpu.value > 85", "ram.value > 80"]},
+            {"id": "b", "when": ["cpu.value>85.0"]},
+        ])
+        assert rules[0].conditions[0] is rules[1].conditions[0]
+        assert Correlator(rules=rules).condition_count == 2
+
+    @pytest.mark.parametrize("rules", [
+        [{"id": "x", "when": ["disk.value > 1"]}],
+        [{"id": "x", "when": ["cpu.value => 1"]}],
+        [{"id": "x", "when": []}],
+        [{"id": "x", "severity": "fatal", "when": ["cpu.value > 1"]}],
+        [{"id": "x", "when": ["cpu.value > 1"]}, {"id": "x", "when": ["ram.value > 1"]}],
+        [{"name": "no id", "when": ["cpu.value > 1"]}],
+    ])
+    def test_invalid_rules_rejected(self, rules):
+        with pytest.raises(RuleFormatError):
+            parse_rules(rules)
+
+    def test_window_conditions(self):
+        rule = parse_rules([{
+            "id": "probes_then_spike",
+            "when": [
+                {"first": "new_probes >= 3", "then": "pps.pct_change > 100", "within": 60},
+                {"sustained": "cpu.value > 20", "ticks": 2},
+            ],
+        }])[0]
+        correlator = Correlator(rules=[rule])
+        probes = _make_snapshot(new_probes=["a", "b", "c"])
+        spike = _make_snapshot(pps_pct=300)
+        spike.timestamp = probes.timestamp + timedelta(seconds=30)
+        assert correlator.evaluate(probes) == []
+        assert [e.rule_id for e in correlator.evaluate(spike)] == ["probes_then_spike"]
+
+    @pytest.mark.parametrize("cond", [
+        {"sustained": "cpu.value > 1"},
+        {"count": "cpu.value > 1", "ticks": 3},
+        {"count": "cpu.value > 1", "at_least": 2, "ticks": 3, "seconds": 10},
+        {"first": "cpu.value > 1", "then": "disk.value > 1", "within": 10},
+    ])
+    def test_invalid_window_conditions(self, cond):
+        with pytest.raises(RuleFormatError):
+            parse_rules([{"id": "x", "when": [cond]}])
+
+    def test_load_yaml(self):
+        pytest.importorskip("yaml")
+        fd, path = tempfile.mkstemp(suffix=".yaml")
+        os.close(fd)
+        try:
+            _write(path, (
+                "rules:\n"
+                "  - id: hot_cpu\n"
+                "    severity: low\n"
+                "    when:\n"
+                "      - cpu.value > 90\n"
+            ))
+            rules = load_rules(path)
+            assert rules[0].evaluate(_make_snapshot(cpu_val=95))
+        finally:
+            os.unlink(path)
+
+
+class TestRuleReload:
+    def setup_method(self):
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+
+    def teardown_method(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def test_file_rule_overrides_builtin(self):
+        _write(self.path, {"rules": [DPI_RULE]})
+        correlator = Correlator()
+        correlator.set_file_rules(load_rules(self.path))
+
+        # Встроенный порог -30% больше не срабатывает, новый -50% — да
+        snap = _make_snapshot(pps_pct=-40, jitter_pct=300)
+        assert "dpi_throttling" not in [e.rule_id for e in correlator.evaluate(snap)]
+        snap = _make_snapshot(pps_pct=-60, jitter_pct=300)
+        events = correlator.evaluate(snap)
+        assert [e.description for e in events] == ["DPI Throttling (tuned): "]
+        assert len(correlator.rules) == 4
+
+    def test_watcher_reloads_on_change(self):
+        watcher = RuleWatcher(self.path, check_interval=0)
+        _write(self.path, {"rules": [DPI_RULE]})
+        assert [r.rule_id for r in watcher.poll()] == ["dpi_throttling"]
+        assert watcher.poll() is None
+
+        _write(self.path, {"rules": [DPI_RULE, {"id": "hot_cpu", "when": ["cpu.value > 90"]}]})
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 10**9))
+        assert [r.rule_id for r in watcher.poll()] == ["dpi_throttling", "hot_cpu"]
+
+        # Битый файл не сбрасывает правила, удалённый — сбрасывает
+        _write(self.path, "{not json")
+        assert watcher.poll() is None
+        os.unlink(self.path)
+        assert watcher.poll() == []
+
+    def test_watcher_throttles_stat(self):
+        _write(self.path, {"rules": [DPI_RULE]})
+        watcher = RuleWatcher(self.path, check_interval=3600)
+        assert watcher.poll() is not None
+        _write(self.path, {"rules": []})
+        assert watcher.poll() is None
+        assert watcher.poll(force=True) == []
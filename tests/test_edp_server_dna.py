@@ -0,0 +1,267 @@
+"""
+Тесты EDP Server DNA — базлайны по часу и потоковая статистика.
+"""
+
+import json
+import math
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from core.edp import dna_store
+from core.edp.server_dna import ServerDNA
+from core.edp.stats import EwmaStats, QuantileSketch, RollingWindow
+
+
+def _reference_verdict(values, value):
+    """Исходная формула: mean и популяционная σ по списку последних 500 значений."""
+    mean = sum(values) / len(values)
+    variance = sum((x - mean) ** 2 for x in values) / len(values)
+    std = math.sqrt(variance) if variance > 0 else 0.001
+    deviation = (value - mean) / std
+    abs_dev = abs(deviation)
+    verdict = "anomaly" if abs_dev > 2.0 else "elevated" if abs_dev > 1.0 else "normal"
+    return round(mean, 2), round(deviation, 2), verdict
+
+
+class TestRollingWindow:
+    def test_mean_and_variance(self):
+        w = RollingWindow(capacity=10)
+        for v in [2, 4, 4, 4, 5, 5, 7, 9]:
+            w.add(v)
+        assert w.count == 8
+        assert w.mean == 5.0
+        assert math.isclose(w.std, 2.0)
+
+    def test_eviction_keeps_last_values(self):
+        w = RollingWindow(capacity=3)
+        for v in range(10):
+            w.add(v)
+        assert w.values() == [7.0, 8.0, 9.0]
+        assert math.isclose(w.mean, 8.0)
+        assert math.isclose(w.variance, 2 / 3)
+
+    def test_constant_series_has_zero_variance(self):
+        w = RollingWindow(capacity=5)
+        for v in [0.1, 0.7, 0.3] + [0.2] * 20:
+            w.add(v)
+        assert w.variance == 0.0
+
+    def test_from_values(self):
+        w = RollingWindow.from_values(range(20), capacity=5)
+        assert w.values() == [15.0, 16.0, 17.0, 18.0, 19.0]
+
+
+class TestEwmaStats:
+    def test_tracks_mean_and_forgets(self):
+        s = EwmaStats(EwmaStats.alpha_for_halflife(10))
+        for _ in range(200):
+            s.add(10)
+        assert math.isclose(s.mean, 10.0)
+        assert s.variance == 0.0
+        for _ in range(10):
+            s.add(30)
+        # За один halflife вес старого уровня падает вдвое
+        assert math.isclose(s.mean, 20.0, rel_tol=1e-9)
+        assert s.std > 0
+
+
+class TestQuantileSketch:
+    def test_heavy_tail_quantiles(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(5, 1) for _ in range(5000)]
+        sketch = QuantileSketch()
+        for v in values:
+            sketch.add(v)
+        values.sort()
+        for q in sketch.quantiles:
+            exact = values[int(q * len(values))]
+            assert abs(sketch.quantile(q) - exact) / exact < 0.05
+
+    def test_raw_state_roundtrip(self):
+        a = QuantileSketch()
+        for v in range(100):
+            a.add(v)
+        b = QuantileSketch()
+        count, head, buf = a.raw_state()
+        b.load_raw_state(count, head, buf.tobytes())
+        assert [b.quantile(q) for q in b.quantiles] == [a.quantile(q) for q in a.quantiles]
+        assert len(buf) == 30
+
+
+class TestServerDNA:
+    def test_normal_until_min_samples(self):
+        dna = ServerDNA()
+        for _ in range(5):
+            dna.update("cpu", 30, hour=3)
+        mv = dna.evaluate("cpu", 99, hour=3)
+        assert mv.verdict == "normal"
+        assert mv.baseline == 99
+
+    def test_verdicts_match_reference(self):
+        rng = random.Random(42)
+        dna = ServerDNA()
+        history = []
+        for i in range(1500):
+            value = rng.lognormvariate(5, 1) if i % 7 else rng.uniform(0, 5000)
+            dna.update("pps", value, hour=12)
+            history.append(value)
+            if i >= 10 and i % 25 == 0:
+                probe = rng.uniform(0, 3000)
+                mv = dna.evaluate("pps", probe, hour=12)
+                baseline, deviation, verdict = _reference_verdict(history[-500:], probe)
+                assert mv.verdict == verdict
+                assert mv.baseline == baseline
+                assert math.isclose(mv.deviation, deviation, abs_tol=0.011)
+
+    def test_anomaly_detected(self):
+        dna = ServerDNA()
+        for v in [30, 31, 29, 30, 32, 28, 30, 31, 29, 30]:
+            dna.update("cpu", v, hour=1)
+        assert dna.evaluate("cpu", 90, hour=1).verdict == "anomaly"
+        assert dna.evaluate("cpu", 30, hour=1).verdict == "normal"
+
+    def test_summary(self):
+        dna = ServerDNA()
+        assert "Недостаточно" in dna.get_summary(hour=5)
+        for v in range(10):
+            dna.update("ram", 50 + v, hour=5)
+        assert "ram" in dna.get_summary(hour=5)
+        assert dna.has_enough_data
+
+    def test_persistence_roundtrip(self):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            dna = ServerDNA(persist_path=path)
+            for v in range(20):
+                dna.update("jitter", v, hour=7)
+            dna.save()
+
+            loaded = ServerDNA(persist_path=path)
+            a = dna.evaluate("jitter", 15, hour=7)
+            b = loaded.evaluate("jitter", 15, hour=7)
+            assert (a.baseline, a.deviation, a.verdict) == (b.baseline, b.deviation, b.verdict)
+        finally:
+            os.unlink(path)
+
+    def test_binary_saves_only_dirty_slots(self, tmp_path):
+        tmp = str(tmp_path)
+        path = os.path.join(tmp, "server_dna.bin")
+        dna = ServerDNA(persist_path=path)
+        for v in range(20):
+            dna.update("cpu", v, hour=1)
+            dna.update("ram", 40 + v, hour=2)
+        dna.save()
+        size = os.path.getsize(path)
+
+        dna.update("ram", 99, hour=2)
+        with patch("core.edp.server_dna.dna_store.write_full") as full:
+            dna.save()
+        full.assert_not_called()
+        assert os.path.getsize(path) == size
+        assert not os.path.exists(path + ".tmp")
+
+        loaded = ServerDNA(persist_path=path)
+        assert loaded._data["ram"][2].values() == dna._data["ram"][2].values()
+        assert loaded._data["cpu"][1].values() == dna._data["cpu"][1].values()
+
+    def test_corrupted_slot_is_reset(self, tmp_path):
+        tmp = str(tmp_path)
+        path = os.path.join(tmp, "server_dna.bin")
+        dna = ServerDNA(persist_path=path)
+        for v in range(20):
+            dna.update("cpu", v, hour=0)
+            dna.update("cpu", v, hour=5)
+        dna.save()
+
+        # Портим payload слота 0 — остальные слоты должны загрузиться
+        with open(path, "r+b") as f:
+            f.seek(64)
+            f.write(b"\xff" * 16)
+        loaded = ServerDNA(persist_path=path)
+        assert loaded._data["cpu"][0].count == 0
+        assert loaded._data["cpu"][5].count == 20
+
+    def test_legacy_json_migration(self, tmp_path):
+        tmp = str(tmp_path)
+        legacy = os.path.join(tmp, "server_dna.json")
+        path = os.path.join(tmp, "server_dna.bin")
+        slots = [[] for _ in range(24)]
+        slots[9] = [float(v) for v in range(30)]
+        with open(legacy, "w", encoding="utf-8") as f:
+            json.dump({"pps": slots}, f)
+
+        dna = ServerDNA(persist_path=path, legacy_path=legacy)
+        assert dna._data["pps"][9].count == 30
+        dna.save()
+        assert dna_store.is_dna_file(path)
+        assert ServerDNA(persist_path=path)._data["pps"][9].values() == slots[9]
+
+    def test_weekday_granularity_separates_weekends(self):
+        dna = ServerDNA(granularity="weekday_hour")
+        monday = datetime(2026, 10, 12, 14, 0)
+        sunday = monday + timedelta(days=6)
+        for v in [10, 11, 9, 10, 12, 8, 10, 11, 9, 10]:
+            dna.update("cpu", v, when=monday)
+            dna.update("cpu", v * 8, when=sunday)
+        assert dna.evaluate("cpu", 80, when=monday).verdict == "anomaly"
+        assert dna.evaluate("cpu", 80, when=sunday).verdict == "normal"
+        assert "вс 14:00" in dna.get_summary(when=sunday)
+
+    def test_quarter_hour_slots(self):
+        dna = ServerDNA(granularity="quarter_hour")
+        t = datetime(2026, 10, 12, 3, 0)
+        for v in range(10):
+            dna.update("ram", 50 + v, when=t)
+        assert dna.evaluate("ram", 99, when=t).verdict == "anomaly"
+        assert dna.evaluate("ram", 99, when=t.replace(minute=20)).verdict == "normal"
+        assert "3:00" in dna.get_summary(when=t)
+
+    def test_ewma_persistence_and_layout_change(self, tmp_path):
+        path = str(tmp_path / "server_dna.bin")
+        dna = ServerDNA(persist_path=path, decay="ewma", halflife=50)
+        for v in range(40):
+            dna.update("cpu", v, hour=4)
+        dna.save()
+
+        loaded = ServerDNA(persist_path=path, decay="ewma", halflife=50)
+        a, b = dna._data["cpu"][4], loaded._data["cpu"][4]
+        assert (a.count, a.mean, a.variance) == (b.count, b.mean, b.variance)
+
+        # Другая гранулярность — несовместимый профиль, начинаем заново
+        fresh = ServerDNA(persist_path=path, granularity="weekday_hour", decay="ewma")
+        assert fresh._data == {}
+
+    def test_quantile_bands_for_heavy_tailed_metric(self, tmp_path):
+        rng = random.Random(3)
+        path = str(tmp_path / "server_dna.bin")
+        dna = ServerDNA(persist_path=path, quantile_metrics=("pps",))
+        for _ in range(2000):
+            dna.update("pps", rng.lognormvariate(5, 1), hour=8)
+            dna.update("cpu", rng.gauss(30, 2), hour=8)
+
+        # Редкий, но типичный для хвоста всплеск — не аномалия; далеко за p99 — аномалия
+        p95 = dna._data["pps"][8].quantile(0.95)
+        assert dna.evaluate("pps", p95 * 0.9, hour=8).verdict == "normal"
+        assert dna.evaluate("pps", p95 * 10, hour=8).verdict == "anomaly"
+        assert "p95=" in dna.get_summary(hour=8)
+
+        # Резкое падение тоже видно: ниже p5 — elevated, ниже p1 — anomaly
+        p1, p5 = (dna._data["pps"][8].quantile(q) for q in (0.01, 0.05))
+        between = dna.evaluate("pps", (p1 + p5) / 2, hour=8)
+        assert between.verdict == "elevated" and -2.0 < between.deviation < -1.0
+        drop = dna.evaluate("pps", p1 / 10, hour=8)
+        assert drop.verdict == "anomaly" and drop.deviation < -2.0
+        dna.save()
+
+        loaded = ServerDNA(persist_path=path, quantile_metrics=("pps",))
+        assert loaded.evaluate("pps", p95 * 10, hour=8) == dna.evaluate("pps", p95 * 10, hour=8)
+        assert isinstance(loaded._data["cpu"][8], RollingWindow)
+
+        # Метрику перевели обратно на σ — её профиль сбрасывается, остальные живы
+        reverted = ServerDNA(persist_path=path)
+        assert reverted._data["pps"][8].count == 0
+        assert reverted._data["cpu"][8].count == 500
@@ -0,0 +1,61 @@
+"""
+Тесты чтения локальной monitor_stats.db без pandas.
+"""
+
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from core.local_stats import read_local_stats
+
+
+@pytest.fixture
+def db_path():
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    yield path
+    os.remove(path)
+
+
+def _create_system(conn, rows):
+    conn.execute("CREATE TABLE system_stats (timestamp DATETIME, cpu REAL, ram REAL)")
+    conn.executemany("INSERT INTO system_stats VALUES (?, ?, ?)", rows)
+
+
+def test_reads_latest_system_and_user_totals(db_path):
+    conn = sqlite3.connect(db_path)
+    _create_system(conn, [("2026-01-01 00:00:00", 5.0, 100.0), ("2026-01-01 00:00:05", 10.0, 512.0)])
+    conn.execute("CREATE TABLE user_totals (email TEXT PRIMARY KEY, down INTEGER, up INTEGER)")
+    conn.executemany("INSERT INTO user_totals VALUES (?, ?, ?)", [
+        ("small@test.com", 1048576, 0),
+        ("big@test.com", 10 * 1048576, 5 * 1048576 + 524288),
+    ])
+    conn.commit()
+    conn.close()
+
+    (cpu, ram), users = read_local_stats(db_path)
+    assert (cpu, ram) == (10.0, 512.0)
+    assert users == [("big@test.com", 10.0, 5.5), ("small@test.com", 1.0, 0.0)]
+
+
+def test_falls_back_to_legacy_user_stats(db_path):
+    conn = sqlite3.connect(db_path)
+    _create_system(conn, [])
+    conn.execute("CREATE TABLE user_stats (timestamp DATETIME, email TEXT, down INTEGER, up INTEGER)")
+    conn.executemany("INSERT INTO user_stats VALUES (NULL, ?, ?, ?)", [
+        ("a@test.com", 1048576, 0),
+        ("a@test.com", 2 * 1048576, 1048576),
+    ])
+    conn.commit()
+    conn.close()
+
+    (cpu, ram), users = read_local_stats(db_path)
+    assert (cpu, ram) == (0.0, 0.0)
+    assert users == [("a@test.com", 2.0, 1.0)]
+
+
+def test_missing_tables_raise_operational_error(db_path):
+    with pytest.raises(sqlite3.OperationalError):
+        read_local_stats(db_path)
@@ -1,6 +1,5 @@
 import pytest
 from unittest.mock import MagicMock, patch
-import pandas as pd
 from src.main_qml import DataBridge
 
 @pytest.fixture
@@ -87,22 +86,19 @@ def test_databridge_run_interactive(MockAnalyzer, mock_qtimer, mock_cfg, mock_vm
     mock_vm.update_interactive_ready.assert_called_with("ERROR: fail error")
 
 @patch("src.main_qml.QTimer")
-@patch("src.main_qml.sqlite3.connect")
-@patch("src.main_qml.pd.read_sql")
+@patch("src.main_qml.read_local_stats")
 @patch("src.main_qml.SecurityEngine.calculate_pps", return_value=100)
 @patch("src.main_qml.SecurityEngine.calculate_jitter", return_value=5.0)
 @patch("src.main_qml.SecurityEngine.parse_probes", return_value=["1.1.1.1"])
 def test_databridge_on_data_ready_success(
     mock_parse_probes, mock_jitter, mock_pps,
-    mock_read_sql, mock_connect, mock_qtimer, mock_cfg, mock_vm, mock_ssh
+    mock_read_stats, mock_qtimer, mock_cfg, mock_vm, mock_ssh
 ):
     bridge = DataBridge(mock_cfg, mock_vm, mock_ssh)
     bridge.last_raw_packets = "100" # to trigger pps calc
     
     # Mocking DB data
-    df_sys = pd.DataFrame([{"cpu": 10.0, "ram": 512.0}])
-    df_users = pd.DataFrame([{"email": "test@test.com", "d": 10.0, "u": 5.0}])
-    mock_read_sql.side_effect = [df_sys, df_users]
+    mock_read_stats.return_value = ((10.0, 512.0), [("test@test.com", 10.0, 5.0)])
     
     bridge.on_data_ready(
         True, "success", {"os_version": "linux"},
@@ -136,3 +132,35 @@ def test_databridge_on_data_ready_success(
     
     # check that EAII was run automatically since _first_run was True
     assert not bridge._first_run
+
+@patch("src.main_qml.QTimer")
+@patch("src.main_qml.MetricsStream")
+@patch("src.main_qml.DataLoader")
+def test_databridge_stream_mode(MockLoader, MockStream, mock_qtimer, mock_vm, mock_ssh):
+    cfg = MagicMock()
+    cfg.get.side_effect = lambda k, d=None: {
+        "telemetry_mode": "stream", "stream_interval_ms": 500,
+        "sync_interval_ms": 10000, "eaii_enabled": False,
+    }.get(k, d)
+    MockLoader.return_value.isRunning.return_value = False
+    bridge = DataBridge(cfg, mock_vm, mock_ssh)
+    bridge.start()
+    
+    MockStream.assert_called_once_with(mock_ssh, 500)
+    MockStream.return_value.start.assert_called_once()
+    # Loader в stream-режиме грузит только БД/discovery
+    assert MockLoader.call_args[1]["skip_metrics"] is True
+    
+    bridge._users_list = [{"user": "a"}, {"user": "b"}]
+    bridge.on_stream_frame({"t": 100.0, "system": {"cpu": 12.5, "ram": 40.0},
+                            "security": {"raw_packets": "1000", "latencies": [1, 3], "ssh_probes": []}})
+    bridge.on_stream_frame({"t": 100.5, "system": {"cpu": 13.0, "ram": 41.0},
+                            "security": {"raw_packets": "2000", "latencies": [1, 3], "ssh_probes": []}})
+    
+    call_args = mock_vm.update_metrics.call_args[0]
+    assert call_args[0] == 13.0
+    assert call_args[2] == 2000.0  # 1000 пакетов за 0.5 с
+    assert bridge.last_metrics["users_count"] == 2
+    
+    bridge.stop()
+    MockStream.return_value.stop.assert_called_once()
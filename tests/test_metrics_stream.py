@@ -0,0 +1,73 @@
+"""
+Тесты push-телеметрии: NDJSON-декодер, поток MetricsStream и сам агент.
+"""
+
+import json
+import socket
+import subprocess
+
+from unittest.mock import MagicMock
+
+from core.metrics_stream import AGENT_SCRIPT, FrameDecoder, MetricsStream
+
+
+def test_decoder_handles_split_frames():
+    decoder = FrameDecoder()
+    payload = json.dumps({"t": 1, "system": {"cpu": 10}}).encode() + b"\n"
+    assert decoder.feed(payload[:7]) == []
+    frames = decoder.feed(payload[7:] + payload)
+    assert [f["t"] for f in frames] == [1, 1]
+
+
+def test_decoder_skips_garbage():
+    decoder = FrameDecoder()
+    frames = decoder.feed(b"python3: warning\n{\"t\": 2}\n\n")
+    assert frames == [{"t": 2}]
+
+
+def test_decoder_drops_oversized_partial():
+    decoder = FrameDecoder(max_line=16)
+    assert decoder.feed(b"x" * 32) == []
+    assert decoder.feed(b"{\"t\": 3}\n") == []  # Хвост битого фрейма отброшен целиком
+    assert decoder.feed(b"{\"t\": 4}\n") == [{"t": 4}]
+
+
+def test_stream_emits_frames_until_eof():
+    channel = MagicMock()
+    chunks = [b'{"t": 1}\n{"t"', socket.timeout(), b': 2}\n', b""]
+    channel.recv.side_effect = chunks
+    ssh = MagicMock()
+    ssh.connect.return_value = True
+    ssh.open_stream.return_value = channel
+
+    stream = MetricsStream(ssh, interval_ms=500)
+    stream.frame_ready = MagicMock()
+    try:
+        stream._consume()
+    except ConnectionError:
+        pass
+
+    assert [c[0][0]["t"] for c in stream.frame_ready.emit.call_args_list] == [1, 2]
+    assert "python3" in ssh.open_stream.call_args[0][0]
+
+
+def test_stream_stop_closes_channel():
+    stream = MetricsStream(MagicMock())
+    channel = MagicMock()
+    stream._channel = channel
+    stream.stop()
+    channel.close.assert_called_once()
+    assert not stream._running
+
+
+def test_agent_script_emits_frames():
+    proc = subprocess.Popen(["python3", "-u", "-c", AGENT_SCRIPT, "0.2"],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        frame = json.loads(proc.stdout.readline())
+    finally:
+        proc.kill()
+        proc.wait()
+    assert 0 <= frame["system"]["cpu"] <= 100
+    assert 0 < frame["system"]["ram"] <= 100
+    assert "raw_packets" in frame["security"]
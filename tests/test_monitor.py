@@ -0,0 +1,286 @@
+"""
+Тесты серверного коллектора scripts/server/monitor.py.
+"""
+
+import json
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("psutil")
+
+from scripts.server import monitor
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    monkeypatch.setattr(monitor, "DB_NAME", path)
+    created = []
+
+    def make(reset=False):
+        c = monitor.Collector()
+        c.xray.reset = reset
+        created.append(c)
+        return c
+
+    yield make
+    for c in created:
+        c.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class TestUserAccounting:
+    def test_counter_delta(self):
+        assert monitor.counter_delta(150, 100) == 50
+        assert monitor.counter_delta(100, 100) == 0
+        # Счётчик уменьшился — Xray перезапущен, всё текущее значение новое
+        assert monitor.counter_delta(30, 100) == 30
+
+    def test_cumulative_mode(self, collector):
+        c = collector()
+        upserts, deltas = c.user_rows({"a@x": (100, 10)})
+        assert upserts == [("a@x", 100, 10, 100, 10)]
+        assert deltas == [("a@x", 100, 10)]
+        c.counters["a@x"] = (100, 10)
+
+        upserts, deltas = c.user_rows({"a@x": (250, 10)})
+        assert upserts == [("a@x", 150, 0, 250, 10)]
+        assert deltas == [("a@x", 150, 0)]
+
+    def test_cumulative_skips_unchanged_users(self, collector):
+        c = collector()
+        c.counters = {"a@x": (100, 10), "b@x": (5, 5)}
+        upserts, deltas = c.user_rows({"a@x": (100, 10), "b@x": (7, 5)})
+        assert upserts == [("b@x", 2, 0, 7, 5)]
+        assert deltas == [("b@x", 2, 0)]
+
+    def test_cumulative_after_xray_restart(self, collector):
+        c = collector()
+        c.counters = {"a@x": (1000, 500)}
+        upserts, deltas = c.user_rows({"a@x": (40, 600)})
+        # down сброшен рестартом (40 — новый трафик), up вырос на 100
+        assert upserts == [("a@x", 40, 100, 40, 600)]
+        assert deltas == [("a@x", 40, 100)]
+
+    def test_reset_mode(self, collector):
+        c = collector(reset=True)
+        c.counters = {"a@x": (1000, 500)}
+        upserts, deltas = c.user_rows({"a@x": (30, 3), "b@x": (0, 0), "c@x": (7, 0)})
+        # Значения уже дельты; last_* сохраняются как были
+        assert upserts == [
+            ("a@x", 30, 3, 1000, 500),
+            ("b@x", 0, 0, 0, 0),
+            ("c@x", 7, 0, 0, 0),
+        ]
+        assert deltas == [("a@x", 30, 3), ("c@x", 7, 0)]
+
+        # Известный пользователь без трафика не пишется
+        c.counters.update({"b@x": (0, 0), "c@x": (0, 0)})
+        assert c.user_rows({"a@x": (0, 0), "b@x": (0, 0)}) == ([], [])
+
+    def test_totals_accumulate_and_survive_restart(self, collector):
+        c = collector()
+        for counters in ({"a@x": (100, 10)}, {"a@x": (300, 20)}, {"a@x": (50, 25)}):
+            upserts, _ = c.user_rows(counters)
+            with c.conn:
+                c.conn.executemany(monitor.SQL_UPSERT_TOTALS, upserts)
+            c.counters.update((row[0], (row[3], row[4])) for row in upserts)
+        c.close()
+
+        restarted = collector()
+        # Последние сырые счётчики восстановлены из user_totals
+        assert restarted.counters == {"a@x": (50, 25)}
+        assert restarted.user_rows({"a@x": (50, 25)}) == ([], [])
+        total = restarted.conn.execute("SELECT down, up FROM user_totals WHERE email = 'a@x'").fetchone()
+        assert total == (100 + 200 + 50, 10 + 10 + 5)
+
+    def test_history_is_off_by_default_and_capped(self, collector, monkeypatch):
+        assert monitor.USER_HISTORY is False
+        c = collector()
+        with c.conn:
+            c.conn.executemany(monitor.SQL_INSERT_DELTA, [("a@x", i, 0) for i in range(10)])
+        monkeypatch.setattr(monitor, "USER_HISTORY_MAX_ROWS", 3)
+        c.retention()
+        rows = c.conn.execute("SELECT down FROM user_deltas ORDER BY rowid").fetchall()
+        assert rows == [(7,), (8,), (9,)]
+
+
+def _local(*args):
+    """Unix time для локального времени (бакеты считаются в localtime)."""
+    return time.mktime(time.struct_time(args + (0, 0, -1)))
+
+
+class TestRollups:
+    def test_add_folds_min_max_avg_and_rolls_over(self):
+        rollup = monitor.Rollup("system_rollup_1m", monitor.ROLLUP_TIERS["system_rollup_1m"][0])
+        t0 = _local(2026, 5, 1, 12, 0, 10)
+        rollup.add(t0, (10.0, 50.0, 100.0, 10.0))
+        row = rollup.add(t0 + 30, (30.0, 40.0, 300.0, 30.0))
+        assert row == ["2026-05-01 12:00:00", 2,
+                       10.0, 30.0, 20.0, 40.0, 50.0, 45.0,
+                       100.0, 300.0, 200.0, 10.0, 30.0, 20.0]
+
+        # Переход через границу минуты открывает новый бакет
+        row = rollup.add(t0 + 55, (5.0, 60.0, 0.0, 0.0))
+        assert row[:2] == ["2026-05-01 12:01:00", 1]
+        assert row[2:5] == [5.0, 5.0, 5.0]
+
+    def test_resume_continues_partial_bucket(self, collector):
+        c = collector()
+        table = "system_rollup_1h"
+        t0 = _local(2026, 5, 1, 12, 10, 0)
+        first = monitor.Rollup(table, monitor.ROLLUP_TIERS[table][0])
+        for i, cpu in enumerate((10.0, 20.0, 60.0)):
+            row = first.add(t0 + i * 30, (cpu, 50.0, 0.0, 0.0))
+        with c.conn:
+            c.conn.execute(first.sql_upsert, row)
+
+        resumed = monitor.Rollup(table, monitor.ROLLUP_TIERS[table][0])
+        resumed.resume(c.conn, t0 + 600)
+        row = resumed.add(t0 + 630, (30.0, 50.0, 0.0, 0.0))
+        # Сумма восстановлена из avg × samples: (10 + 20 + 60 + 30) / 4
+        assert row[:5] == ["2026-05-01 12:00:00", 4, 10.0, 60.0, 30.0]
+
+        # Другой бакет на диске не подхватывается
+        other = monitor.Rollup(table, monitor.ROLLUP_TIERS[table][0])
+        other.resume(c.conn, t0 + 3600)
+        assert other.bucket is None
+
+    def test_rollup_rows_primes_then_derives_net_rates(self, collector):
+        c = collector()
+        t0 = _local(2026, 5, 1, 12, 0, 0)
+        assert c.rollup_rows(t0, 10.0, 50.0, SimpleNamespace(bytes_recv=1000, bytes_sent=500)) == []
+
+        rows = c.rollup_rows(t0 + 10, 20.0, 50.0, SimpleNamespace(bytes_recv=6000, bytes_sent=700))
+        assert [rollup.table for rollup, _ in rows] == list(monitor.ROLLUP_TIERS)
+        _, row = rows[0]
+        assert row[1] == 1
+        # net_down = 5000 B / 10 с, net_up = 200 B / 10 с
+        assert row[2 + 3 * 2:2 + 3 * 4] == [500.0, 500.0, 500.0, 20.0, 20.0, 20.0]
+
+        # Счётчик сетевого интерфейса сбросился — скорость 0, не отрицательная
+        _, row = c.rollup_rows(t0 + 20, 20.0, 50.0, SimpleNamespace(bytes_recv=100, bytes_sent=800))[0]
+        assert row[2 + 3 * 2] == 0.0
+
+        # Время не сдвинулось — пропуск без деления на ноль
+        assert c.rollup_rows(t0 + 20, 20.0, 50.0, SimpleNamespace(bytes_recv=200, bytes_sent=900)) == []
+
+
+class TestXrayStatsCodec:
+    def test_varint(self):
+        assert monitor._varint(0) == b"\x00"
+        assert monitor._varint(300) == b"\xac\x02"
+        for value in (0, 1, 127, 128, 300, 2 ** 35, 2 ** 63 - 1):
+            encoded = monitor._varint(value)
+            assert monitor._read_varint(encoded + b"\xff", 0) == (value, len(encoded))
+
+    def test_encode_request(self):
+        assert monitor.encode_query_stats("user>>>", False) == b"\x0a\x07user>>>"
+        assert monitor.encode_query_stats("user>>>", True) == b"\x0a\x07user>>>\x10\x01"
+        assert monitor.encode_query_stats("", False) == b"\x0a\x00"
+
+    def test_decode_response(self):
+        response = (
+            b"\x0a\x06" + b"\x0a\x01a" + b"\x10\xac\x02"                 # a = 300
+            + b"\x0a\x03" + b"\x0a\x01b"                                # b: value опущен (0)
+            + b"\x0a\x0a" + b"\x0a\x01c" + b"\x10\x80\x80\x80\x80\x80\x01"  # c = 2**35
+        )
+        assert monitor.decode_query_stats(response) == [("a", 300), ("b", 0), ("c", 2 ** 35)]
+        assert monitor.decode_query_stats(b"") == []
+
+    def test_decode_skips_unknown_fields(self):
+        stat = b"\x1a\x02\xff\xff" + b"\x0a\x01a" + b"\x25" + b"\x00" * 4 + b"\x10\x07"
+        response = (
+            b"\x10\x05"                            # поле 2, varint
+            + b"\x19" + b"\x01" * 8                 # поле 3, fixed64
+            + b"\x0a" + bytes([len(stat)]) + stat
+            + b"\x25" + b"\x02" * 4                 # поле 4, fixed32
+        )
+        assert monitor.decode_query_stats(response) == [("a", 7)]
+
+    def test_unsupported_wire_type(self):
+        with pytest.raises(ValueError):
+            monitor.decode_query_stats(b"\x0b")     # поле 1, start group
+
+
+class TestXrayStatsQuery:
+    CLI_OUTPUT = json.dumps({"stat": [
+        {"name": "user>>>a@x>>>traffic>>>downlink", "value": 10},
+        {"name": "user>>>a@x>>>traffic>>>uplink"},
+    ]}).encode()
+
+    def _fake_cli(self, monkeypatch):
+        calls = []
+
+        def check_output(cmd, **kwargs):
+            calls.append(cmd)
+            return self.CLI_OUTPUT
+
+        monkeypatch.setattr(monitor.subprocess, "check_output", check_output)
+        return calls
+
+    def test_cli_without_grpcio(self, monkeypatch):
+        monkeypatch.setattr(monitor, "grpc", None)
+        calls = self._fake_cli(monkeypatch)
+        xray = monitor.XrayStats(server="127.0.0.1:1", reset=True)
+        stats = xray.query()
+        assert stats == [("user>>>a@x>>>traffic>>>downlink", 10), ("user>>>a@x>>>traffic>>>uplink", 0)]
+        assert calls == [[monitor.XRAY_PATH, "api", "statsquery", "--server=127.0.0.1:1",
+                          "-pattern", "user>>>", "-reset"]]
+        assert monitor.parse_user_stats(stats) == {"a@x": [10, 0]}
+
+    def test_cli_fallback_on_rpc_error(self, monkeypatch):
+        grpc = pytest.importorskip("grpc")
+        calls = self._fake_cli(monkeypatch)
+        xray = monitor.XrayStats(server="127.0.0.1:1")
+
+        def unavailable(request, timeout=None):
+            class Unavailable(grpc.RpcError):
+                def code(self):
+                    return grpc.StatusCode.UNAVAILABLE
+            raise Unavailable()
+
+        xray._query = unavailable
+        assert xray.query() == [("user>>>a@x>>>traffic>>>downlink", 10), ("user>>>a@x>>>traffic>>>uplink", 0)]
+        assert calls[0][-2:] == ["-pattern", "user>>>"]
+
+    def test_grpc_round_trip(self, monkeypatch):
+        grpc = pytest.importorskip("grpc")
+        from concurrent import futures
+
+        requests = []
+
+        def query_stats(request, context):
+            requests.append(request)
+            return b"\x0a\x06\x0a\x01a\x10\xac\x02"
+
+        handler = grpc.method_handlers_generic_handler("xray.app.stats.command.StatsService", {
+            "QueryStats": grpc.unary_unary_rpc_method_handler(query_stats),
+        })
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=1))
+        server.add_generic_rpc_handlers((handler,))
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        try:
+            monkeypatch.setattr(monitor.subprocess, "check_output", None)
+            xray = monitor.XrayStats(server=f"127.0.0.1:{port}", reset=True)
+            assert xray.query() == [("a", 300)]
+            assert requests == [b"\x0a\x07user>>>\x10\x01"]
+        finally:
+            server.stop(None)
+
+    def test_cli_failure_returns_none(self, monkeypatch):
+        monkeypatch.setattr(monitor, "grpc", None)
+
+        def fail(cmd, **kwargs):
+            raise FileNotFoundError(cmd[0])
+
+        monkeypatch.setattr(monitor.subprocess, "check_output", fail)
+        assert monitor.XrayStats().query() is None
@@ -1,6 +1,6 @@
 import pytest
 from unittest.mock import MagicMock, patch
-from core.ssh_manager import SSHConnectionManager
+from core.ssh_manager import SSHConnectionManager, transports
 import socket
 
 @pytest.fixture
@@ -177,3 +177,79 @@ def test_ssh_close(mock_cfg):
     assert manager._client is None
     assert manager._sftp is None
     assert not manager.is_connected()
+
+def test_ssh_exec_command_uses_scheduler(mock_cfg):
+    manager = SSHConnectionManager(mock_cfg, priority="sandbox")
+    manager.connect = MagicMock(return_value=True)
+    manager._client = MagicMock()
+    manager.scheduler = MagicMock()
+    manager.scheduler.slot.return_value.__enter__.return_value = True
+    
+    mock_stdout = MagicMock()
+    mock_stdout.read.return_value = b"ok"
+    mock_stderr = MagicMock()
+    mock_stderr.read.return_value = b""
+    manager._client.exec_command.return_value = (None, mock_stdout, mock_stderr)
+    
+    assert manager.exec_command("ls") == (True, "ok")
+    manager.scheduler.slot.assert_called_with("sandbox", timeout=10)
+    manager.exec_command("ls", priority="ai")
+    manager.scheduler.slot.assert_called_with("ai", timeout=10)
+
+def test_ssh_exec_command_scheduler_timeout(mock_cfg):
+    manager = SSHConnectionManager(mock_cfg)
+    manager.connect = MagicMock(return_value=True)
+    manager._client = MagicMock()
+    manager.scheduler = MagicMock()
+    manager.scheduler.slot.return_value.__enter__.return_value = False
+    
+    success, output = manager.exec_command("ls", timeout=1)
+    assert success is False
+    assert "timed out" in output
+    manager._client.exec_command.assert_not_called()
+
+@patch("core.ssh_manager.paramiko.SSHClient")
+@patch("core.ssh_manager.os.path.exists")
+def test_ssh_managers_share_transport(mock_exists, MockSSHClient, mock_cfg):
+    mock_exists.return_value = True
+    sync = SSHConnectionManager(mock_cfg)
+    sandbox = SSHConnectionManager(mock_cfg, priority="sandbox", max_concurrency=2)
+    
+    assert sync.connect() and sandbox.connect()
+    # Один handshake на оба потребителя, общий scheduler
+    MockSSHClient.assert_called_once()
+    assert sync._client is sandbox._client
+    assert sync.scheduler is sandbox.scheduler
+    
+    client = MockSSHClient.return_value
+    sandbox.close()
+    client.close.assert_not_called()
+    assert sync.is_connected()
+    sync.close()
+    client.close.assert_called_once()
+    assert len(transports) == 0
+
+@patch("core.ssh_manager.paramiko.SSHClient")
+@patch("core.ssh_manager.os.path.exists")
+def test_ssh_transport_per_user(mock_exists, MockSSHClient, mock_cfg):
+    mock_exists.return_value = True
+    other_cfg = MagicMock()
+    other_cfg.get.side_effect = lambda k: "admin" if k == "user" else mock_cfg.get(k)
+    
+    a = SSHConnectionManager(mock_cfg)
+    b = SSHConnectionManager(other_cfg)
+    assert a.connect() and b.connect()
+    assert MockSSHClient.call_count == 2
+    a.close()
+    b.close()
+
+def test_ssh_consumer_concurrency_limit(mock_cfg):
+    manager = SSHConnectionManager(mock_cfg, max_concurrency=1)
+    manager.connect = MagicMock(return_value=True)
+    manager._client = MagicMock()
+    
+    manager._consumer_slots.acquire()  # Слот уже занят другой командой
+    success, output = manager.exec_command("ls", timeout=0.05)
+    assert success is False
+    assert "timed out" in output
+    manager._client.exec_command.assert_not_called()
@@ -0,0 +1,67 @@
+"""
+Тесты SSH Command Scheduler — token bucket, max-in-flight, приоритеты.
+"""
+
+import threading
+import time
+
+from core.ssh_scheduler import CommandScheduler
+
+
+def test_idle_commands_run_immediately():
+    sched = CommandScheduler(rate=1, burst=5, max_in_flight=5)
+    start = time.monotonic()
+    for _ in range(5):
+        assert sched.acquire()
+        sched.release()
+    assert time.monotonic() - start < 0.1
+
+
+def test_burst_is_rate_shaped():
+    sched = CommandScheduler(rate=50, burst=2, max_in_flight=10)
+    start = time.monotonic()
+    for _ in range(7):
+        assert sched.acquire()
+        sched.release()
+    # 2 из bucket + 5 по 20 мс
+    assert time.monotonic() - start >= 0.09
+
+
+def test_max_in_flight_limit():
+    sched = CommandScheduler(rate=1000, burst=100, max_in_flight=2)
+    assert sched.acquire()
+    assert sched.acquire()
+    assert not sched.acquire(timeout=0.05)
+    sched.release()
+    assert sched.acquire(timeout=0.05)
+    assert sched.in_flight == 2
+
+
+def test_priority_order():
+    sched = CommandScheduler(rate=1000, burst=100, max_in_flight=1)
+    assert sched.acquire()
+    order = []
+
+    def worker(priority):
+        with sched.slot(priority) as ok:
+            if ok:
+                order.append(priority)
+
+    threads = [threading.Thread(target=worker, args=(p,)) for p in ("ai", "sandbox", "sync")]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)  # Все трое встают в очередь до release
+    sched.release()
+    for t in threads:
+        t.join(timeout=2)
+
+    assert order == ["sync", "sandbox", "ai"]
+
+
+def test_timeout_removes_waiter():
+    sched = CommandScheduler(rate=1000, burst=100, max_in_flight=1)
+    assert sched.acquire()
+    assert not sched.acquire("ai", timeout=0.02)
+    sched.release()
+    # Очередь не заблокирована ушедшим по таймауту
+    assert sched.acquire("sync", timeout=0.05)